@@ -18,6 +18,11 @@ const char* mqtt_topic_light4 = "home/light/light_4";
 
 const char* energy_topic = "home/light/energy";
 const char* motion_topic = "home/light/motion";  // NEW: Motion status topic
+const char* motion_enable_topic = "home/light/motion_enable";    // "ON" / "OFF"
+const char* motion_timeout_topic = "home/light/motion_timeout";  // seconds
+const char* energy_hr_topic = "home/light/energy_hr";  // Binary high-res batches
+const char* highres_topic = "home/light/highres";      // "ON" / "OFF"
+const char* energy_log_topic = "home/light/energy_log"; // Binary catch-up batches
 
 // ================= PINS =================
 const int light1Pin = 2;
@@ -39,11 +44,117 @@ const int MOTION_PIN = 5;  // PIR sensor
 bool timerDisabledToday[4] = {false, false, false, false};
 int lastDayOfYear = -1;
 
-// MOTION SENSOR: Simple - motion → ON for 5 minutes (no time restrictions)
+// MOTION SENSOR: motion → ON until the room has been quiet for the timeout.
+// The timeout is occupancy-based: half of the time the room has been
+// continuously occupied, never below motionDuration or above MOTION_MAX_DURATION.
 bool motionEnabled = true;           // Enable/disable from UI
 bool motionActive = false;            // Currently in motion-triggered state
+bool lastMotionState = false;         // PIR level on the previous check
 unsigned long motionTimeout = 0;      // When motion timeout ends
-const unsigned long MOTION_DURATION = 300000;  // 5 minutes in milliseconds
+unsigned long motionStarted = 0;      // When the current occupancy began
+unsigned long motionDuration = 300000;  // Base timeout (ms), set over MQTT
+const unsigned long MOTION_MAX_DURATION = 1800000;  // 30 minutes
+
+// ═══════════════════════════════════════════════
+// HIGH-RESOLUTION MODE (10 Hz, binary batches)
+// ═══════════════════════════════════════════════
+// Every HR_INTERVAL_MS the sampler's RMS/peak over the last interval is
+// taken. HR_BATCH readings are packed into one binary frame on
+// energy_hr_topic, so 10 Hz data costs one MQTT message per second.
+// All fields are little-endian; currents are in milliamps.
+#define HR_INTERVAL_MS 100
+#define HR_BATCH 10
+#define HR_VERSION 1
+
+struct __attribute__((packed)) HrFrameHeader {
+  char magic[2];        // "EH"
+  uint8_t version;
+  uint8_t count;        // readings that follow
+  uint16_t seq;         // frame counter, wraps
+  uint16_t intervalMs;  // spacing between readings
+  uint32_t t0;          // millis() of the first reading
+};
+
+struct __attribute__((packed)) HrReading {
+  uint16_t rms1;   // L1 RMS current (mA)
+  uint16_t peak1;  // L1 peak |current| (mA)
+  uint16_t rms2;
+  uint16_t peak2;
+};
+
+bool highResMode = false;
+HrReading hrBatch[HR_BATCH];
+uint8_t hrCount = 0;
+uint16_t hrSeq = 0;
+uint32_t hrBatchStart = 0;
+
+// ═══════════════════════════════════════════════
+// BACKGROUND SAMPLING
+// ═══════════════════════════════════════════════
+// A hardware timer fires every SAMPLE_PERIOD_US and wakes a sampler task
+// that reads both ACS712 channels once and folds the readings into the
+// open windows. loop() only collects RMS/peak from a window, so it never
+// busy-waits on the ADC and MQTT commands are handled within milliseconds.
+// The sampler runs above loop() on the same core; WiFi keeps core 0.
+#define SAMPLE_PERIOD_US 200     // 5 kHz per channel: 100 samples per 50 Hz cycle
+#define SAMPLER_PRIORITY 2       // loop() runs at 1
+#define SAMPLER_CORE 1
+#define ACS712_V_PER_A 0.185
+#define NOISE_FLOOR_A 0.03
+
+struct SampleWindow {
+  float sumSq1, sumSq2;   // Sum of squared offset-corrected volts
+  float peak1, peak2;     // Max |offset-corrected volts|
+  uint32_t count;
+};
+
+SampleWindow secondWindow = {};  // 1 Hz JSON
+SampleWindow hrWindow = {};      // 10 Hz high-res readings
+portMUX_TYPE samplerMux = portMUX_INITIALIZER_UNLOCKED;
+TaskHandle_t samplerTaskHandle = NULL;
+hw_timer_t* sampleTimer = NULL;
+
+// ═══════════════════════════════════════════════
+// OFFLINE BUFFER (catch-up after an MQTT outage)
+// ═══════════════════════════════════════════════
+// While the broker is unreachable, each BUF_INTERVAL_S seconds of readings
+// is folded into one record of a RAM ring (oldest overwritten when full).
+// After reconnecting, the ring is replayed oldest first as binary frames on
+// energy_log_topic before live JSON resumes, so the Pi can place the
+// energy in time. Same little-endian conventions as the high-res frames.
+#define BUF_INTERVAL_S 10
+#define BUF_CAPACITY 2880        // 8 hours at 10 s (46 KB)
+#define BUF_FRAME_RECORDS 32     // Records per catch-up frame
+#define BUF_FRAMES_PER_LOOP 4    // Frames sent per loop() while draining
+#define BUF_VERSION 1
+#define MQTT_RETRY_MS 5000
+
+struct __attribute__((packed)) BufFrameHeader {
+  char magic[2];        // "EB"
+  uint8_t version;
+  uint8_t count;        // records that follow
+  uint16_t seq;         // frame counter, wraps
+  uint16_t intervalS;   // seconds covered by each record
+  uint32_t dropped;     // records overwritten since boot (ring was full)
+};
+
+struct __attribute__((packed)) BufRecord {
+  uint32_t time;        // Unix time at the end of the record (0 = clock not set)
+  uint16_t rms1;        // L1 RMS current over the record (mA)
+  uint16_t rms2;
+  uint32_t energy1;     // energy1 counter at the end (1e-5 kWh)
+  uint32_t energy2;
+};
+
+BufRecord bufRing[BUF_CAPACITY];
+uint16_t bufHead = 0;            // Oldest record
+uint16_t bufCount = 0;
+uint32_t bufDropped = 0;
+uint16_t bufSeq = 0;
+// Record being accumulated
+float bufSumSq1 = 0, bufSumSq2 = 0;
+int bufSeconds = 0;
+unsigned long lastMqttAttempt = 0;
 
 // ================= EEPROM =================
 #define EEPROM_SIZE 64
@@ -58,9 +169,10 @@ float voltage_mains = 230.0;
 WiFiClient espClient;
 PubSubClient client(espClient);
 
-// Energy accumulators
-static float energy1 = 0;
-static float energy2 = 0;
+// Energy accumulators (kWh since boot). double: a float stops advancing
+// once the per-second increment falls below its precision (weeks of uptime)
+static double energy1 = 0;
+static double energy2 = 0;
 
 // ================= WIFI =================
 void setupWiFi() {
@@ -88,12 +200,34 @@ void callback(char* topic, byte* payload, unsigned int length) {
   bool manualChange = false;
   int lightIdx = -1;
 
-  if (top == mqtt_topic_light1) {
+  if (top == motion_enable_topic) {
+    motionEnabled = (message == "ON");
+    Serial.printf("🚶 [MOTION] %s\n", motionEnabled ? "Enabled" : "Disabled");
+    return;
+  }
+  else if (top == motion_timeout_topic) {
+    long seconds = message.toInt();
+    if (seconds > 0) {
+      motionDuration = (unsigned long)seconds * 1000UL;
+      Serial.printf("🚶 [MOTION] Timeout set to %ld sec\n", seconds);
+    }
+    return;
+  }
+  else if (top == highres_topic) {
+    highResMode = (message == "ON");
+    hrCount = 0;
+    portENTER_CRITICAL(&samplerMux);
+    hrWindow = SampleWindow();  // Start a fresh interval
+    portEXIT_CRITICAL(&samplerMux);
+    Serial.printf("📈 [HIGH-RES] %s\n", highResMode ? "Enabled" : "Disabled");
+    return;
+  }
+  else if (top == mqtt_topic_light1) {
     // Don't override if motion mode is active
     if (!motionActive) {
       digitalWrite(light1Pin, message == "ON" ? LOW : HIGH);
+      manualChange = true;
     }
-    manualChange = true;
     lightIdx = 0;
   }
   else if (top == mqtt_topic_light2) {
@@ -120,20 +254,28 @@ void callback(char* topic, byte* payload, unsigned int length) {
 }
 
 // ================= MQTT CONNECT =================
-void connectToMQTT() {
-  while (!client.connected()) {
-    if (client.connect("ESP32_SMART_HOME")) {
-      client.subscribe(mqtt_topic_light1);
-      client.subscribe(mqtt_topic_light2);
-      client.subscribe(mqtt_topic_light3);
-      client.subscribe(mqtt_topic_light4);
-      Serial.println("MQTT connected & subscribed");
-    } else {
-      Serial.print("MQTT failed, rc=");
-      Serial.println(client.state());
-      delay(2000);
-    }
+// One attempt at most every MQTT_RETRY_MS; never waits in a loop, so the
+// sensors keep being read (into the offline buffer) while the broker is away
+bool connectToMQTT() {
+  if (client.connected()) return true;
+  if (lastMqttAttempt != 0 && millis() - lastMqttAttempt < MQTT_RETRY_MS) return false;
+  lastMqttAttempt = millis();
+  if (WiFi.status() != WL_CONNECTED) return false;  // The WiFi stack reconnects by itself
+
+  if (client.connect("ESP32_SMART_HOME")) {
+    client.subscribe(mqtt_topic_light1);
+    client.subscribe(mqtt_topic_light2);
+    client.subscribe(mqtt_topic_light3);
+    client.subscribe(mqtt_topic_light4);
+    client.subscribe(motion_enable_topic);
+    client.subscribe(motion_timeout_topic);
+    client.subscribe(highres_topic);
+    Serial.println("MQTT connected & subscribed");
+    return true;
   }
+  Serial.print("MQTT failed, rc=");
+  Serial.println(client.state());
+  return false;
 }
 
 // ================= OFFSET CALIBRATION =================
@@ -158,26 +300,160 @@ void calibrateOffsets() {
 }
 
 // ================= TRUE RMS =================
-float readCurrent(int pin, float offset) {
-  const int samples = 2000;
-  float sum = 0;
-
-  for (int i = 0; i < samples; i++) {
-    float voltage = analogRead(pin) * 3.3 / 4095.0;
-    float centered = voltage - offset;
-    sum += centered * centered;
-    delayMicroseconds(200);
+void addSample(SampleWindow& w, float centered1, float centered2) {
+  w.sumSq1 += centered1 * centered1;
+  w.sumSq2 += centered2 * centered2;
+  if (fabs(centered1) > w.peak1) w.peak1 = fabs(centered1);
+  if (fabs(centered2) > w.peak2) w.peak2 = fabs(centered2);
+  w.count++;
+}
+
+// One reading of both channels into every open window (sampler task)
+void sampleOnce() {
+  float centered1 = analogRead(sensor1Pin) * 3.3 / 4095.0 - offset1;
+  float centered2 = analogRead(sensor2Pin) * 3.3 / 4095.0 - offset2;
+  portENTER_CRITICAL(&samplerMux);
+  addSample(secondWindow, centered1, centered2);
+  addSample(hrWindow, centered1, centered2);
+  portEXIT_CRITICAL(&samplerMux);
+}
+
+void IRAM_ATTR onSampleTimer() {
+  BaseType_t woken = pdFALSE;
+  vTaskNotifyGiveFromISR(samplerTaskHandle, &woken);
+  if (woken) portYIELD_FROM_ISR();
+}
+
+void samplerTask(void* arg) {
+  for (;;) {
+    // Ticks that arrive while sampling are merged, never queued up
+    ulTaskNotifyTake(pdTRUE, portMAX_DELAY);
+    sampleOnce();
   }
+}
+
+void startSampler() {
+  xTaskCreatePinnedToCore(samplerTask, "sampler", 4096, NULL, SAMPLER_PRIORITY,
+                          &samplerTaskHandle, SAMPLER_CORE);
+#if ESP_ARDUINO_VERSION_MAJOR >= 3
+  sampleTimer = timerBegin(1000000);  // 1 MHz tick
+  timerAttachInterrupt(sampleTimer, &onSampleTimer);
+  timerAlarm(sampleTimer, SAMPLE_PERIOD_US, true, 0);
+#else
+  sampleTimer = timerBegin(0, 80, true);  // 80 MHz APB / 80 = 1 MHz tick
+  timerAttachInterrupt(sampleTimer, &onSampleTimer, true);
+  timerAlarmWrite(sampleTimer, SAMPLE_PERIOD_US, true);
+  timerAlarmEnable(sampleTimer);
+#endif
+}
 
-  float rmsVoltage = sqrt(sum / samples);
-  float current = rmsVoltage / 0.185;   // ACS712 sensitivity
+// RMS and peak |current| (A) over a window, which then starts over
+void takeWindow(SampleWindow& w, float* rms1, float* peak1, float* rms2, float* peak2) {
+  portENTER_CRITICAL(&samplerMux);
+  SampleWindow taken = w;
+  w = SampleWindow();
+  portEXIT_CRITICAL(&samplerMux);
+
+  if (taken.count == 0) {
+    *rms1 = *peak1 = *rms2 = *peak2 = 0;
+    return;
+  }
+  *rms1 = sqrt(taken.sumSq1 / taken.count) / ACS712_V_PER_A;
+  *rms2 = sqrt(taken.sumSq2 / taken.count) / ACS712_V_PER_A;
+  if (*rms1 < NOISE_FLOOR_A) *rms1 = 0;
+  if (*rms2 < NOISE_FLOOR_A) *rms2 = 0;
+  *peak1 = taken.peak1 / ACS712_V_PER_A;
+  *peak2 = taken.peak2 / ACS712_V_PER_A;
+}
 
-  if (current < 0.03) current = 0;
-  return current;
+uint16_t toMilliamps(float amps) {
+  float ma = amps * 1000.0;
+  if (ma > 65535.0) ma = 65535.0;
+  return (uint16_t)(ma + 0.5);
+}
+
+// ================= HIGH-RES SAMPLING =================
+void publishHighResBatch() {
+  uint8_t frame[sizeof(HrFrameHeader) + sizeof(hrBatch)];
+  HrFrameHeader header = {{'E', 'H'}, HR_VERSION, hrCount, hrSeq++, HR_INTERVAL_MS, hrBatchStart};
+
+  memcpy(frame, &header, sizeof(header));
+  memcpy(frame + sizeof(header), hrBatch, hrCount * sizeof(HrReading));
+  client.publish(energy_hr_topic, frame, sizeof(header) + hrCount * sizeof(HrReading));
+  hrCount = 0;
+}
+
+void sampleHighRes() {
+  float rms1, peak1, rms2, peak2;
+  takeWindow(hrWindow, &rms1, &peak1, &rms2, &peak2);
+
+  if (hrCount == 0) hrBatchStart = millis();
+  hrBatch[hrCount++] = {toMilliamps(rms1), toMilliamps(peak1), toMilliamps(rms2), toMilliamps(peak2)};
+
+  if (hrCount >= HR_BATCH) publishHighResBatch();
+}
+
+// ================= OFFLINE BUFFER =================
+uint32_t toCounter(double kwh) {
+  return (uint32_t)(kwh * 100000.0 + 0.5);
+}
+
+// Close the record being accumulated and append it to the ring
+void commitBufferRecord() {
+  if (bufSeconds == 0) return;
+  time_t now = time(nullptr);
+  BufRecord record = {
+    now > 1600000000 ? (uint32_t)now : 0,
+    toMilliamps(sqrt(bufSumSq1 / bufSeconds)),
+    toMilliamps(sqrt(bufSumSq2 / bufSeconds)),
+    toCounter(energy1),
+    toCounter(energy2)
+  };
+  if (bufCount == BUF_CAPACITY) {
+    bufHead = (bufHead + 1) % BUF_CAPACITY;  // Overwrite the oldest
+    bufCount--;
+    bufDropped++;
+  }
+  bufRing[(bufHead + bufCount) % BUF_CAPACITY] = record;
+  bufCount++;
+  bufSumSq1 = bufSumSq2 = 0;
+  bufSeconds = 0;
+}
+
+// Fold one second of readings into the buffer instead of publishing it
+void bufferSecond(float current1, float current2) {
+  bufSumSq1 += current1 * current1;
+  bufSumSq2 += current2 * current2;
+  bufSeconds++;
+  if (bufSeconds >= BUF_INTERVAL_S) commitBufferRecord();
+}
+
+// Publish up to BUF_FRAMES_PER_LOOP frames of the ring, oldest first
+void drainBuffer() {
+  if (bufCount == 0) commitBufferRecord();  // Partial record left from the outage
+  static uint8_t frame[sizeof(BufFrameHeader) + BUF_FRAME_RECORDS * sizeof(BufRecord)];
+
+  for (int f = 0; f < BUF_FRAMES_PER_LOOP && bufCount > 0; f++) {
+    uint8_t count = bufCount < BUF_FRAME_RECORDS ? bufCount : BUF_FRAME_RECORDS;
+    BufFrameHeader header = {{'E', 'B'}, BUF_VERSION, count, bufSeq, BUF_INTERVAL_S, bufDropped};
+    memcpy(frame, &header, sizeof(header));
+    for (int i = 0; i < count; i++) {
+      memcpy(frame + sizeof(header) + i * sizeof(BufRecord),
+             &bufRing[(bufHead + i) % BUF_CAPACITY], sizeof(BufRecord));
+    }
+    if (!client.publish(energy_log_topic, frame, sizeof(header) + count * sizeof(BufRecord))) {
+      return;  // Connection dropped again; the records stay queued
+    }
+    bufSeq++;
+    bufHead = (bufHead + count) % BUF_CAPACITY;
+    bufCount -= count;
+  }
+  if (bufCount == 0) Serial.println("📤 Offline buffer replayed");
 }
 
 // ================= SETUP =================
 void setup() {
+  Serial.setTxBufferSize(1024);  // The status dump must not block loop() on the UART
   Serial.begin(115200);
   Serial.println("\n╔════════════════════════════════════════╗");
   Serial.println("║   ESP32 Smart Home Control System     ║");
@@ -206,10 +482,13 @@ void setup() {
 
   Serial.printf("ACS712 Offset1: %.4fV\n", offset1);
   Serial.printf("ACS712 Offset2: %.4fV\n", offset2);
+  startSampler();
 
   setupWiFi();
   client.setServer(mqtt_server, mqtt_port);
   client.setCallback(callback);
+  client.setBufferSize(sizeof(BufFrameHeader) + BUF_FRAME_RECORDS * sizeof(BufRecord) + 64);
+  client.setSocketTimeout(2);  // Bound each connect attempt
   connectToMQTT();
 
   // Initialize day tracking
@@ -226,12 +505,23 @@ void setup() {
 
 // ================= LOOP =================
 void loop() {
-  if (!client.connected()) connectToMQTT();
-  client.loop();
+  bool online = connectToMQTT();
+  if (online) client.loop();
+  // Replay what was buffered offline before any live frame
+  bool catchingUp = online && (bufCount > 0 || bufSeconds > 0);
+  if (catchingUp) drainBuffer();
 
   static unsigned long lastMillis = 0;
+  static unsigned long lastHrMillis = 0;
+
+  if (highResMode && millis() - lastHrMillis >= HR_INTERVAL_MS) {
+    lastHrMillis = millis();
+    sampleHighRes();
+  }
 
   if (millis() - lastMillis >= 1000) {
+    // The window covers everything since the last tick, even if loop() was held up
+    float elapsed = (millis() - lastMillis) / 1000.0;
     lastMillis = millis();
 
     // ────────────────────────────────────
@@ -248,7 +538,7 @@ void loop() {
     }
 
     // ────────────────────────────────────
-    //  MOTION SENSOR: Simple 5-minute trigger
+    //  MOTION SENSOR: Occupancy-based timeout
     // ────────────────────────────────────
     bool motionDetected = digitalRead(MOTION_PIN);
 
@@ -256,36 +546,46 @@ void loop() {
       if (!motionActive) {
         // Start motion mode
         motionActive = true;
-        motionTimeout = millis() + MOTION_DURATION;
+        motionStarted = millis();
         digitalWrite(light1Pin, LOW);  // Turn ON Light1
-        Serial.println("🚶 [MOTION] Detected → Light1 ON for 5 minutes");
-        
-        // Publish motion event to MQTT
+        Serial.println("🚶 [MOTION] Detected → Light1 ON");
+      }
+
+      // Every motion extends the timeout, longer the longer the room is in use
+      unsigned long occupiedFor = millis() - motionStarted;
+      unsigned long timeout = occupiedFor / 2;
+      if (timeout < motionDuration) timeout = motionDuration;
+      if (timeout > MOTION_MAX_DURATION) timeout = MOTION_MAX_DURATION;
+      motionTimeout = millis() + timeout;
+
+      // Publish each rising edge so the Pi can track occupancy
+      if (!lastMotionState && online) {
         client.publish(motion_topic, "{\"motion\":1,\"active\":1}");
       }
     }
+    lastMotionState = (motionDetected == HIGH);
 
     // Check motion timeout
-    if (motionActive && millis() > motionTimeout) {
+    if (motionActive && (long)(millis() - motionTimeout) > 0) {
       digitalWrite(light1Pin, HIGH);  // Turn OFF
       motionActive = false;
       Serial.println("⏰ [MOTION] Timeout → Light1 OFF");
       
       // Publish motion end to MQTT
-      client.publish(motion_topic, "{\"motion\":0,\"active\":0}");
+      if (online) client.publish(motion_topic, "{\"motion\":0,\"active\":0}");
     }
 
     // ────────────────────────────────────
     //  READ SENSOR CURRENTS
     // ────────────────────────────────────
-    float current1 = readCurrent(sensor1Pin, offset1);
-    float current2 = readCurrent(sensor2Pin, offset2);
+    float current1, current2, peak1, peak2;
+    takeWindow(secondWindow, &current1, &peak1, &current2, &peak2);
 
     float power1 = voltage_mains * current1;
     float power2 = voltage_mains * current2;
 
-    energy1 += power1 / 3600000.0;
-    energy2 += power2 / 3600000.0;
+    energy1 += power1 * elapsed / 3600000.0;
+    energy2 += power2 * elapsed / 3600000.0;
 
     // ────────────────────────────────────
     //  SERIAL MONITOR OUTPUT
@@ -307,8 +607,13 @@ void loop() {
     }
 
     // ────────────────────────────────────
-    //  PUBLISH ENERGY to MQTT
+    //  PUBLISH ENERGY to MQTT (or buffer it)
     // ────────────────────────────────────
+    if (!online || catchingUp) {
+      bufferSecond(current1, current2);
+      return;
+    }
+
     char msg[350];
     snprintf(msg, sizeof(msg),
       "{\"L1\":{\"current\":%.3f,\"power\":%.1f,\"energy\":%.6f},"
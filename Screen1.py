@@ -1,18 +1,22 @@
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
                                 QPushButton, QLabel, QFrame, QStackedWidget)
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, Signal, Slot
 from PySide6.QtGui import QFont
 from themes import theme_manager
 from mqtt_client import mqtt_client
+from logs import get_logger
+
+log = get_logger("ui")
 
 
 class ApplianceCard(QFrame):
     """Individual appliance toggle card"""
-    def __init__(self, name, icon, mqtt_method, parent=None):
+    def __init__(self, name, icon, mqtt_method, appliance_id=None, parent=None):
         super().__init__(parent)
         self.name = name
         self.icon = icon
         self.mqtt_method = mqtt_method
+        self.appliance_id = appliance_id
         self.is_on = False
         self.icon_label = None
         self.name_label = None
@@ -121,10 +125,16 @@ class ApplianceCard(QFrame):
         
         # Send MQTT command
         self.mqtt_method(state)
-        print(f"[MQTT] {self.name} - {state}")
+        log.info("%s switched %s", self.name, state, extra={"appliance": self.name, "state": state})
         
         super().mousePressEvent(event)
 
+    def set_state(self, state):
+        """Show a state switched elsewhere (another panel, motion, a timer)"""
+        self.is_on = state == "ON"
+        self.update_card_background()
+        self.update_icon_color()
+
     def update_theme(self):
         """Update card styling when theme changes"""
         self.update_card_background()
@@ -187,6 +197,8 @@ class RoomCard(QFrame):
 
 class Screen1(QWidget):
     """Main control screen with room navigation"""
+    state_changed = Signal(object)  # {appliance_id: state} from the MQTT thread
+
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
@@ -194,6 +206,11 @@ class Screen1(QWidget):
         self.room_cards = []
         self.setup_ui()
 
+        # Cards render from the house-wide shared state
+        self.state_changed.connect(self.apply_states, Qt.QueuedConnection)
+        mqtt_client.state_callback = self.state_changed.emit
+        self.apply_states(mqtt_client.replica.snapshot())
+
     def setup_ui(self):
         main_layout = QVBoxLayout(self)
         main_layout.setContentsMargins(20, 20, 20, 20)
@@ -297,19 +314,19 @@ class Screen1(QWidget):
         # MQTT mapping: Light1→Light1, Light2→Light2, Light3→Plug1, Light4→Plug2
         appliances = [
             # Row 1: 4 Lights
-            ("Light 1", "💡", mqtt_client.send_light1, 0, 0),
-            ("Light 2", "💡", mqtt_client.send_light2, 0, 1),
-            ("Light 3", "💡", None, 0, 2),
-            ("Light 4", "💡", None, 0, 3),
+            ("Light 1", "💡", mqtt_client.send_light1, "living_light_1", 0, 0),
+            ("Light 2", "💡", mqtt_client.send_light2, "living_light_2", 0, 1),
+            ("Light 3", "💡", None, None, 0, 2),
+            ("Light 4", "💡", None, None, 0, 3),
             # Row 2: 2 Fans, 2 Plugs
-            ("Fan 1", "🌀", None, 1, 0),
-            ("Fan 2", "🌀", None, 1, 1),
-            ("Plug 1", "🔌", mqtt_client.send_light3, 1, 2),
-            ("Plug 2", "🔌", mqtt_client.send_light4, 1, 3),
+            ("Fan 1", "🌀", None, None, 1, 0),
+            ("Fan 2", "🌀", None, None, 1, 1),
+            ("Plug 1", "🔌", mqtt_client.send_light3, "living_plug_1", 1, 2),
+            ("Plug 2", "🔌", mqtt_client.send_light4, "living_plug_2", 1, 3),
         ]
         
-        for name, icon, mqtt_method, row, col in appliances:
-            card = ApplianceCard(name, icon, mqtt_method)
+        for name, icon, mqtt_method, appliance_id, row, col in appliances:
+            card = ApplianceCard(name, icon, mqtt_method, appliance_id)
             self.appliance_cards.append(card)
             grid.addWidget(card, row, col)
         
@@ -356,6 +373,12 @@ class Screen1(QWidget):
         self.title_label.setText("Smart Home Control")
         self.back_btn.hide()
 
+    @Slot(object)
+    def apply_states(self, states):
+        for card in self.appliance_cards:
+            if card.appliance_id in states:
+                card.set_state(states[card.appliance_id])
+
     def update_theme(self):
         """Update theme for all cards"""
         for card in self.appliance_cards:
@@ -1,22 +1,48 @@
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QComboBox, 
                                 QLabel, QPushButton, QButtonGroup, QFrame)
-from PySide6.QtGui import QPainter, QPen, QColor, QFont
-from PySide6.QtCore import Qt, Slot, QTimer, QMetaObject, Q_ARG
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import matplotlib.pyplot as plt
+from PySide6.QtGui import QPainter, QPen, QColor, QFont, QImage, QPixmap
+from PySide6.QtCore import Qt, Signal, Slot, QTimer
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from themes import theme_manager
+from chart_cache import ChartCache
 from mqtt_client import mqtt_client
+from energy_frames import HighResHistory
+from energy_history import (ApplianceReading, EnergyHistory, LOG_FILE, DAY_MISSING, DAY_MEASURED,
+                            DAY_BACKFILLED, DAY_PARTIAL)
+from rollover import RolloverEngine, STATE_FILE, read_state
+from energy_query import EnergyQuery
+from tariff import (Tariff, TariffEngine, BIN_MINUTES, TARIFF_FILE, BINS_FILE, load_tariff, tariff_mtime,
+                    save_bins, read_bins)
+from forecast import ConsumptionForecast
+from anomaly import AnomalyDetector
+from settings_store import atomic_write
+from io_worker import io_worker, render_worker
+from metrics import metrics
+from logs import get_logger, rate_limited
+import numpy as np
 import datetime
-import os
+import json
+import logging
+import time
+
+log = get_logger("energy")
+hot_log = rate_limited("energy.ingest")  # Errors on the 1 Hz path, once a minute per site
+
+GRAPH_TODAY_RESOLUTION = 0.01  # kWh; smaller growth of today's bars is not redrawn
+GRAPH_RANGES = {"Last 7 days": 7, "Last 10 days": 10, "Last 30 days": 30, "Last 60 days": 60}
+GRAPH_SERIES = ["LIGHT", "FAN", "PLUG", "TOTAL", "ALL"]
+MAX_PENDING_CATCHUP = 64  # Catch-up frames held until the log has loaded
 
 
 class DigitalDisplay(QFrame):
     """Digital display for showing current values with full precision"""
-    def __init__(self, label, icon, color="#00FF66"):
+    def __init__(self, label, icon, color="#00FF66", unit="Amps (A)"):
         super().__init__()
         self.label = label
         self.icon = icon
         self.color = color
+        self.unit = unit
         self._value = 0.0
         self.setup_ui()
 
@@ -70,7 +96,7 @@ class DigitalDisplay(QFrame):
         layout.addWidget(self.value_label, 1)
 
         # Unit label
-        unit_label = QLabel("Amps (A)")
+        unit_label = QLabel(self.unit)
         unit_label.setFont(QFont("Segoe UI", 10))
         unit_label.setAlignment(Qt.AlignCenter)
         unit_label.setStyleSheet("background: transparent; color: #888;")
@@ -88,49 +114,102 @@ class DigitalDisplay(QFrame):
 
 
 class GraphWidget(QWidget):
-    """Graph widget for historical data visualization"""
-    def __init__(self, title, light_data, fan_data, plug_data):
+    """Graph widget for historical data visualization
+
+    Charts are rendered off-screen with matplotlib's Agg backend into a
+    QPixmap kept in a ChartCache, so revisiting a range/series/theme whose
+    data has not changed is a plain pixmap blit.
+
+    Data arrays hold NaN for days with no log entry; `flags` (DAY_* per
+    day) tells those apart from zero use and marks estimated days.
+    """
+    def __init__(self, title, light_data, fan_data, plug_data, flags=None, cache=None):
         super().__init__()
         self.title = title
-        self.light_data = light_data
-        self.fan_data = fan_data
-        self.plug_data = plug_data
+        self.light_data = np.asarray(light_data, dtype=float)
+        self.fan_data = np.asarray(fan_data, dtype=float)
+        self.plug_data = np.asarray(plug_data, dtype=float)
+        self.flags = flags
         self.plot_type = "ALL"
-        layout = QVBoxLayout(self)
-        self.canvas = FigureCanvas(plt.Figure(facecolor=theme_manager.get_theme()["secondary1"]))
-        layout.addWidget(self.canvas)
-        self.plot()
-
-    def plot(self):
-        self.canvas.figure.clear()
-        theme = theme_manager.get_theme()
-        ax = self.canvas.figure.add_subplot(111)
-        self.canvas.figure.patch.set_facecolor(theme["secondary1"])
+        self.projection = None  # Forecast (3,) kWh for today, drawn over the last bar
+        self.cache = cache if cache is not None else ChartCache()
+        self.figure = Figure()
+        FigureCanvasAgg(self.figure)
+        self.prerender_figure = None  # Only used on the render worker
+        self.pixmap = None
+        render_worker.done.connect(self.prerendered)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+    def chart_key(self, plot_type, light_data, fan_data, plug_data, flags=None):
+        """Everything the rendered image depends on"""
+        # Raw bytes, NaN included: the missing days are part of the key anyway
+        data = np.stack([light_data, fan_data, plug_data])
+        # Today's bucket grows every second; only a visible change re-renders
+        today = (tuple((np.where(np.isnan(data[:, -1]), 0.0, data[:, -1]) / GRAPH_TODAY_RESOLUTION)
+                       .round().astype(int).tolist()) if data.shape[1] else ())
+        projection = (tuple((self.projection / GRAPH_TODAY_RESOLUTION).round().astype(int).tolist())
+                      if self.projection is not None else None)
+        ratio = self.devicePixelRatioF()
+        return (self.title, data.shape[1], plot_type, theme_manager.current_theme,
+                self.width(), self.height(), ratio, hash(data[:, :-1].tobytes()), today, projection,
+                flags.tobytes() if flags is not None else None)
+
+    def render(self, plot_type, light_data, fan_data, plug_data, flags=None):
+        """Draw the chart into a new QPixmap the size of the widget"""
+        ratio = self.devicePixelRatioF()
+        image = self.render_image(self.figure, self.view_size(), ratio, theme_manager.get_theme(),
+                                  self.projection, plot_type, light_data, fan_data, plug_data, flags)
+        pixmap = QPixmap.fromImage(image)
+        pixmap.setDevicePixelRatio(ratio)
+        return pixmap
+
+    def view_size(self):
+        return max(self.width(), 1), max(self.height(), 1)
+
+    def render_image(self, figure, size, ratio, theme, projection, plot_type,
+                     light_data, fan_data, plug_data, flags=None):
+        """Draw the chart into a QImage with `figure`
+
+        Touches no widget state, so the I/O worker can pre-render with a
+        figure of its own while the GUI thread keeps handling taps.
+        """
+        start = time.perf_counter()
+        dpi = figure.get_dpi()
+        figure.set_size_inches(size[0] * ratio / dpi, size[1] * ratio / dpi)
+        figure.clear()
+        ax = figure.add_subplot(111)
+        figure.patch.set_facecolor(theme["secondary1"])
         ax.set_facecolor(theme["secondary1"])
 
-        days = range(1, len(self.light_data) + 1)
+        data = np.stack([light_data, fan_data, plug_data])
+        data[np.isnan(data)] = 0.0  # Missing days draw as empty; draw_gaps marks them
+        light_data, fan_data, plug_data = data
+        days = np.arange(1, data.shape[1] + 1)
         bar_width = 0.25
 
-        if self.plot_type == "LIGHT":
-            ax.bar(days, self.light_data, width=bar_width * 2, color="#00FF66", label='Light')
-        elif self.plot_type == "FAN":
-            ax.bar(days, self.fan_data, width=bar_width * 2, color="#0078D7", label='Fan')
-        elif self.plot_type == "PLUG":
-            ax.bar(days, self.plug_data, width=bar_width * 2, color="#FFB900", label='Plug')
-        elif self.plot_type == "TOTAL":
-            total_data = [l + f + p for l, f, p in zip(self.light_data, self.fan_data, self.plug_data)]
-            ax.bar(days, total_data, width=bar_width * 2, color="#FF6B35", label='Total')
+        if plot_type == "LIGHT":
+            ax.bar(days, light_data, width=bar_width * 2, color="#00FF66", label='Light')
+        elif plot_type == "FAN":
+            ax.bar(days, fan_data, width=bar_width * 2, color="#0078D7", label='Fan')
+        elif plot_type == "PLUG":
+            ax.bar(days, plug_data, width=bar_width * 2, color="#FFB900", label='Plug')
+        elif plot_type == "TOTAL":
+            ax.bar(days, data.sum(axis=0), width=bar_width * 2, color="#FF6B35", label='Total')
         else:  # ALL (grouped bars)
-            days = list(days)
-            ax.bar([d - bar_width for d in days], self.light_data, width=bar_width, 
+            ax.bar(days - bar_width, light_data, width=bar_width,
                    color="#00FF66", label='Light')
-            ax.bar(days, self.fan_data, width=bar_width, 
+            ax.bar(days, fan_data, width=bar_width,
                    color="#0078D7", label='Fan')
-            ax.bar([d + bar_width for d in days], self.plug_data, width=bar_width, 
+            ax.bar(days + bar_width, plug_data, width=bar_width,
                    color="#FFB900", label='Plug')
 
+        if projection is not None and len(days):
+            self.draw_projection(ax, plot_type, len(days), bar_width, data[:, -1], projection)
+        if flags is not None and (flags != DAY_MEASURED).any():
+            self.draw_gaps(ax, plot_type, flags, data, theme)
+
         ax.set_title(self.title, color=theme["secondary3"], fontweight='bold', fontsize=10)
-        ax.set_ylabel("Current (Amps)", color=theme["secondary3"], fontsize=8)
+        ax.set_ylabel("Energy (kWh)", color=theme["secondary3"], fontsize=8)
         ax.set_xlabel("Day", color=theme["secondary3"], fontsize=8)
         ax.tick_params(colors=theme["secondary3"], labelsize=6)
         ax.grid(True, linestyle="--", alpha=0.5, color=theme["secondary3"])
@@ -139,31 +218,162 @@ class GraphWidget(QWidget):
         ax.autoscale(enable=True, axis='y', tight=False)
         ax.margins(x=0.05)
 
-        ax.set_xticks(range(1, len(self.light_data) + 1))
-        ax.set_xticklabels(range(1, len(self.light_data) + 1))
+        ax.set_xticks(days)
+        ax.set_xticklabels(days)
+
+        figure.canvas.draw()
+        width, height = figure.canvas.get_width_height(physical=True)
+        # Deep copy; the Agg buffer is reused by the next draw
+        image = QImage(figure.canvas.buffer_rgba(), width, height, QImage.Format_RGBA8888).copy()
+        metrics.graph_plot_seconds.observe(time.perf_counter() - start)
+        return image
+
+    def draw_projection(self, ax, plot_type, day, bar_width, today, projection):
+        """Hatched bars from today's actual kWh up to its forecast"""
+        remaining = np.maximum(projection - today, 0.0)
+        colors = ["#00FF66", "#0078D7", "#FFB900"]
+        if plot_type in ("LIGHT", "FAN", "PLUG"):
+            i = ["LIGHT", "FAN", "PLUG"].index(plot_type)
+            bars = [(day, today[i], remaining[i], colors[i], bar_width * 2)]
+        elif plot_type == "TOTAL":
+            bars = [(day, today.sum(), remaining.sum(), "#FF6B35", bar_width * 2)]
+        else:
+            bars = [(day + (i - 1) * bar_width, today[i], remaining[i], colors[i], bar_width) for i in range(3)]
+        for i, (x, bottom, height, color, width) in enumerate(bars):
+            ax.bar(x, height, bottom=bottom, width=width, color=color, alpha=0.35,
+                   hatch="//", edgecolor=color, label="Forecast" if i == 0 else None)
+
+    def draw_gaps(self, ax, plot_type, flags, data, theme):
+        """Shade runs of days with no data; mark estimated (≈) and lower-bound (≥) days"""
+        missing = np.concatenate(([0], (flags == DAY_MISSING).astype(int), [0]))
+        edges = np.flatnonzero(np.diff(missing))
+        for i, (first, last) in enumerate(zip(edges[::2], edges[1::2])):
+            ax.axvspan(first + 0.55, last + 0.45, color=theme["secondary3"], alpha=0.12, linewidth=0,
+                       label="No data" if i == 0 else None)
+
+        if plot_type in ("LIGHT", "FAN", "PLUG"):
+            heights = data[["LIGHT", "FAN", "PLUG"].index(plot_type)]
+        else:
+            heights = data.sum(axis=0) if plot_type == "TOTAL" else data.max(axis=0)
+        for flag, mark in ((DAY_BACKFILLED, "≈"), (DAY_PARTIAL, "≥")):
+            for day in np.flatnonzero(flags == flag):
+                ax.annotate(mark, (day + 1, heights[day]), ha="center", va="bottom",
+                            color=theme["secondary3"], fontsize=8)
 
-        self.canvas.draw()
+    def plot(self):
+        """Render the current data now, bypassing (and refreshing) the cache"""
+        data = (self.light_data, self.fan_data, self.plug_data, self.flags)
+        self.pixmap = self.render(self.plot_type, *data)
+        self.cache.put(self.chart_key(self.plot_type, *data), self.pixmap)
+        self.update()
 
-    def update_data(self, light_data, fan_data, plug_data, plot_type):
-        self.light_data = light_data
-        self.fan_data = fan_data
-        self.plug_data = plug_data
+    def refresh(self):
+        """Show the current data, rendering only on a cache miss"""
+        if self.width() <= 0 or self.height() <= 0:
+            return
+        key = self.chart_key(self.plot_type, self.light_data, self.fan_data, self.plug_data, self.flags)
+        pixmap = self.cache.get(key)
+        if pixmap is None:
+            self.plot()
+        else:
+            self.pixmap = pixmap
+            self.update()
+
+    def prerender(self, views):
+        """Render views the user has not opened yet, on the render worker
+
+        `views` are (plot_type, light, fan, plug, flags); the images come
+        back through prerendered() and go into the cache. A newer request
+        replaces one still waiting in the queue.
+        """
+        size, ratio = self.view_size(), self.devicePixelRatioF()
+        theme = theme_manager.get_theme()
+        jobs = [(self.chart_key(*view), view) for view in views]
+        jobs = [(key, view) for key, view in jobs if key not in self.cache]
+        if jobs:
+            render_worker.submit("chart.prerender", self.render_views, size, ratio, theme,
+                             self.projection, jobs, coalesce=True)
+
+    def render_views(self, size, ratio, theme, projection, jobs):
+        """[(key, QImage)] for prerender() (runs on the render worker)"""
+        if self.prerender_figure is None:
+            self.prerender_figure = Figure()
+            FigureCanvasAgg(self.prerender_figure)
+        return ratio, [(key, self.render_image(self.prerender_figure, size, ratio, theme, projection, *view))
+                       for key, view in jobs]
+
+    def prerendered(self, key, result):
+        if key != "chart.prerender":
+            return
+        ratio, images = result
+        for view_key, image in images:
+            pixmap = QPixmap.fromImage(image)
+            pixmap.setDevicePixelRatio(ratio)
+            self.cache.put(view_key, pixmap)
+
+    def update_data(self, light_data, fan_data, plug_data, plot_type, flags=None):
+        self.light_data = np.asarray(light_data, dtype=float)
+        self.fan_data = np.asarray(fan_data, dtype=float)
+        self.plug_data = np.asarray(plug_data, dtype=float)
+        self.flags = flags
         self.plot_type = plot_type
-        self.plot()
+        self.refresh()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.refresh()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(theme_manager.get_theme()["secondary1"]))
+        if self.pixmap is not None:
+            painter.drawPixmap(0, 0, self.pixmap)
 
 
 class Screen2(QWidget):
-    """Live energy monitoring screen with digital displays"""
+    """Live energy monitoring screen with digital displays
+
+    All Screen2 state is owned by the GUI thread. The paho thread only
+    emits `sample_received` with the decoded (never mutated) EnergySample,
+    or `catchup_received` with a CatchupFrame; Qt queues them across
+    threads to `apply_sample` / `apply_catchup`.
+    """
+    sample_received = Signal(object)
+    catchup_received = Signal(object)
+    batch_received = Signal(object)
+
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
-        self.light_value = 0.0  # L1 current
-        self.fan_value = 0.0    # L2 current
-        self.plug_value = 0.0   # Calculated from L1
+        self.reading = ApplianceReading()  # Latest light/fan/plug split
+        self.reading_fresh = False         # Set by a frame or a restart snapshot: newer than the log
+        self.history = EnergyHistory()      # Per-day kWh, column-wise
+        self.history_loaded = False
+        self.log_readable = True            # False: never overwrite a log we could not read
+        self.rollover = RolloverEngine()    # Device counters → per-day kWh
+        zone = self.rollover.clock.zone     # One zone, so day and bin boundaries agree
+        self.tariff = TariffEngine(zone=zone)   # kWh → running cost
+        self.tariff_mtime = None
+        self.forecast = ConsumptionForecast(zone)   # Weekday × hour profile → projected kWh
+        self.energy_query = EnergyQuery(self.history, self.tariff.bins, zone)
+        self.rollover.energy_callback = self.book_energy
+        self.detector = AnomalyDetector(mqtt_client.relay_states.get)
+        self.detector.alert_callback = self.show_alert
         self.view_mode = "live"
+        self.pending_catchup = []  # Catch-up frames that arrived before the log loaded
+        self.highres_history = HighResHistory()  # 10 Hz readings for fault detection
+        self.highres_requested = None            # Set once the 10 Hz button is used
         self.setup_ui()
         self.load_initial_data()
+        io_worker.done.connect(self.io_done)
+        io_worker.failed.connect(self.io_failed)
+        io_worker.submit("energy_log.load", self.read_history)
+        self.sample_received.connect(self.apply_sample, Qt.QueuedConnection)
+        self.catchup_received.connect(self.apply_catchup, Qt.QueuedConnection)
         mqtt_client.energy_callback = self.handle_energy_update
+        mqtt_client.catchup_callback = self.catchup_received.emit
+        self.batch_received.connect(self.apply_batch, Qt.QueuedConnection)
+        mqtt_client.batch_callback = self.batch_received.emit
         self.start_logging_timer()
 
     def setup_ui(self):
@@ -180,6 +390,14 @@ class Screen2(QWidget):
         
         top_row.addStretch()
 
+        # 10 Hz batch mode on the ESP32, for surge detection
+        self.highres_btn = QPushButton("🔬 10 Hz")
+        self.highres_btn.setCheckable(True)
+        self.highres_btn.setFixedSize(80, 32)
+        self.highres_btn.setToolTip("Sample the current every 100 ms to catch short surges")
+        self.highres_btn.toggled.connect(self.set_highres)
+        top_row.addWidget(self.highres_btn)
+
         # View toggle buttons
         view_group = QButtonGroup(self)
         self.live_btn = QPushButton("📊 Live View")
@@ -237,17 +455,27 @@ class Screen2(QWidget):
         row2.addWidget(self.total_display)
         layout.addLayout(row2)
 
-        # ESP32 status indicator
-        status_label = QLabel("📡 Waiting for ESP32 data on topic: home/light/energy")
-        status_label.setAlignment(Qt.AlignCenter)
-        status_label.setStyleSheet("""
+        # Running cost from the tariff engine, beside the ESP32 status
+        row3 = QHBoxLayout()
+        self.cost_label = QLabel("💰 Waiting for energy data")
+        self.cost_label.setAlignment(Qt.AlignCenter)
+        self.cost_label.setStyleSheet("""
             background-color: rgba(40, 40, 50, 200);
             border-radius: 8px;
             padding: 10px;
-            color: #888;
-            font-size: 10px;
+            color: #FFB900;
+            font-size: 11px;
+            font-weight: bold;
         """)
-        layout.addWidget(status_label)
+        row3.addWidget(self.cost_label, 3)
+
+        # ESP32 status indicator
+        self.status_label = QLabel("📡 Waiting for ESP32 data on topic: home/light/energy")
+        self.status_label.setAlignment(Qt.AlignCenter)
+        self.status_label.setWordWrap(True)
+        self.set_status_style("#888")
+        row3.addWidget(self.status_label, 2)
+        layout.addLayout(row3)
 
         return view
 
@@ -259,16 +487,19 @@ class Screen2(QWidget):
 
         # Graph controls
         controls = QHBoxLayout()
+        self.forecast_label = QLabel("📈 Forecast: waiting for energy data")
+        self.forecast_label.setStyleSheet("color: #FF6B35; font-size: 11px; font-weight: bold;")
+        controls.addWidget(self.forecast_label)
         controls.addStretch()
 
         self.time_combo = QComboBox()
-        self.time_combo.addItems(["Last 7 days", "Last 10 days", "Last 30 days", "Last 60 days"])
+        self.time_combo.addItems(list(GRAPH_RANGES))
         self.time_combo.setCurrentText("Last 30 days")
         self.time_combo.currentIndexChanged.connect(self.update_graph_data)
         controls.addWidget(self.time_combo)
 
         self.data_combo = QComboBox()
-        self.data_combo.addItems(["LIGHT", "FAN", "PLUG", "TOTAL", "ALL"])
+        self.data_combo.addItems(GRAPH_SERIES)
         self.data_combo.setCurrentText("ALL")
         self.data_combo.currentIndexChanged.connect(self.update_graph_data)
         controls.addWidget(self.data_combo)
@@ -276,8 +507,8 @@ class Screen2(QWidget):
         layout.addLayout(controls)
 
         # Graph
-        self.light_data, self.fan_data, self.plug_data = self.load_log_data(30)
-        self.graph_widget = GraphWidget("Energy vs Day", self.light_data, self.fan_data, self.plug_data)
+        self.light_data, self.fan_data, self.plug_data, flags = self.load_log_data(30)
+        self.graph_widget = GraphWidget("Energy vs Day", self.light_data, self.fan_data, self.plug_data, flags)
         self.graph_widget.setMinimumHeight(280)
         layout.addWidget(self.graph_widget)
 
@@ -293,147 +524,312 @@ class Screen2(QWidget):
             self.graph_view.show()
             self.update_graph_data()
 
+    def read_history(self):
+        """Parse the log, rollover state and tariff (runs on the I/O worker)
+
+        Each file is read on its own: a malformed one falls back to its
+        default instead of taking the others down with it.
+        """
+        history = EnergyHistory()
+        try:
+            history.load()
+            readable = True
+        except (OSError, UnicodeDecodeError) as e:
+            log.error("Error reading log: %s", e)
+            history, readable = EnergyHistory(), False
+        state = self.read_part(STATE_FILE, read_state, {})
+        # The mtime is kept either way, so a bad tariff.json is retried only once it changes
+        mtime = tariff_mtime()
+        tariff = self.read_part(TARIFF_FILE, load_tariff, None) or Tariff()
+        bins = self.read_part(BINS_FILE, read_bins, None)
+        return history, readable, state, (mtime, tariff), bins
+
+    @staticmethod
+    def read_part(path, reader, default):
+        try:
+            return reader()
+        except Exception as e:
+            log.error("Ignoring unreadable %s: %s", path, e)
+            return default
+
+    def read_tariff(self, known_mtime):
+        """(mtime, Tariff or None if malformed) if tariff.json changed since known_mtime, else None"""
+        mtime = tariff_mtime()
+        if mtime == known_mtime:
+            return None
+        return mtime, self.read_part(TARIFF_FILE, load_tariff, None)
+
+    def write_history(self, history, state):
+        """Write a snapshot to the log, then the counters it covers (runs on the I/O worker)"""
+        with metrics.log_write_seconds.time():
+            history.save()
+            atomic_write(STATE_FILE, json.dumps(state).encode())
+
+    @Slot(str, object)
+    def io_done(self, key, result):
+        if key == "energy_log.load":
+            history, self.log_readable, state, tariff, bins = result
+            self.history = history
+            self.energy_query.history = history
+            self.load_costs(tariff, bins)
+            self.rollover.load_state(state)
+            if not self.reading_fresh:
+                self.restore_reading(state, history)
+            if self.rollover.last_time is not None:
+                # Carry on the day the panel was last logging; the first
+                # frame then reconciles the downtime from the counters
+                day = self.rollover.clock.day_of(self.rollover.last_time)
+                self.rollover.resume(day, history.get(day) or ApplianceReading())
+                if history.flag(day) > DAY_MEASURED:
+                    self.rollover.flags[day] = history.flag(day)
+            self.history_loaded = True
+            for frame in self.pending_catchup:
+                self.apply_catchup(frame)
+            if not self.log_readable:
+                log.warning("Not saving %s this run: it could not be read", LOG_FILE)
+            self.pending_catchup = []
+            if self.view_mode == "graph":
+                self.update_graph_data()
+
+        elif key == "tariff.check" and result is not None:
+            self.tariff_mtime, tariff = result
+            if tariff is None:
+                return  # Malformed edit: keep pricing with the current tariff
+            self.tariff.recompute(tariff)
+            log.info("Tariff reloaded; period cost %s%.2f", tariff.currency, self.tariff.period_cost.sum())
+            self.update_cost()
+
+    def load_costs(self, tariff, bins):
+        """Restore the binned kWh and price the open billing period"""
+        self.tariff_mtime, self.tariff.tariff = tariff
+        if bins is not None:
+            self.tariff.load_bins(*bins)
+        # Days logged before the bins existed are spread evenly over the day
+        today = self.tariff.local(time.time()).date()
+        day = self.tariff.tariff.period_start(today)
+        while day <= today:
+            reading = self.history.get(day)
+            if reading is not None:
+                self.tariff.seed_day(day, reading)
+            day += datetime.timedelta(days=1)
+        self.tariff.recompute()
+        self.forecast.seed(self.tariff.bins, 60 // BIN_MINUTES, time.time())
+        self.update_cost()
+
+    def update_cost(self):
+        tariff = self.tariff
+        currency = tariff.tariff.currency
+        today = tariff.day_cost.get(tariff.local(time.time()).date(), 0.0)
+        self.cost_label.setText(
+            f"💰 Now {currency}{tariff.live_rate:.2f}/h  ·  Today {currency}{today:.2f}  ·  "
+            f"Period {currency}{tariff.period_cost.sum():.2f} ({tariff.period_kwh:.2f} kWh)")
+
+    def book_energy(self, start, end, reading):
+        """Each rollover interval feeds the cost and forecast models and the query rings"""
+        self.tariff.add(start, end, reading)
+        self.forecast.add(start, end, reading)
+        self.energy_query.add(start, end, reading)
+
+    def update_forecast(self):
+        """Projected end-of-day / end-of-period kWh and cost (constant time)"""
+        projection = self.forecast.project(time.time(), self.tariff)
+        self.graph_widget.projection = projection.today_kwh if projection is not None else None
+        if projection is None:
+            return
+        currency = self.tariff.tariff.currency
+        self.forecast_label.setText(
+            f"📈 Forecast: today ≈ {projection.today_kwh.sum():.2f} kWh ({currency}{projection.today_cost:.2f})  ·  "
+            f"period ≈ {projection.period_kwh:.1f} kWh ({currency}{projection.period_cost:.2f})")
+
+    @Slot(str, str)
+    def io_failed(self, key, error):
+        if key == "energy_log.load":
+            log.error("Error loading energy history: %s", error)
+
+    def set_status_style(self, color):
+        self.status_label.setStyleSheet(f"""
+            background-color: rgba(40, 40, 50, 200);
+            border-radius: 8px;
+            padding: 10px;
+            color: {color};
+            font-size: 10px;
+        """)
+
+    def show_alert(self, alert):
+        """Anomaly alerts are logged and shown in the status line"""
+        if alert.kind == "recovered":
+            log.info("%s", alert.message, extra={"alert": alert.kind})
+            self.set_status_style("#888")
+            self.status_label.setText(f"📡 {alert.message}")
+        else:
+            log.warning("%s", alert.message, extra={"alert": alert.kind, "circuit": alert.circuit})
+            self.set_status_style("#FF5555")
+            self.status_label.setText(f"⚠️ {alert.message}")
+
+    def restore_reading(self, state, history):
+        """Last logged current: saved with the counters, or a pre-kWh log's last line"""
+        try:
+            reading = ApplianceReading(*(float(v) for v in state["reading"]))
+        except (KeyError, TypeError, ValueError):
+            reading = history.legacy_reading()
+        if reading is not None:
+            self.reading = reading
+            self.load_initial_data()
+
     def load_initial_data(self):
-        """Load last known values"""
-        log_file = "energy_log.txt"
-        if os.path.exists(log_file):
-            try:
-                with open(log_file, "r") as f:
-                    lines = f.readlines()
-                    for line in reversed(lines):
-                        if line.strip() and "light:" in line:
-                            parts = line.split("light:")[1].split("fan:") 
-                            self.light_value = float(parts[0].strip().split()[0])
-                            parts2 = parts[1].split("plug:")
-                            self.fan_value = float(parts2[0].strip().split()[0])
-                            self.plug_value = float(parts2[1].strip().split()[0])
-                            break
-            except Exception as e:
-                print(f"Error reading log: {e}")
-        
-        self.light_display.setValue(self.light_value)
-        self.fan_display.setValue(self.fan_value)
-        self.plug_display.setValue(self.plug_value)
-        self.total_display.setValue(self.light_value + self.fan_value + self.plug_value)
-
-    def handle_energy_update(self, data):
-        """Handle incoming MQTT energy data from ESP32
-        Expected format: {"L1":{"current":X,"power":Y,"energy":Z}, "L2":{...}}
+        """Show the last known values"""
+        self.light_display.setValue(self.reading.light)
+        self.fan_display.setValue(self.reading.fan)
+        self.plug_display.setValue(self.reading.plug)
+        self.total_display.setValue(self.reading.total)
+
+    def handle_energy_update(self, sample):
+        """Hand an EnergySample from the MQTT thread to the GUI thread
+        Decoded from: {"L1":{"current":X,"power":Y,"energy":Z}, "L2":{...}}
         """
+        metrics.qt_pending_updates.inc()
+        self.sample_received.emit(sample)
+
+    @Slot(object)
+    def apply_sample(self, sample):
+        """Show and log a sample (GUI thread)"""
+        metrics.qt_pending_updates.dec()
         try:
-            # L1 = sensor1 (Lights + Plugs combined on that circuit)
-            # L2 = sensor2 (Fans on that circuit)
-            l1_current = float(data.get("L1", {}).get("current", 0.0))
-            l2_current = float(data.get("L2", {}).get("current", 0.0))
-            
-            # Direct mapping from ESP32 dual sensors:
-            # L1 (sensor1) → Powers Lights + Plugs
-            # L2 (sensor2) → Powers Fans
-            self.light_value = l1_current * 0.6  # 60% of L1 is lights
-            self.plug_value = l1_current * 0.4   # 40% of L1 is plugs
-            self.fan_value = l2_current
-            
-            total = l1_current + l2_current
+            # L1 = sensor1 (Lights + Plugs), L2 = sensor2 (Fans)
+            reading = ApplianceReading.from_sample(sample)
+            self.reading = reading
+            self.reading_fresh = True
             
-            print(f"[ESP32 SENSORS] L1(Light+Plug):{l1_current:.6f}A → Light:{self.light_value:.6f}A Plug:{self.plug_value:.6f}A | L2(Fan):{l2_current:.6f}A | Total:{total:.6f}A")
+            # Per-frame trace only when debug is on; formatted on the log thread
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("L1(Light+Plug) %.6fA -> Light %.6fA Plug %.6fA | L2(Fan) %.6fA | Total %.6fA",
+                          sample.l1_current, reading.light, reading.plug, sample.l2_current, reading.total)
             
-            QMetaObject.invokeMethod(self.light_display, "setValue", Qt.QueuedConnection, Q_ARG(float, self.light_value))
-            QMetaObject.invokeMethod(self.fan_display, "setValue", Qt.QueuedConnection, Q_ARG(float, self.fan_value))
-            QMetaObject.invokeMethod(self.plug_display, "setValue", Qt.QueuedConnection, Q_ARG(float, self.plug_value))
-            QMetaObject.invokeMethod(self.total_display, "setValue", Qt.QueuedConnection, Q_ARG(float, total))
+            self.light_display.setValue(reading.light)
+            self.fan_display.setValue(reading.fan)
+            self.plug_display.setValue(reading.plug)
+            self.total_display.setValue(reading.total)
+            self.detector.feed(sample)
             
-            self.log_energy_reading()
+            # Frames before the log is loaded only update the displays
+            if self.history_loaded:
+                self.record_days(self.rollover.feed(sample))
+                self.update_cost()
+                if self.view_mode == "graph":
+                    self.update_forecast()
+                self.log_energy_reading()
         except Exception as e:
-            print(f"Error handling energy update: {e}")
+            hot_log.exception("Error handling energy update: %s", e)
+
+    @Slot(object)
+    def apply_catchup(self, frame):
+        """Feed the ESP32's replayed offline records into the day totals (GUI thread)
+
+        The device sends them before resuming live frames, so they extend
+        the counter stream in order and each day gets its measured share.
+        """
+        if not self.history_loaded:
+            if len(self.pending_catchup) >= MAX_PENDING_CATCHUP:
+                hot_log.warning("Log not loaded; dropping buffered records (frame %d)", frame.seq)
+                return
+            self.pending_catchup.append(frame)
+            return
+        samples = frame.samples()
+        for sample in samples:
+            self.record_days(self.rollover.feed(sample))
+        metrics.catchup_records.inc(len(samples))
+        log.info("Replayed %d buffered records (frame %d, %d overwritten on the device)",
+                 len(samples), frame.seq, frame.dropped)
+        self.update_cost()
+        self.log_energy_reading()
+
+    @Slot(object)
+    def apply_batch(self, frame):
+        """Keep a 10 Hz batch and check it for surges (GUI thread)"""
+        if self.highres_requested is None and not self.highres_btn.isChecked():
+            # The device is in high-res mode from an earlier session
+            self.highres_btn.blockSignals(True)
+            self.highres_btn.setChecked(True)
+            self.highres_btn.blockSignals(False)
+        self.highres_history.append_frame(frame)
+        self.detector.feed_highres(self.highres_history.latest(len(frame)))
+
+    def set_highres(self, enabled):
+        self.highres_requested = enabled
+        mqtt_client.send_highres("ON" if enabled else "OFF")
+        log.info("High-res mode %s", "on" if enabled else "off")
 
     def start_logging_timer(self):
         self.log_timer = QTimer(self)
         self.log_timer.timeout.connect(self.log_energy_reading)
+        self.log_timer.timeout.connect(self.save_costs)
         self.log_timer.start(60000)  # Every minute
 
-    def log_energy_reading(self):
-        """Log energy to file"""
-        now = datetime.datetime.now()
-        date_str = now.strftime("%Y-%m-%d")
-        log_file = "energy_log.txt"
-        
-        log_line = f"{date_str} light:{self.light_value:.6f} fan:{self.fan_value:.6f} plug:{self.plug_value:.6f} total:{self.light_value + self.fan_value + self.plug_value:.6f}\n"
-
-        lines = []
-        if os.path.exists(log_file):
-            try:
-                with open(log_file, "r") as f:
-                    lines = f.readlines()
-            except:
-                pass
-
-        found_today = False
-        for i, line in enumerate(lines):
-            if line.startswith(date_str):
-                lines[i] = log_line
-                found_today = True
-                break
-        if not found_today:
-            lines.append(log_line)
+        self.dropout_timer = QTimer(self)
+        self.dropout_timer.timeout.connect(self.detector.check)
+        self.dropout_timer.start(1000)
+
+    def save_costs(self):
+        """Persist the tariff bins and pick up edits to tariff.json"""
+        if not self.history_loaded:
+            return
+        self.tariff.prune()
+        io_worker.submit("tariff.save", save_bins, self.tariff.snapshot(), coalesce=True)
+        io_worker.submit("tariff.check", self.read_tariff, self.tariff_mtime, coalesce=True)
+
+    def record_days(self, days):
+        for day, totals in days:
+            flag = self.rollover.flags.pop(day, DAY_MEASURED)
+            self.history.set_day(day, totals, flag)
+            log.info("Closed %s: %.6f kWh%s", day, totals.total, " (gap)" if flag else "")
+        # Energy a reconnect backfilled into days that were already closed
+        for day, reading in self.rollover.late:
+            self.history.add_to_day(day, reading, self.rollover.flags.pop(day, DAY_BACKFILLED))
+            log.info("Backfilled %s: +%.6f kWh", day, reading.total)
+        self.rollover.late.clear()
 
-        try:
-            with open(log_file, "w") as f:
-                f.writelines(lines)
-        except Exception as e:
-            print(f"Error writing log: {e}")
+    def log_energy_reading(self):
+        """Log energy to file (queued to the I/O worker; pending saves coalesce)"""
+        if not self.history_loaded:
+            return
+        if self.rollover.day is not None:
+            # Close days at the boundary even when no frames are arriving
+            self.record_days(self.rollover.advance(time.time()))
+        current = self.rollover.current()
+        if current is None:
+            return
+        day, totals = current
+        self.history.set_day(day, totals, self.rollover.flags.get(day, DAY_MEASURED))
+        if not self.log_readable:
+            return
+        state = dict(self.rollover.state(), reading=[self.reading.light, self.reading.fan, self.reading.plug])
+        io_worker.submit("energy_log.save", self.write_history, self.history.copy(), state, coalesce=True)
 
     def load_log_data(self, days):
-        """Load historical data"""
-        today = datetime.datetime.now()
-        light_data = []
-        fan_data = []
-        plug_data = []
-        log_file = "energy_log.txt"
-        date_values = {}
-
-        if os.path.exists(log_file):
-            try:
-                with open(log_file, "r") as f:
-                    for line in f.readlines():
-                        if line.strip() and "light:" in line:
-                            try:
-                                parts = line.split()
-                                date = parts[0]
-                                light = float(parts[1].split(":")[1])
-                                fan = float(parts[2].split(":")[1])
-                                plug = float(parts[3].split(":")[1])
-                                date_values[date] = (light, fan, plug)
-                            except:
-                                pass
-            except:
-                pass
-
-        for i in range(days - 1, -1, -1):
-            date = (today - datetime.timedelta(days=i)).strftime("%Y-%m-%d")
-            light, fan, plug = date_values.get(date, (0.0, 0.0, 0.0))
-            light_data.append(light)
-            fan_data.append(fan)
-            plug_data.append(plug)
-
-        return light_data, fan_data, plug_data
+        """(light, fan, plug, flags) for the last `days` days; NaN where nothing was logged"""
+        data, flags = self.history.window_matrix(days, missing=np.nan)
+        return data[0], data[1], data[2], flags
 
     def update_graph_data(self):
         """Update graph"""
-        selection = self.time_combo.currentText()
-        if "7" in selection:
-            count = 7
-        elif "10" in selection:
-            count = 10
-        elif "30" in selection:
-            count = 30
-        else:
-            count = 60
-        
-        self.light_data, self.fan_data, self.plug_data = self.load_log_data(count)
+        count = GRAPH_RANGES.get(self.time_combo.currentText(), 60)
+        self.light_data, self.fan_data, self.plug_data, flags = self.load_log_data(count)
+        if self.history_loaded:
+            self.update_forecast()
         plot_type = self.data_combo.currentText()
-        self.graph_widget.update_data(self.light_data, self.fan_data, self.plug_data, plot_type)
+        self.graph_widget.update_data(self.light_data, self.fan_data, self.plug_data, plot_type, flags)
+        if self.view_mode == "graph":
+            self.graph_widget.prerender(self.adjacent_views(count, plot_type))
+
+    def adjacent_views(self, count, plot_type):
+        """The views one step away in either combo: the likeliest next taps"""
+        ranges = list(GRAPH_RANGES.values())
+        r, p = ranges.index(count) if count in ranges else 0, GRAPH_SERIES.index(plot_type)
+        steps = [(ranges[i], plot_type) for i in (r - 1, r + 1) if 0 <= i < len(ranges)]
+        steps += [(count, GRAPH_SERIES[i]) for i in (p - 1, p + 1) if 0 <= i < len(GRAPH_SERIES)]
+        return [(series, *self.load_log_data(days)) for days, series in steps]
 
     def update_graph(self):
         """Update graph on theme change"""
-        if hasattr(self, 'graph_widget'):
+        if hasattr(self, 'graph_widget') and self.view_mode == "graph":
             self.update_graph_data()
\ No newline at end of file
@@ -1,13 +1,19 @@
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
                                 QComboBox, QPushButton, QTimeEdit, QGridLayout,
                                 QGroupBox, QCheckBox, QScrollArea, QFrame, QSpinBox, QRadioButton, QButtonGroup)
-from PySide6.QtCore import Qt, QTime, QTimer, QDate, QDateTime
+from PySide6.QtCore import Qt, QTime, QTimer, QDate, QDateTime, Signal, Slot
 from PySide6.QtGui import QFont
 from themes import theme_manager, THEMES
 from mqtt_client import mqtt_client
-import json
-import os
+from scheduler import ScheduleRule
+from motion import ROOM_LIGHTS
+from metrics import metrics
+from logs import get_logger
+from settings_store import SettingsStore
 import datetime
+import time
+
+log = get_logger("timer")
 
 
 class TimerWidget(QFrame):
@@ -20,6 +26,8 @@ class TimerWidget(QFrame):
         self.timer_enabled = False
         self.timer_obj = None
         self.is_one_time = False
+        self.rule = None
+        self.fire_due = None  # time.monotonic() the armed timer should fire at
         self.setup_ui()
         self.update_next_action()
 
@@ -216,6 +224,7 @@ class TimerWidget(QFrame):
                 color: white;
             }}
         """)
+        self.duration_spinbox.valueChanged.connect(self.update_next_action)
         duration_layout.addWidget(self.duration_spinbox)
         duration_layout.addStretch()
         advanced_layout.addLayout(duration_layout)
@@ -239,12 +248,106 @@ class TimerWidget(QFrame):
                 height: 18px;
             }
         """)
+        self.power_saving.toggled.connect(self.update_next_action)
         power_layout.addWidget(self.power_saving)
         power_layout.addStretch()
         advanced_layout.addLayout(power_layout)
 
         main_layout.addWidget(advanced_card)
 
+        # Sleep Window
+        sleep_card = QFrame()
+        sleep_card.setStyleSheet(f"""
+            QFrame {{
+                background-color: rgba(40, 40, 50, 200);
+                border-radius: 10px;
+                padding: 12px;
+            }}
+        """)
+        sleep_layout = QVBoxLayout(sleep_card)
+        sleep_layout.setSpacing(10)
+
+        self.sleep_enabled = QCheckBox("😴 Sleep Window (keep OFF)")
+        self.sleep_enabled.setFont(QFont("Segoe UI", 11, QFont.Bold))
+        self.sleep_enabled.setStyleSheet("""
+            QCheckBox { 
+                background: transparent;
+                spacing: 8px;
+            }
+            QCheckBox::indicator {
+                width: 18px;
+                height: 18px;
+            }
+        """)
+        self.sleep_enabled.toggled.connect(self.update_next_action)
+        sleep_layout.addWidget(self.sleep_enabled)
+
+        sleep_time_layout = QHBoxLayout()
+        sleep_from_label = QLabel("From:")
+        sleep_from_label.setFont(QFont("Segoe UI", 10))
+        sleep_from_label.setStyleSheet("background: transparent;")
+        sleep_time_layout.addWidget(sleep_from_label)
+
+        self.sleep_start = QTimeEdit()
+        self.sleep_start.setDisplayFormat("hh:mm AP")
+        self.sleep_start.setTime(QTime(23, 0))
+        self.sleep_start.setFixedHeight(35)
+        self.sleep_start.timeChanged.connect(self.update_next_action)
+        sleep_time_layout.addWidget(self.sleep_start)
+
+        sleep_to_label = QLabel("To:")
+        sleep_to_label.setFont(QFont("Segoe UI", 10))
+        sleep_to_label.setStyleSheet("background: transparent;")
+        sleep_time_layout.addWidget(sleep_to_label)
+
+        self.sleep_end = QTimeEdit()
+        self.sleep_end.setDisplayFormat("hh:mm AP")
+        self.sleep_end.setTime(QTime(5, 0))
+        self.sleep_end.setFixedHeight(35)
+        self.sleep_end.timeChanged.connect(self.update_next_action)
+        sleep_time_layout.addWidget(self.sleep_end)
+        sleep_time_layout.addStretch()
+        sleep_layout.addLayout(sleep_time_layout)
+
+        # Only used when From and To are the same time
+        sleep_duration_layout = QHBoxLayout()
+        sleep_duration_label = QLabel("⏱️  Sleep length:")
+        sleep_duration_label.setFont(QFont("Segoe UI", 10))
+        sleep_duration_label.setStyleSheet("background: transparent;")
+        sleep_duration_layout.addWidget(sleep_duration_label)
+
+        self.sleep_duration = QSpinBox()
+        self.sleep_duration.setRange(0, 1439)
+        self.sleep_duration.setValue(0)
+        self.sleep_duration.setSuffix(" minutes")
+        self.sleep_duration.setFixedHeight(35)
+        self.sleep_duration.valueChanged.connect(self.update_next_action)
+        sleep_duration_layout.addWidget(self.sleep_duration)
+        sleep_duration_layout.addStretch()
+        sleep_layout.addLayout(sleep_duration_layout)
+
+        for time_edit in (self.sleep_start, self.sleep_end):
+            time_edit.setStyleSheet(f"""
+                QTimeEdit {{
+                    background-color: {theme["secondary1"]};
+                    border: 1px solid {theme["primary1"]};
+                    border-radius: 5px;
+                    padding: 3px;
+                    color: white;
+                }}
+            """)
+        self.sleep_duration.setStyleSheet(f"""
+            QSpinBox {{
+                background-color: {theme["secondary1"]};
+                border: 1px solid {theme["primary1"]};
+                border-radius: 5px;
+                padding: 3px;
+                color: white;
+            }}
+        """)
+
+        main_layout.addWidget(sleep_card)
+
         # ═══════════════════════════════════════════════
         # 🚶 MOTION SENSOR
         # ═══════════════════════════════════════════════
@@ -266,7 +369,7 @@ class TimerWidget(QFrame):
         motion_header.setStyleSheet(f"color: {theme['primary2']}; background: transparent;")
         motion_layout.addWidget(motion_header)
 
-        motion_desc = QLabel("When enabled, device turns ON for 5 minutes when motion is detected")
+        motion_desc = QLabel("When enabled, device turns ON when motion is detected and OFF once the room has been empty for the motion timeout")
         motion_desc.setFont(QFont("Segoe UI", 9))
         motion_desc.setStyleSheet("color: #aaa; background: transparent;")
         motion_desc.setWordWrap(True)
@@ -283,6 +386,9 @@ class TimerWidget(QFrame):
             }}
         """)
         self.motion_enabled.setChecked(False)
+        # Only lights a room's PIR sensor drives can follow motion
+        self.motion_enabled.setEnabled(any(self.appliance_id in lights for lights in ROOM_LIGHTS.values()))
+        self.motion_enabled.toggled.connect(self.motion_toggled)
         motion_layout.addWidget(self.motion_enabled)
 
         # Motion Status Label (shows when motion detected)
@@ -380,8 +486,26 @@ class TimerWidget(QFrame):
         self.is_one_time = self.one_time.isChecked()
         self.update_next_action()
 
+    def build_rule(self):
+        """Precompute the daily transition table from the current settings"""
+        self.rule = ScheduleRule(self.get_settings())
+        return self.rule
+
+    def next_transition(self):
+        """Return (action, target QTime, seconds until) or None"""
+        now = QTime.currentTime()
+        minute = now.hour() * 60 + now.minute()
+        rule = self.rule or self.build_rule()
+        transition = rule.next_transition(minute)
+        if transition is None:
+            return None
+        target_minute, action, minutes_until = transition
+        seconds_until = minutes_until * 60 - now.second()
+        return action, QTime(target_minute // 60, target_minute % 60), seconds_until
+
     def update_next_action(self):
         """Update the next scheduled action display"""
+        self.rule = None  # Settings changed, rebuild the transition table
         if not self.timer_enabled:
             self.next_action_label.setText("📢 Timer is inactive. Click 'Save Timer' to activate.")
             self.next_action_label.setStyleSheet("""
@@ -392,20 +516,11 @@ class TimerWidget(QFrame):
             """)
             return
 
-        current_time = QTime.currentTime()
-        on_time = self.on_time.time()
-        off_time = self.off_time.time()
-
-        # Determine next action
-        if current_time < on_time:
-            next_action = "ON"
-            next_time = on_time
-        elif current_time < off_time:
-            next_action = "OFF"
-            next_time = off_time
-        else:
-            next_action = "ON"
-            next_time = on_time
+        transition = self.next_transition()
+        if transition is None:
+            self.next_action_label.setText("📢 Schedule never changes state - check ON/OFF times.")
+            return
+        next_action, next_time, _ = transition
 
         mode_text = "today" if not self.is_one_time else "once"
         self.next_action_label.setText(
@@ -426,24 +541,12 @@ class TimerWidget(QFrame):
             self.countdown_label.setText("")
             return
 
-        current_time = QTime.currentTime()
-        on_time = self.on_time.time()
-        off_time = self.off_time.time()
-
         # Calculate seconds until next action
-        if current_time < on_time:
-            target_time = on_time
-            action = "ON"
-        elif current_time < off_time:
-            target_time = off_time
-            action = "OFF"
-        else:
-            target_time = on_time
-            action = "ON"
-
-        seconds_until = current_time.secsTo(target_time)
-        if seconds_until < 0:
-            seconds_until += 86400  # Add 24 hours
+        transition = self.next_transition()
+        if transition is None:
+            self.countdown_label.setText("")
+            return
+        action, _, seconds_until = transition
 
         hours = seconds_until // 3600
         minutes = (seconds_until % 3600) // 60
@@ -464,7 +567,7 @@ class TimerWidget(QFrame):
         self.start_timer()
         self.update_next_action()
         self.parent_screen.save_timer_settings()
-        print(f"✓ Timer activated for {self.appliance_name}")
+        log.info("Timer activated for %s", self.appliance_name)
 
     def reset_timer(self):
         """Reset and deactivate timer"""
@@ -474,60 +577,82 @@ class TimerWidget(QFrame):
         self.off_time.setTime(QTime(22, 0))
         self.duration_spinbox.setValue(0)
         self.power_saving.setChecked(False)
+        self.sleep_enabled.setChecked(False)
+        self.sleep_start.setTime(QTime(23, 0))
+        self.sleep_end.setTime(QTime(5, 0))
+        self.sleep_duration.setValue(0)
         self.repeat_daily.setChecked(True)
         self.update_next_action()
         self.countdown_label.setText("")
-        print(f"✓ Timer reset for {self.appliance_name}")
+        log.info("Timer reset for %s", self.appliance_name)
 
     def start_timer(self):
-        """Start the timer checking loop"""
+        """Start the single-shot transition timer"""
         if not self.timer_obj:
             self.timer_obj = QTimer(self)
+            self.timer_obj.setSingleShot(True)
+            self.timer_obj.setTimerType(Qt.PreciseTimer)
             self.timer_obj.timeout.connect(self.check_timer)
-            self.timer_obj.start(60000)  # Check every minute
+        self.parent_screen.active_rules[self.appliance_id] = self.build_rule()
         self.check_timer()
 
+    def arm_timer(self):
+        """Sleep until the next transition instead of polling every minute"""
+        transition = self.next_transition()
+        if transition is None or not self.timer_obj:
+            return
+        _, _, seconds_until = transition
+        seconds_until = max(seconds_until, 1)
+        self.fire_due = time.monotonic() + seconds_until
+        self.timer_obj.start(seconds_until * 1000)
+
     def stop_timer(self):
         """Stop the timer"""
         if self.timer_obj:
             self.timer_obj.stop()
             self.timer_obj = None
+        self.parent_screen.active_rules.pop(self.appliance_id, None)
 
     def check_timer(self):
-        """Check if it's time to execute the timer action"""
+        """Execute the transition the timer was armed for"""
+        if self.fire_due is not None:
+            metrics.scheduler_drift_seconds.observe(abs(time.monotonic() - self.fire_due))
+            self.fire_due = None
         if not self.timer_enabled:
             return
 
+        rule = self.rule or self.build_rule()
         current_time = QTime.currentTime()
-        on_time = self.on_time.time()
-        off_time = self.off_time.time()
-
-        # Check ON time
-        if current_time.hour() == on_time.hour() and current_time.minute() == on_time.minute():
-            self.execute_action("ON")
-            if self.is_one_time:
+        state = rule.is_transition(current_time.hour() * 60 + current_time.minute())
+        if state is not None:
+            self.execute_action(state)
+            # A one-time schedule is complete once its OFF has fired
+            if self.is_one_time and state == "OFF":
                 self.timer_enabled = False
+                self.stop_timer()
                 self.update_next_action()
+                self.parent_screen.save_timer_settings()
+                return
 
-        # Check OFF time
-        elif current_time.hour() == off_time.hour() and current_time.minute() == off_time.minute():
-            self.execute_action("OFF")
-            if self.is_one_time:
-                self.timer_enabled = False
-                self.update_next_action()
+        self.arm_timer()
+
+    def motion_toggled(self, checked):
+        self.parent_screen.set_motion(self.appliance_id, checked)
+        if not checked:
+            self.motion_status_label.hide()
+
+    def show_occupancy(self, room, occupied):
+        if occupied and self.motion_enabled.isChecked():
+            self.motion_status_label.setText(f"🚶 Motion in {room}: {self.appliance_name} ON")
+            self.motion_status_label.show()
+        else:
+            self.motion_status_label.hide()
 
     def execute_action(self, state):
         """Execute timer action (turn on/off appliance)"""
-        mqtt_mapping = {
-            "living_light_1": mqtt_client.send_light1,
-            "living_light_2": mqtt_client.send_light2,
-            "living_plug_1": mqtt_client.send_light3,
-            "living_plug_2": mqtt_client.send_light4,
-        }
-
-        if self.appliance_id in mqtt_mapping:
-            mqtt_mapping[self.appliance_id](state)
-            print(f"[TIMER] {self.appliance_name} turned {state}")
+        if mqtt_client.send_appliance(self.appliance_id, state):
+            log.info("%s turned %s", self.appliance_name, state,
+                     extra={"appliance": self.appliance_id, "state": state})
 
     def get_settings(self):
         """Get timer settings as dictionary"""
@@ -542,7 +667,8 @@ class TimerWidget(QFrame):
             "sleep_enabled": self.sleep_enabled.isChecked(),
             "sleep_start": self.sleep_start.time().toString("hh:mm"),
             "sleep_end": self.sleep_end.time().toString("hh:mm"),
-            "sleep_duration": self.sleep_duration.value()
+            "sleep_duration": self.sleep_duration.value(),
+            "motion_enabled": self.motion_enabled.isChecked(),
         }
 
     def load_settings(self, settings):
@@ -578,6 +704,9 @@ class TimerWidget(QFrame):
         
         if "sleep_duration" in settings:
             self.sleep_duration.setValue(settings["sleep_duration"])
+
+        if "motion_enabled" in settings:
+            self.motion_enabled.setChecked(settings["motion_enabled"])
         
         if self.timer_enabled:
             self.start_timer()
@@ -587,11 +716,18 @@ class TimerWidget(QFrame):
 
 class Screen3(QWidget):
     """Settings screen with cascading room/appliance selectors and timer"""
+    occupancy_changed = Signal(str, bool)  # (room, occupied) from the motion pipeline's threads
+
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
         self.timer_widgets = {}
+        self.active_rules = {}  # appliance_id -> ScheduleRule of running timers
+        self.motion_appliances = set()  # Appliances set to follow motion
+        self.motion_callback = None     # Callback(motion_appliances) when that set changes
+        self.occupancy_changed.connect(self.show_occupancy, Qt.QueuedConnection)
         self.current_timer = None
+        self.settings_store = SettingsStore()
         
         # Room and appliance definitions
         self.rooms = {
@@ -741,14 +877,7 @@ class Screen3(QWidget):
             
             appliance_id = appliance["id"]
             
-            # Create timer widget if not exists
-            if appliance_id not in self.timer_widgets:
-                timer_widget = TimerWidget(
-                    f"{room_name} - {appliance['name']}",
-                    appliance_id,
-                    self
-                )
-                self.timer_widgets[appliance_id] = timer_widget
+            self.get_timer_widget(appliance_id)
             
             # Hide all timers
             for widget in self.timer_widgets.values():
@@ -767,6 +896,26 @@ class Screen3(QWidget):
                 self.timer_widgets[appliance_id].show()
                 self.current_timer = self.timer_widgets[appliance_id]
 
+    def get_timer_widget(self, appliance_id):
+        """Timer widget for an appliance, created from its stored settings on first use"""
+        if appliance_id not in self.timer_widgets:
+            for room_name, room_data in self.rooms.items():
+                for appliance in room_data["appliances"]:
+                    if appliance["id"] == appliance_id:
+                        name = f"{room_name} - {appliance['name']}"
+                        break
+                else:
+                    continue
+                break
+            else:
+                return None
+            timer_widget = TimerWidget(name, appliance_id, self)
+            self.timer_widgets[appliance_id] = timer_widget
+            settings = self.settings_store.get(appliance_id)
+            if settings:
+                timer_widget.load_settings(settings)
+        return self.timer_widgets[appliance_id]
+
     def show_disabled_message(self):
         """Show message for disabled appliances"""
         # Clear layout
@@ -787,6 +936,10 @@ class Screen3(QWidget):
         """)
         self.timer_layout.addWidget(message)
 
+    def schedule_for(self, appliance_id):
+        """Active schedule rule for an appliance (safe from any thread)"""
+        return self.active_rules.get(appliance_id)
+
     def change_theme(self):
         """Change application theme"""
         theme_name = self.theme_combo.currentText()
@@ -801,36 +954,51 @@ class Screen3(QWidget):
                 self.main_window.screen2.fan_dial.update()
                 self.main_window.screen2.light_dial.update()
                 self.main_window.screen2.total_dial.update()
+            # Cached per theme, so switching back to a theme is a blit
+            self.main_window.screen2.update_graph()
         
         self.update()
 
     def save_timer_settings(self):
-        """Save all timer settings"""
-        settings = {}
+        """Save all timer settings (written in the background, coalesced)"""
         for appliance_id, widget in self.timer_widgets.items():
-            settings[appliance_id] = widget.get_settings()
-        
-        try:
-            with open("timer_settings.json", "w") as f:
-                json.dump(settings, f, indent=2)
-            print("✓ Timer settings saved")
-        except Exception as e:
-            print(f"✗ Error saving: {e}")
+            self.settings_store.set(appliance_id, widget.get_settings())
 
     def load_timer_settings(self):
-        """Load timer settings"""
-        if os.path.exists("timer_settings.json"):
-            try:
-                with open("timer_settings.json", "r") as f:
-                    settings = json.load(f)
-                
-                for appliance_id, widget in self.timer_widgets.items():
-                    if appliance_id in settings:
-                        widget.load_settings(settings[appliance_id])
-                
-                print("✓ Timer settings loaded")
-            except Exception as e:
-                print(f"✗ Error loading: {e}")
+        """Load timer settings and resume every enabled schedule"""
+        try:
+            settings = self.settings_store.load()
+        except (OSError, ValueError) as e:
+            log.error("Error loading timer settings: %s", e)
+            return
+        for appliance_id, appliance_settings in settings.items():
+            if appliance_settings.get("motion_enabled"):
+                self.motion_appliances.add(appliance_id)
+            if appliance_id in self.timer_widgets:
+                self.timer_widgets[appliance_id].load_settings(appliance_settings)
+            elif appliance_settings.get("enabled"):
+                self.get_timer_widget(appliance_id)
+        log.info("Timer settings loaded")
+
+    def set_motion(self, appliance_id, enabled):
+        """A timer widget's motion checkbox changed"""
+        before = set(self.motion_appliances)
+        if enabled:
+            self.motion_appliances.add(appliance_id)
+        else:
+            self.motion_appliances.discard(appliance_id)
+        if self.motion_appliances == before:
+            return
+        self.save_timer_settings()
+        if self.motion_callback:
+            self.motion_callback(set(self.motion_appliances))
+
+    @Slot(str, bool)
+    def show_occupancy(self, room, occupied):
+        for appliance_id in ROOM_LIGHTS.get(room, ()):
+            widget = self.timer_widgets.get(appliance_id)
+            if widget:
+                widget.show_occupancy(room, occupied)
 
     def disable_timer_for_appliance(self, appliance_id):
         """Disable timer for an appliance when manual override occurs"""
@@ -842,16 +1010,16 @@ class Screen3(QWidget):
                 widget.stop_timer()
                 
                 # Update UI indicators
-                widget.status_indicator.setStyleSheet("""
+                widget.next_action_label.setStyleSheet("""
                     background-color: rgba(200, 100, 50, 200);
                     border-radius: 8px;
                     padding: 8px;
                     color: white;
                     font-weight: bold;
                 """)
-                widget.status_indicator.setText("⚠️ TIMER DISABLED - Manual Control Active")
+                widget.next_action_label.setText("⚠️ TIMER DISABLED - Manual Control Active")
                 
                 # Save the disabled state
                 self.save_timer_settings()
                 
-                print(f"⚠️ Timer disabled for {appliance_id} due to manual override")
\ No newline at end of file
+                log.warning("Timer disabled for %s due to manual override", appliance_id)
\ No newline at end of file
@@ -0,0 +1,151 @@
+import collections
+import time
+from metrics import metrics
+
+# Appliances whose relays feed each current sensor (Screen3 ids). Fans on
+# L2 are not switchable yet, so L2 is never known to be fully OFF.
+CIRCUIT_APPLIANCES = {
+    "L1": ["living_light_1", "living_light_2", "living_plug_1", "living_plug_2"],
+    "L2": [],
+}
+# Bit in the frame's timerDisabled mask set when the ESP32 saw a manual
+# override of that relay, which leaves its real state unknown here
+OVERRIDE_BITS = {"living_light_1": 0, "living_light_2": 1, "living_plug_1": 2, "living_plug_2": 3}
+
+EWMA_ALPHA = 0.05        # ~20 s baseline at 1 Hz
+MEDIAN_WINDOW = 5        # Spike filter ahead of the baseline
+STEP_SIGMAS = 4.0        # Step = this many baseline deviations away...
+MIN_STEP = 0.15          # ...and at least this many Amps
+STEP_CONFIRM = 3         # Consecutive frames before a step is reported
+OFF_CURRENT = 0.05       # Amps still drawn by a circuit whose relays are all OFF
+OFF_DRAW_SECONDS = 60.0
+DROPOUT_SECONDS = 10.0   # No frame for this long = sensor/ESP32 dropout
+SURGE_AMPS = 5.0         # 100 ms peak this far above the 1 Hz baseline = surge
+
+
+class Alert:
+    __slots__ = ("kind", "circuit", "message", "time")
+
+    def __init__(self, kind, circuit, message, when):
+        self.kind = kind          # "step", "surge", "off_draw", "dropout", "recovered"
+        self.circuit = circuit    # "L1", "L2" or None for the whole device
+        self.message = message
+        self.time = when
+
+
+class CircuitBaseline:
+    """Rolling median-filtered EWMA mean/variance of one circuit's current"""
+    def __init__(self, alpha=EWMA_ALPHA):
+        self.alpha = alpha
+        self.window = collections.deque(maxlen=MEDIAN_WINDOW)
+        self.mean = None
+        self.var = 0.0
+        self.pending = 0          # Frames in a row outside the band
+        self.off_since = None     # When current was first seen with every relay OFF
+
+    def filtered(self, current):
+        self.window.append(current)
+        return sorted(self.window)[len(self.window) // 2]
+
+    def update(self, value):
+        """Fold a filtered value in; returns the deviation if it is a confirmed step"""
+        if self.mean is None:
+            self.mean = value
+            return None
+        deviation = value - self.mean
+        band = max(STEP_SIGMAS * self.var ** 0.5, MIN_STEP)
+        if abs(deviation) > band:
+            self.pending += 1
+            if self.pending < STEP_CONFIRM:
+                return None
+            # Confirmed: jump to the new level instead of creeping toward it
+            self.pending = 0
+            self.mean = value
+            self.var = 0.0
+            return deviation
+        self.pending = 0
+        self.mean += self.alpha * deviation
+        self.var = (1 - self.alpha) * (self.var + self.alpha * deviation * deviation)
+        return None
+
+
+class AnomalyDetector:
+    """Streaming per-circuit checks over the 1 Hz current frames
+
+    Each frame costs O(1) time and memory: no history is buffered. Alerts
+    go to `alert_callback` once when raised; off-draw and dropout alerts
+    are raised again only after they have cleared.
+    """
+    def __init__(self, relay_state):
+        self.relay_state = relay_state    # appliance_id -> "ON"/"OFF"/None
+        self.baselines = {c: CircuitBaseline() for c in CIRCUIT_APPLIANCES}
+        self.active = set()               # (kind, circuit) currently raised
+        self.last_frame = None
+        self.alert_callback = None
+
+    def circuit_off(self, circuit, sample):
+        """True only when every relay on the circuit is known to be OFF"""
+        appliances = CIRCUIT_APPLIANCES[circuit]
+        return bool(appliances) and all(
+            self.relay_state(a) == "OFF" and not sample.timer_disabled & (1 << OVERRIDE_BITS[a])
+            for a in appliances)
+
+    def raise_alert(self, kind, circuit, message, when):
+        self.active.add((kind, circuit))
+        metrics.alerts.inc(kind=kind)
+        if self.alert_callback:
+            self.alert_callback(Alert(kind, circuit, message, when))
+
+    def feed(self, sample):
+        now = sample.time
+        if ("dropout", None) in self.active:
+            self.active.discard(("dropout", None))
+            self.raise_alert("recovered", None, f"ESP32 frames resumed after {now - self.last_frame:.0f} s", now)
+            self.active.discard(("recovered", None))
+        self.last_frame = now
+
+        for circuit, current in (("L1", sample.l1_current), ("L2", sample.l2_current)):
+            baseline = self.baselines[circuit]
+            value = baseline.filtered(current)
+            step = baseline.update(value)
+            if step is not None:
+                self.raise_alert("step", circuit, f"{circuit} current stepped {step:+.2f} A to {value:.2f} A", now)
+                self.active.discard(("step", circuit))  # Steps are events, not states
+
+            # The ESP32's own motion handling may hold Light 1 ON
+            if value > OFF_CURRENT and self.circuit_off(circuit, sample) and not (circuit == "L1" and sample.motion_active):
+                if baseline.off_since is None:
+                    baseline.off_since = now
+                elif now - baseline.off_since >= OFF_DRAW_SECONDS and ("off_draw", circuit) not in self.active:
+                    self.raise_alert("off_draw", circuit,
+                                     f"{circuit} draws {value:.2f} A with every switch OFF "
+                                     f"for {now - baseline.off_since:.0f} s (stuck relay?)", now)
+            else:
+                baseline.off_since = None
+                self.active.discard(("off_draw", circuit))
+
+    def feed_highres(self, readings):
+        """Look for surges in high-res readings (HighResHistory.latest())
+
+        A peak lasting one 100 ms window barely moves the 1 Hz RMS, so it
+        is compared against the circuit's baseline here instead.
+        """
+        for circuit, column in (("L1", "peak1"), ("L2", "peak2")):
+            baseline = self.baselines[circuit]
+            peaks = readings[column]
+            if baseline.mean is None or not len(peaks):
+                continue
+            index = int(peaks.argmax())
+            if peaks[index] - baseline.mean > SURGE_AMPS:
+                self.raise_alert("surge", circuit,
+                                 f"{circuit} surged to {peaks[index]:.2f} A peak "
+                                 f"over a {baseline.mean:.2f} A baseline", float(readings["time"][index]))
+                self.active.discard(("surge", circuit))  # Events, like steps
+
+    def check(self, now=None):
+        """Raise a dropout alert if frames stopped; call periodically"""
+        now = now if now is not None else time.time()
+        if self.last_frame is None or ("dropout", None) in self.active:
+            return
+        if now - self.last_frame >= DROPOUT_SECONDS:
+            self.raise_alert("dropout", None, f"No ESP32 frame for {now - self.last_frame:.0f} s", now)
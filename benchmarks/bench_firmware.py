@@ -0,0 +1,111 @@
+"""Firmware benchmark: ESP32_Smart_Home_FINAL.ino compiled against the host
+simulation in benchmarks/firmware_sim
+
+Builds the sketch with g++ and runs it for a stretch of simulated time, then
+reports relay command latency, RMS and energy accuracy against the injected
+waveform and how much an outage costs. Compare against an older sketch with
+--baseline (a git revision) or --sketch:
+
+    python benchmarks/bench_firmware.py --seconds 60 --outage 10:20 --baseline HEAD~1
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIM_DIR = os.path.join(ROOT, "benchmarks", "firmware_sim")
+SKETCH = os.path.join(ROOT, "ESP32_Smart_Home_FINAL.ino")
+CXX = os.environ.get("CXX", "g++")
+
+
+def build(sketch, workdir, name):
+    """Compile a sketch with the sim into workdir, returning the binary path"""
+    binary = os.path.join(workdir, name)
+    subprocess.run([CXX, "-std=gnu++17", "-O2", "-w", "-I", SIM_DIR, "-include", "Arduino.h",
+                    "-x", "c++", sketch, "-x", "none", os.path.join(SIM_DIR, "sim.cpp"),
+                    "-o", binary], check=True)
+    return binary
+
+
+def baseline_sketch(rev, workdir):
+    """Write the sketch as of a git revision into workdir"""
+    source = subprocess.run(["git", "show", f"{rev}:ESP32_Smart_Home_FINAL.ino"], cwd=ROOT,
+                            check=True, capture_output=True).stdout
+    path = os.path.join(workdir, "baseline.ino")
+    with open(path, "wb") as f:
+        f.write(source)
+    return path
+
+
+def run(binary, args):
+    command = [binary, "--seconds", str(args.seconds), "--l1", str(args.l1), "--l2", str(args.l2),
+               "--command-ms", str(args.command_ms), "--seed", str(args.seed)]
+    if args.outage:
+        command += ["--outage", args.outage]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_report(results, args):
+    names = list(results)
+    print("═══════════ FIRMWARE BENCHMARK ═══════════")
+    print(f"{args.seconds:.0f} s simulated, L1 {args.l1} A, L2 {args.l2} A, "
+          f"a command every ~{args.command_ms:.0f} ms"
+          + (f", broker down {args.outage}" if args.outage else ""))
+    rows = [
+        ("commands", lambda r: f"{r['commands']} ok, {r['commands_lost']} lost, "
+                               f"{r['commands_pending']} queued"),
+        ("latency p50 ms", lambda r: f"{r['latency_ms']['p50']:.3f}"),
+        ("latency p90 ms", lambda r: f"{r['latency_ms']['p90']:.3f}"),
+        ("latency p99 ms", lambda r: f"{r['latency_ms']['p99']:.3f}"),
+        ("latency max ms", lambda r: f"{r['latency_ms']['max']:.3f}"),
+        ("RMS error L1 %", lambda r: f"{r['rms_error_pct']['L1']:.3f}"),
+        ("RMS error L2 %", lambda r: f"{r['rms_error_pct']['L2']:.3f}"),
+        ("energy error %", lambda r: f"{r['energy_error_pct']:.3f}"),
+        ("ADC reads/s", lambda r: f"{r['adc_reads_per_second']}"),
+        ("frames", lambda r: f"{r['frames']} ({r['publish_rejected']} rejected)"),
+        ("catch-up", lambda r: f"{r['catchup_records']} records in {r['catchup_frames']} frames"),
+    ]
+    print(f"  {'':16}" + "".join(f"{name:>28}" for name in names))
+    for label, cell in rows:
+        print(f"  {label:16}" + "".join(f"{cell(results[name]):>28}" for name in names))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sketch", default=SKETCH, help="sketch to benchmark (default: the repo's)")
+    parser.add_argument("--baseline", help="also benchmark the sketch at this git revision")
+    parser.add_argument("--seconds", type=float, default=30.0, help="simulated seconds")
+    parser.add_argument("--outage", help="broker outage as START:SECONDS")
+    parser.add_argument("--l1", type=float, default=1.2, help="L1 load current in amps RMS")
+    parser.add_argument("--l2", type=float, default=0.6, help="L2 load current in amps RMS")
+    parser.add_argument("--command-ms", type=float, default=1000.0, help="mean gap between relay commands")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    if shutil.which(CXX) is None:
+        sys.exit(f"{CXX} not found; set CXX to a C++17 compiler")
+    workdir = tempfile.mkdtemp(prefix="bench_firmware_")
+    sketches = {}
+    if args.baseline:
+        sketches[args.baseline] = baseline_sketch(args.baseline, workdir)
+    sketches["current" if args.sketch == SKETCH else os.path.basename(args.sketch)] = args.sketch
+
+    results = {}
+    for index, (name, sketch) in enumerate(sketches.items()):
+        results[name] = run(build(sketch, workdir, f"sim{index}"), args)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results, args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
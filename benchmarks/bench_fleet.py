@@ -0,0 +1,101 @@
+"""Fleet benchmark: thousands of 1 Hz home streams → FleetCollector shards
+
+Replays pre-built energy frames for --homes homes over --seconds of
+simulated time, as fast as the collector takes them, and checks the
+rolled-up kWh against what the simulated counters advanced by. The
+"inline" row is a single ShardStore in this process, without
+multiprocessing:
+
+    python benchmarks/bench_fleet.py --homes 5000 --seconds 20 --workers 1 2 4
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from simulator import VOLTAGE_MAINS, energy_frame
+from fleet import FleetCollector, ShardStore, load_day, rollup
+
+
+def build_frames(homes, seconds):
+    """[(home, received, payload)] in arrival order, plus the expected kWh"""
+    noon = datetime.datetime.combine(datetime.date.today(), datetime.time(12)).timestamp()
+    frames = []
+    expected = 0.0
+    for home in range(homes):
+        current1, current2 = 0.5 + home % 7 * 0.3, 0.2 + home % 3 * 0.1
+        # As the frames carry it: counters at %.6f, the first one is zero
+        expected += sum(round(current * VOLTAGE_MAINS / 3.6e6 * (seconds - 1), 6)
+                        for current in (current1, current2))
+    for second in range(seconds):
+        for home in range(homes):
+            current1, current2 = 0.5 + home % 7 * 0.3, 0.2 + home % 3 * 0.1
+            energy1 = current1 * VOLTAGE_MAINS / 3.6e6 * second
+            energy2 = current2 * VOLTAGE_MAINS / 3.6e6 * second
+            frames.append((f"home{home:05d}", noon + second,
+                           energy_frame(current1, energy1, current2, energy2)))
+    return frames, expected
+
+
+def bench_inline(frames):
+    store = ShardStore()
+    start = time.perf_counter()
+    for home, received, payload in frames:
+        store.add(home, received, payload)
+    elapsed = time.perf_counter() - start
+    return elapsed, rollup(store.table())
+
+
+def bench_workers(frames, workers, directory):
+    collector = FleetCollector(workers, directory, interval=3600)
+    collector.start()
+    start = time.perf_counter()
+    for home, received, payload in frames:
+        collector.dispatch(home, payload, received)
+    collector.stop()  # Returns once every shard has drained and saved
+    elapsed = time.perf_counter() - start
+    totals = rollup(load_day(datetime.date.today().isoformat(), directory))
+    shutil.rmtree(directory, ignore_errors=True)
+    return elapsed, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--homes", type=int, default=2000, help="simulated homes (1 Hz each)")
+    parser.add_argument("--seconds", type=int, default=10, help="seconds of frames per home")
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4], help="shard counts to try")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    frames, expected = build_frames(args.homes, args.seconds)
+    runs = {"inline": bench_inline(frames)}
+    for workers in args.workers:
+        runs[f"{workers} worker(s)"] = bench_workers(frames, workers, tempfile.mkdtemp(prefix="bench_fleet_"))
+
+    results = {}
+    print("═══════════ FLEET BENCHMARK ═══════════")
+    print(f"{args.homes} homes × {args.seconds} s = {len(frames)} frames, {os.cpu_count()} CPU(s)")
+    for name, (elapsed, totals) in runs.items():
+        kwh = totals["l1_kwh"] + totals["l2_kwh"]
+        results[name] = {
+            "frames_per_sec": len(frames) / elapsed,
+            "homes": totals["homes"],
+            "kwh_error_pct": 100.0 * (kwh - expected) / expected,
+        }
+        print(f"  {name:12} {results[name]['frames_per_sec']:10.0f} frames/s  "
+              f"{totals['homes']} homes  kWh error {results[name]['kwh_error_pct']:+.4f}%")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Ingest benchmark: simulated ESP32 → broker → MQTTClient.on_message →
+Screen2.handle_energy_update → log_energy_reading
+
+Runs headless against an in-process broker in a scratch directory, so the
+real energy_log.txt is never touched:
+
+    python benchmarks/bench_ingest.py --nodes 4 --rate 10 --duration 10
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from broker import Broker
+from simulator import ENERGY_TOPIC, energy_frame, start_nodes
+
+
+class Message:
+    """Stand-in for paho's MQTTMessage in the in-process phase"""
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def proc_io():
+    """(rchar, wchar) for this process, or None off Linux"""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def run_network_phase(app, screen, mqtt_client, broker, args):
+    """End-to-end through the broker with the paho network thread"""
+    sent_times = {}
+    latencies = []
+    handle = screen.handle_energy_update
+
+    def timed_callback(sample):
+        handle(sample)
+        sent = sent_times.pop(round(sample.l1_energy * 1e6), None)
+        if sent is not None:
+            latencies.append(time.perf_counter() - sent)
+
+    mqtt_client.energy_callback = timed_callback
+    start = time.perf_counter()
+    nodes = start_nodes(args.nodes, broker.host, broker.port, args.rate, args.duration, sent_times)
+    expected = int(args.nodes * args.rate * args.duration)
+
+    deadline = start + args.duration + 5.0
+    while time.perf_counter() < deadline:
+        app.processEvents()
+        if all(not n.thread.is_alive() for n in nodes) and len(latencies) >= sum(n.published for n in nodes):
+            break
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    published = sum(n.published for n in nodes)
+    for node in nodes:
+        node.stop()
+    mqtt_client.energy_callback = handle
+
+    return {
+        "nodes": args.nodes,
+        "rate_hz": args.rate,
+        "expected": expected,
+        "published": published,
+        "received": len(latencies),
+        "msgs_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p90": percentile(latencies, 90) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies, default=0.0) * 1000,
+            "mean": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        },
+    }
+
+
+def run_inprocess_phase(app, screen, mqtt_client, count):
+    """Direct on_message calls: throughput, allocations and log I/O per message"""
+    messages = [Message(ENERGY_TOPIC, energy_frame(0.5 + (i % 7) * 0.01, i * 1e-6, 0.2, 0.0))
+                for i in range(count)]
+
+    # Throughput
+    start = time.perf_counter()
+    for i, msg in enumerate(messages):
+        mqtt_client.on_message(None, None, msg)
+        if i % 100 == 0:
+            app.processEvents()
+    elapsed = time.perf_counter() - start
+    app.processEvents()
+
+    # Log I/O
+    io_before = proc_io()
+    for msg in messages:
+        mqtt_client.on_message(None, None, msg)
+    app.processEvents()
+    io_after = proc_io()
+
+    # Allocations
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    retained_before = tracemalloc.get_traced_memory()[0]
+    peaks = []
+    for msg in messages:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        mqtt_client.on_message(None, None, msg)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    retained_after = tracemalloc.get_traced_memory()[0]
+    blocks_after = sys.getallocatedblocks()
+    tracemalloc.stop()
+    app.processEvents()
+
+    result = {
+        "messages": count,
+        "msgs_per_sec": count / elapsed if elapsed else 0.0,
+        "us_per_msg": elapsed / count * 1e6,
+        "peak_alloc_bytes_per_msg": statistics.fmean(peaks),
+        "retained_bytes_per_msg": (retained_after - retained_before) / count,
+        "net_blocks_per_msg": (blocks_after - blocks_before) / count,
+    }
+    if io_before and io_after:
+        result["log_read_bytes_per_msg"] = (io_after[0] - io_before[0]) / count
+        result["log_write_bytes_per_msg"] = (io_after[1] - io_before[1]) / count
+    return result
+
+
+def print_report(results):
+    net = results["network"]
+    local = results["inprocess"]
+    print("═══════════ INGEST BENCHMARK ═══════════")
+    print(f"Network: {net['nodes']} node(s) × {net['rate_hz']} Hz, "
+          f"{net['received']}/{net['published']} frames received")
+    print(f"  throughput   {net['msgs_per_sec']:.1f} msg/s")
+    lat = net["latency_ms"]
+    print(f"  latency ms   p50 {lat['p50']:.3f} | p90 {lat['p90']:.3f} | "
+          f"p99 {lat['p99']:.3f} | max {lat['max']:.3f}")
+    print(f"In-process: {local['messages']} frames")
+    print(f"  throughput   {local['msgs_per_sec']:.1f} msg/s ({local['us_per_msg']:.1f} µs/msg)")
+    print(f"  allocations  peak {local['peak_alloc_bytes_per_msg']:.0f} B/msg, "
+          f"retained {local['retained_bytes_per_msg']:.1f} B/msg, "
+          f"net blocks {local['net_blocks_per_msg']:.2f}/msg")
+    if "log_write_bytes_per_msg" in local:
+        print(f"  log I/O      read {local['log_read_bytes_per_msg']:.0f} B/msg, "
+              f"write {local['log_write_bytes_per_msg']:.0f} B/msg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=1, help="simulated ESP32 count")
+    parser.add_argument("--rate", type=float, default=1.0, help="frames per second per node")
+    parser.add_argument("--duration", type=float, default=5.0, help="network phase seconds")
+    parser.add_argument("--messages", type=int, default=2000, help="in-process phase frames")
+    parser.add_argument("--history-days", type=int, default=365,
+                        help="days of pre-existing energy_log.txt history")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    workdir = tempfile.mkdtemp(prefix="bench_ingest_")
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    with Broker() as broker:
+        os.environ["MQTT_BROKER"] = broker.host
+        os.environ["MQTT_PORT"] = str(broker.port)
+        os.chdir(workdir)
+        write_history(args.history_days)
+
+        from PySide6.QtWidgets import QApplication
+        app = QApplication.instance() or QApplication([])
+        from mqtt_client import mqtt_client
+        from Screen2 import Screen2
+        screen = Screen2(None)
+        time.sleep(0.2)  # Let paho finish CONNECT/SUBSCRIBE
+
+        results = {
+            "network": run_network_phase(app, screen, mqtt_client, broker, args),
+            "inprocess": run_inprocess_phase(app, screen, mqtt_client, args.messages),
+        }
+        from io_worker import io_worker
+        io_worker.stop()  # Finish queued log writes before the broker goes away
+
+    print_report(results)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def write_history(days):
+    """Seed the scratch directory with a realistic energy_log.txt"""
+    import datetime
+    from energy_history import LOG_HEADER
+    today = datetime.date.today()
+    with open("energy_log.txt", "w") as f:
+        f.write(LOG_HEADER + "\n")
+        for i in range(days, 0, -1):
+            date = (today - datetime.timedelta(days=i)).strftime("%Y-%m-%d")
+            f.write(f"{date} light:0.148800 fan:0.000000 plug:0.099200 total:0.248000\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Query benchmark: EnergyQuery latency over years of history
+
+Builds --years of daily history, the tariff's 15-minute bins for the last
+--bin-days days and full second/minute rings, then times each resolution
+and aggregate in-process and through the local HTTP endpoint:
+
+    python benchmarks/bench_query.py --years 10 --repeats 50
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from energy_history import ApplianceReading, EnergyHistory
+from energy_query import EnergyQuery, MINUTE_HISTORY, start_query_server
+from tariff import BINS_PER_DAY
+
+
+def build_engine(years, bin_days):
+    today = datetime.date.today()
+    history = EnergyHistory()
+    rng = np.random.default_rng(1)
+    for i in range(years * 365, -1, -1):
+        light, fan, plug = rng.uniform(0.5, 3.0, 3)
+        history.set_day(today - datetime.timedelta(days=i), ApplianceReading(light, fan, plug))
+    bins = {today - datetime.timedelta(days=i): rng.uniform(0.0, 0.05, (3, BINS_PER_DAY))
+            for i in range(bin_days)}
+    engine = EnergyQuery(history, bins)
+    # Fill the rings directly: one interval per minute for the minute ring's
+    # span, then 1 s intervals for the last day
+    now = time.time()
+    reading = ApplianceReading(1e-5, 4e-6, 7e-6)
+    for t in np.arange(now - MINUTE_HISTORY * 60, now - 86400, 60.0):
+        engine.minutes.add(t, t + 60.0, ApplianceReading(6e-4, 2.4e-4, 4.2e-4))
+    for t in np.arange(now - 86400, now, 1.0):
+        engine.add(t, t + 1.0, reading)
+    return engine, now
+
+
+def cases(now):
+    day = 86400
+    return {
+        "second, 1 h series": (now - 3600, now, "second", None),
+        "second, 1 day p99": (now - day, now, "second", "p99"),
+        "minute, 1 day series": (now - day, now, "minute", None),
+        "minute, 30 days max": (now - 30 * day + 60, now, "minute", "max"),
+        "hour, 1 week series": (now - 7 * day, now, "hour", None),
+        "hour, 60 days mean": (now - 59 * day, now, "hour", "mean"),
+        "day, 1 month series": (now - 30 * day, now, "day", None),
+        "day, all history sum": (now - 400 * 365 * day / 10, now, "day", "sum"),
+    }
+
+
+def summarize(samples):
+    ms = [s * 1000.0 for s in samples]
+    return {"p50_ms": statistics.median(ms), "max_ms": max(ms)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=10, help="years of daily history")
+    parser.add_argument("--bin-days", type=int, default=62, help="days of 15-minute bins")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    build_start = time.perf_counter()
+    engine, now = build_engine(args.years, args.bin_days)
+    print(f"Built {len(engine.history)} days of history in {time.perf_counter() - build_start:.1f} s")
+    server = start_query_server(engine, port=0)
+    base = f"http://{server.server_address[0]}:{server.server_address[1]}/query?"
+
+    results = {}
+    print("═══════════ QUERY BENCHMARK ═══════════")
+    print(f"  {'':24}{'in-process p50':>16}{'max':>10}{'HTTP p50':>12}{'max':>10}")
+    for name, (start, end, resolution, agg) in cases(now).items():
+        series = ("light", "fan", "plug", "total")
+        local = []
+        for _ in range(args.repeats):
+            t0 = time.perf_counter()
+            engine.query(start, end, resolution, series, agg)
+            local.append(time.perf_counter() - t0)
+        params = {"start": start, "end": end, "resolution": resolution, "series": ",".join(series)}
+        if agg:
+            params["agg"] = agg
+        url = base + urllib.parse.urlencode(params)
+        remote = []
+        for _ in range(args.repeats):
+            t0 = time.perf_counter()
+            with urllib.request.urlopen(url) as response:
+                json.loads(response.read())
+            remote.append(time.perf_counter() - t0)
+        results[name] = {"in_process": summarize(local), "http": summarize(remote)}
+        r = results[name]
+        print(f"  {name:24}{r['in_process']['p50_ms']:16.3f}{r['in_process']['max_ms']:10.3f}"
+              f"{r['http']['p50_ms']:12.3f}{r['http']['max_ms']:10.3f}")
+    server.shutdown()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Supervisor benchmark: how long the panel is gone after a freeze or crash
+
+Runs the real panel headless under Supervisor, against an in-process
+broker in a scratch directory. A freeze is simulated with SIGSTOP (the
+GUI thread stops beating, like a blocked event loop) and a crash with
+SIGKILL. Each is timed with and without the warm standby:
+
+    python benchmarks/bench_supervisor.py --rounds 5 --stall 2.0
+
+"restart" is from the supervisor acting to the new panel's first
+heartbeat; "outage" is from the fault to that heartbeat, so for a freeze
+it includes the stall timeout.
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from broker import Broker
+from supervisor import Supervisor
+
+
+def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def run_scenario(fault, warm, args):
+    supervisor = Supervisor(stall=args.stall, startup=args.startup, warm=warm)
+    recoveries = []
+    supervisor.on_recovered = lambda seconds: recoveries.append((seconds, time.monotonic()))
+    thread = threading.Thread(target=supervisor.run, daemon=True)
+    thread.start()
+    restarts, outages = [], []
+    try:
+        if not wait_for(lambda: supervisor.last_count > 0, args.startup):
+            raise RuntimeError("panel never started")
+        for _ in range(args.rounds):
+            time.sleep(args.settle)  # Panel settles, standby finishes importing
+            before = len(recoveries)
+            faulted = time.monotonic()
+            os.kill(supervisor.child.pid, fault)
+            if not wait_for(lambda: len(recoveries) > before, args.stall + args.startup):
+                raise RuntimeError("panel did not come back")
+            seconds, recovered = recoveries[-1]
+            restarts.append(seconds)
+            outages.append(recovered - faulted)
+    finally:
+        supervisor.running = False
+        thread.join()
+    return {
+        "restart_p50_s": statistics.median(restarts), "restart_max_s": max(restarts),
+        "outage_p50_s": statistics.median(outages), "outage_max_s": max(outages),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5, help="faults per scenario")
+    parser.add_argument("--stall", type=float, default=2.0, help="seconds without a heartbeat before a restart")
+    parser.add_argument("--startup", type=float, default=30.0)
+    parser.add_argument("--settle", type=float, default=3.0, help="seconds between faults")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    broker = Broker()
+    broker.start()
+    os.environ.update({
+        "MQTT_BROKER": broker.host, "MQTT_PORT": str(broker.port),
+        "QT_QPA_PLATFORM": "offscreen", "LOG_LEVEL": "WARNING",
+        "METRICS_PORT": "0", "QUERY_PORT": "0",
+    })
+    os.chdir(tempfile.mkdtemp(prefix="bench_supervisor_"))
+
+    results = {}
+    for fault_name, fault in (("freeze", signal.SIGSTOP), ("crash", signal.SIGKILL)):
+        for warm in (True, False):
+            name = f"{fault_name}, {'warm standby' if warm else 'cold start'}"
+            results[name] = run_scenario(fault, warm, args)
+
+    print("═══════════ SUPERVISOR BENCHMARK ═══════════")
+    print(f"{args.rounds} faults per row, stall timeout {args.stall:.1f} s, {os.cpu_count()} CPU(s)")
+    print(f"  {'':26}{'restart p50':>12}{'max':>8}{'outage p50':>12}{'max':>8}")
+    for name, r in results.items():
+        print(f"  {name:26}{r['restart_p50_s']:12.2f}{r['restart_max_s']:8.2f}"
+              f"{r['outage_p50_s']:12.2f}{r['outage_max_s']:8.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""UI responsiveness benchmark: tap-to-publish, message-to-pixel and
+GraphWidget.plot render time, across screens and themes
+
+Runs under QT_QPA_PLATFORM=offscreen against an in-process broker:
+
+    python benchmarks/bench_ui.py --taps 50 --frames 100
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ingest import Message, percentile
+from broker import Broker
+from simulator import ENERGY_TOPIC, energy_frame
+
+RANGES = ["Last 7 days", "Last 10 days", "Last 30 days", "Last 60 days"]
+MODES = ["LIGHT", "FAN", "PLUG", "TOTAL", "ALL"]
+SCREENS = ["Screen1", "Screen2", "Screen3"]
+
+
+def summarize(samples):
+    """Percentiles in milliseconds"""
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50) * 1000,
+        "p90": percentile(samples, 90) * 1000,
+        "p99": percentile(samples, 99) * 1000,
+        "max": max(samples, default=0.0) * 1000,
+    }
+
+
+def wait_for(app, condition, timeout=1.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        app.processEvents()
+    return condition()
+
+
+def bench_tap_to_publish(app, window, mqtt_client, taps):
+    """Synthetic touch on each connected ApplianceCard → client.publish()"""
+    from PySide6.QtCore import Qt
+    from PySide6.QtTest import QTest
+
+    published = []
+    original_publish = mqtt_client.client.publish
+
+    def timed_publish(*args, **kwargs):
+        published.append(time.perf_counter())
+        return original_publish(*args, **kwargs)
+
+    mqtt_client.client.publish = timed_publish
+    window.stack.setCurrentIndex(0)
+    window.screen1.open_room("Living Room")
+    cards = [c for c in window.screen1.appliance_cards if c.mqtt_method is not None]
+    samples = []
+    try:
+        for i in range(taps):
+            card = cards[i % len(cards)]
+            published.clear()
+            start = time.perf_counter()
+            QTest.mousePress(card, Qt.LeftButton)
+            if published:
+                samples.append(published[0] - start)
+            QTest.mouseRelease(card, Qt.LeftButton)
+            app.processEvents()
+    finally:
+        mqtt_client.client.publish = original_publish
+    return samples
+
+
+class PaintProbe:
+    """Records when a widget next paints"""
+    def __init__(self, widget):
+        from PySide6.QtCore import QObject, QEvent
+
+        class Filter(QObject):
+            def eventFilter(filter_self, obj, event):
+                if event.type() == QEvent.Paint and self.painted is None:
+                    self.painted = time.perf_counter()
+                return False
+
+        self.painted = None
+        self.widget = widget
+        self.filter = Filter()
+        widget.installEventFilter(self.filter)
+
+    def remove(self):
+        self.widget.removeEventFilter(self.filter)
+
+
+def bench_message_to_pixel(app, window, mqtt_client, frames, screen_index):
+    """Energy frame delivered on a network-like thread → queued sample → setValue → repaint"""
+    screen2 = window.screen2
+    display = screen2.total_display
+    probe = PaintProbe(display.value_label)
+    window.stack.setCurrentIndex(screen_index)
+    if screen_index == 1:
+        screen2.switch_view("live")
+    app.processEvents()
+
+    # A NaN sentinel in the display shows when setValue has run
+    to_value = []
+    to_pixel = []
+    for i in range(frames):
+        msg = Message(ENERGY_TOPIC, energy_frame(0.3 + (i % 11) * 0.05, i * 1e-6, 0.1 + (i % 5) * 0.02, 0.0))
+        display._value = float("nan")
+        probe.painted = None
+        start = time.perf_counter()
+        sender = threading.Thread(target=mqtt_client.on_message, args=(None, None, msg))
+        sender.start()
+        sender.join()
+        if wait_for(app, lambda: display.value() == display.value()):
+            to_value.append(time.perf_counter() - start)
+        if screen_index == 1 and wait_for(app, lambda: probe.painted is not None, 0.2):
+            to_pixel.append(probe.painted - start)
+    probe.remove()
+    return to_value, to_pixel
+
+
+def bench_graph(app, window, repeats):
+    """GraphWidget.plot (uncached render) and view switches (pixmap cache) for every range × mode"""
+    screen2 = window.screen2
+    window.stack.setCurrentIndex(1)
+    screen2.switch_view("graph")
+    app.processEvents()
+    results = {}
+    switches = {}
+    for time_range in RANGES:
+        screen2.time_combo.setCurrentText(time_range)
+        for mode in MODES:
+            screen2.data_combo.setCurrentText(mode)
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                screen2.graph_widget.plot()
+                samples.append(time.perf_counter() - start)
+            results[f"{time_range} / {mode}"] = samples
+    for time_range in RANGES:
+        for mode in MODES:
+            start = time.perf_counter()
+            screen2.time_combo.setCurrentText(time_range)
+            screen2.data_combo.setCurrentText(mode)
+            screen2.update_graph_data()
+            switches[f"{time_range} / {mode}"] = [time.perf_counter() - start]
+    screen2.switch_view("live")
+    return results, switches
+
+
+def print_section(title, stats):
+    print(title)
+    for name, s in stats.items():
+        print(f"  {name:<32} n={s['count']:<4} p50 {s['p50']:8.3f} | p90 {s['p90']:8.3f} | "
+              f"p99 {s['p99']:8.3f} | max {s['max']:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--taps", type=int, default=40, help="taps per theme")
+    parser.add_argument("--frames", type=int, default=50, help="energy frames per theme and screen")
+    parser.add_argument("--plot-repeats", type=int, default=3, help="renders per range/mode/theme")
+    parser.add_argument("--themes", nargs="*", help="themes to cover (default: all)")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    json_path = os.path.abspath(args.json) if args.json else None
+    os.chdir(tempfile.mkdtemp(prefix="bench_ui_"))
+
+    with Broker() as broker:
+        os.environ["MQTT_BROKER"] = broker.host
+        os.environ["MQTT_PORT"] = str(broker.port)
+
+        from PySide6.QtWidgets import QApplication
+        app = QApplication.instance() or QApplication([])
+        from mqtt_client import mqtt_client
+        from themes import THEMES
+        from main import MainWindow
+        window = MainWindow()
+        window.show()
+        time.sleep(0.2)
+        app.processEvents()
+
+        themes = args.themes or list(THEMES)
+        tap, to_value, to_pixel, graph, switch = {}, {}, {}, {}, {}
+        for theme in themes:
+            window.screen3.theme_combo.setCurrentText(theme)
+            app.processEvents()
+            tap[theme] = summarize(bench_tap_to_publish(app, window, mqtt_client, args.taps))
+            for index, screen in enumerate(SCREENS):
+                values, pixels = bench_message_to_pixel(app, window, mqtt_client, args.frames, index)
+                to_value[f"{theme} / {screen}"] = summarize(values)
+                if pixels:
+                    to_pixel[f"{theme} / {screen}"] = summarize(pixels)
+            plots, switches = bench_graph(app, window, args.plot_repeats)
+            for name, samples in plots.items():
+                graph[f"{theme} / {name}"] = summarize(samples)
+            for name, samples in switches.items():
+                switch[f"{theme} / {name}"] = summarize(samples)
+        window.close()
+
+    results = {"tap_to_publish": tap, "message_to_setvalue": to_value,
+               "message_to_pixel": to_pixel, "graph_plot": graph, "graph_switch_cached": switch}
+    print("═══════════ UI BENCHMARK ═══════════")
+    print_section("Tap → publish", tap)
+    print_section("MQTT frame → DigitalDisplay.setValue", to_value)
+    print_section("MQTT frame → repaint", to_pixel)
+    print_section("GraphWidget.plot", graph)
+    print_section("Graph view switch (cached)", switch)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
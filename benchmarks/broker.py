@@ -0,0 +1,206 @@
+"""Minimal in-process MQTT 3.1.1 broker for benchmarks
+
+Supports CONNECT, SUBSCRIBE/UNSUBSCRIBE with + and # wildcards, PUBLISH
+(delivered to subscribers at QoS 0, retained messages kept), PINGREQ and
+DISCONNECT. Good enough to run the real paho client against localhost.
+"""
+import socket
+import struct
+import threading
+
+CONNECT = 1
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+UNSUBSCRIBE = 10
+PINGREQ = 12
+DISCONNECT = 14
+
+
+def topic_matches(pattern, topic):
+    pattern_parts = pattern.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+def encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        encoded.append(byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(value):
+    data = value.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+class Connection:
+    def __init__(self, broker, sock):
+        self.broker = broker
+        self.sock = sock
+        self.subscriptions = set()
+        self.send_lock = threading.Lock()
+
+    def send(self, data):
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def send_packet(self, packet_type, flags, body):
+        self.send(bytes([packet_type << 4 | flags]) + encode_length(len(body)) + body)
+
+    def read_exact(self, count):
+        data = bytearray()
+        while len(data) < count:
+            chunk = self.sock.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError("client closed")
+            data += chunk
+        return bytes(data)
+
+    def read_packet(self):
+        first = self.read_exact(1)[0]
+        length = 0
+        multiplier = 1
+        while True:
+            byte = self.read_exact(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return first >> 4, first & 0x0F, self.read_exact(length)
+
+    def serve(self):
+        try:
+            while True:
+                packet_type, flags, body = self.read_packet()
+                if packet_type == CONNECT:
+                    self.send(b"\x20\x02\x00\x00")
+                elif packet_type == PUBLISH:
+                    self.handle_publish(flags, body)
+                elif packet_type == SUBSCRIBE:
+                    self.handle_subscribe(body)
+                elif packet_type == UNSUBSCRIBE:
+                    packet_id, offset = body[:2], 2
+                    while offset < len(body):
+                        (size,) = struct.unpack_from("!H", body, offset)
+                        self.subscriptions.discard(body[offset + 2:offset + 2 + size].decode())
+                        offset += 2 + size
+                    self.send(b"\xb0\x02" + packet_id)
+                elif packet_type == PINGREQ:
+                    self.send(b"\xd0\x00")
+                elif packet_type == DISCONNECT:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.broker.remove(self)
+            self.sock.close()
+
+    def handle_publish(self, flags, body):
+        (size,) = struct.unpack_from("!H", body)
+        topic = body[2:2 + size].decode()
+        offset = 2 + size
+        qos = (flags >> 1) & 0x03
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            self.send(b"\x40\x02" + packet_id)
+        self.broker.publish(topic, body[offset:], retain=bool(flags & 0x01))
+
+    def handle_subscribe(self, body):
+        packet_id, offset = body[:2], 2
+        granted = bytearray()
+        topics = []
+        while offset < len(body):
+            (size,) = struct.unpack_from("!H", body, offset)
+            topics.append(body[offset + 2:offset + 2 + size].decode())
+            offset += 3 + size
+            granted.append(0)
+        self.subscriptions.update(topics)
+        self.send_packet(9, 0, packet_id + bytes(granted))
+        for topic, payload in self.broker.retained_for(topics):
+            self.deliver(topic, payload)
+
+    def deliver(self, topic, payload):
+        self.send_packet(PUBLISH, 0, encode_string(topic) + payload)
+
+
+class Broker:
+    """Threaded localhost broker; use as a context manager"""
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = socket.create_server((host, port))
+        self.host, self.port = self.server.getsockname()[:2]
+        self.connections = []
+        self.retained = {}
+        self.published = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.accept_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.close()
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def accept_loop(self):
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = Connection(self, sock)
+            with self.lock:
+                self.connections.append(connection)
+            threading.Thread(target=connection.serve, daemon=True).start()
+
+    def remove(self, connection):
+        with self.lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
+
+    def retained_for(self, patterns):
+        with self.lock:
+            return [(topic, payload) for topic, payload in self.retained.items()
+                    if any(topic_matches(p, topic) for p in patterns)]
+
+    def publish(self, topic, payload, retain=False):
+        with self.lock:
+            self.published += 1
+            if retain:
+                self.retained[topic] = payload
+            targets = [c for c in self.connections
+                       if any(topic_matches(p, topic) for p in c.subscriptions)]
+        for connection in targets:
+            try:
+                connection.deliver(topic, payload)
+            except OSError:
+                pass
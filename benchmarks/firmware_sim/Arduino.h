@@ -0,0 +1,88 @@
+// Host stand-ins for the Arduino-ESP32 and FreeRTOS calls the sketch uses.
+// Time only advances through these calls; see sim.cpp for the model.
+#pragma once
+#include <math.h>
+#include <stdarg.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <string>
+
+#define ESP_ARDUINO_VERSION_MAJOR 3
+#define IRAM_ATTR
+
+typedef uint8_t byte;
+typedef bool boolean;
+
+#define HIGH 1
+#define LOW 0
+#define INPUT 0
+#define OUTPUT 1
+
+void pinMode(int pin, int mode);
+void digitalWrite(int pin, int value);
+int digitalRead(int pin);
+int analogRead(int pin);
+unsigned long millis();
+unsigned long micros();
+void delay(unsigned long ms);
+void delayMicroseconds(unsigned int us);
+
+bool getLocalTime(struct tm* info, uint32_t ms = 5000);
+void configTime(long gmtOffset, int dstOffset, const char* server);
+
+class String {
+ public:
+  String() {}
+  String(const char* s) : s_(s ? s : "") {}
+  String& operator+=(char c) { s_ += c; return *this; }
+  bool operator==(const char* other) const { return s_ == other; }
+  long toInt() const { return atol(s_.c_str()); }
+  const char* c_str() const { return s_.c_str(); }
+ private:
+  std::string s_;
+};
+
+class HardwareSerial {
+ public:
+  void begin(unsigned long baud) {}
+  void setTxBufferSize(size_t size) { txBuffer = size; }
+  void print(const char* s) { write("%s", s); }
+  void print(int v) { write("%d", v); }
+  void println(const char* s = "") { write("%s\n", s); }
+  void println(int v) { write("%d\n", v); }
+  void printf(const char* format, ...) __attribute__((format(printf, 2, 3)));
+  bool echo = false;
+  size_t txBuffer = 0;  // Bytes queued in RAM on top of the 128-byte FIFO
+ private:
+  void write(const char* format, ...) __attribute__((format(printf, 2, 3)));
+};
+extern HardwareSerial Serial;
+
+// FreeRTOS
+typedef int BaseType_t;
+typedef unsigned int UBaseType_t;
+typedef uint32_t TickType_t;
+typedef struct SimTask* TaskHandle_t;
+typedef void (*TaskFunction_t)(void*);
+#define pdTRUE 1
+#define pdFALSE 0
+#define portMAX_DELAY 0xFFFFFFFFu
+typedef int portMUX_TYPE;
+#define portMUX_INITIALIZER_UNLOCKED 0
+#define portENTER_CRITICAL(mux) ((void)(mux))  // The sim never preempts inside a critical section
+#define portEXIT_CRITICAL(mux) ((void)(mux))
+#define portYIELD_FROM_ISR() ((void)0)
+
+BaseType_t xTaskCreatePinnedToCore(TaskFunction_t fn, const char* name, uint32_t stack, void* arg,
+                                   UBaseType_t priority, TaskHandle_t* handle, BaseType_t core);
+uint32_t ulTaskNotifyTake(BaseType_t clear, TickType_t wait);
+void vTaskNotifyGiveFromISR(TaskHandle_t task, BaseType_t* woken);
+
+// Hardware timer (Arduino-ESP32 3.x API)
+typedef struct SimTimer hw_timer_t;
+hw_timer_t* timerBegin(uint32_t frequency);
+void timerAttachInterrupt(hw_timer_t* timer, void (*isr)());
+void timerAlarm(hw_timer_t* timer, uint64_t ticks, bool autoreload, uint64_t count);
@@ -0,0 +1,18 @@
+#pragma once
+#include "Arduino.h"
+
+class EEPROMClass {
+ public:
+  bool begin(size_t size) { return size <= sizeof(data); }
+  template <typename T> T& get(int address, T& value) {
+    memcpy(&value, data + address, sizeof(T));
+    return value;
+  }
+  template <typename T> const T& put(int address, const T& value) {
+    memcpy(data + address, &value, sizeof(T));
+    return value;
+  }
+  bool commit() { return true; }
+  uint8_t data[512] = {};
+};
+extern EEPROMClass EEPROM;
@@ -0,0 +1,27 @@
+#pragma once
+#include "Arduino.h"
+#include "WiFi.h"
+
+#define MQTT_CALLBACK_SIGNATURE void (*callback)(char*, uint8_t*, unsigned int)
+
+// Talks to the simulated broker in sim.cpp instead of a socket
+class PubSubClient {
+ public:
+  PubSubClient(WiFiClient& client) {}
+  PubSubClient& setServer(const char* domain, uint16_t port) { return *this; }
+  PubSubClient& setCallback(MQTT_CALLBACK_SIGNATURE) { this->callback = callback; return *this; }
+  bool setBufferSize(uint16_t size) { bufferSize = size; return true; }
+  PubSubClient& setSocketTimeout(uint16_t seconds) { socketTimeout = seconds; return *this; }
+  bool connect(const char* id);
+  bool connected();
+  bool subscribe(const char* topic) { return connected(); }
+  bool publish(const char* topic, const char* payload);
+  bool publish(const char* topic, const uint8_t* payload, unsigned int length);
+  bool loop();
+  int state() { return connected() ? 0 : -2; }
+
+  MQTT_CALLBACK_SIGNATURE = nullptr;
+  uint16_t bufferSize = 256;
+  uint16_t socketTimeout = 15;
+  bool session = false;
+};
@@ -0,0 +1,13 @@
+#pragma once
+#include "Arduino.h"
+
+#define WL_CONNECTED 3
+
+class WiFiClass {
+ public:
+  void begin(const char* ssid, const char* password) {}
+  int status() { return WL_CONNECTED; }
+};
+extern WiFiClass WiFi;
+
+class WiFiClient {};
@@ -0,0 +1,395 @@
+// Host simulation of ESP32_Smart_Home_FINAL.ino.
+//
+// The sketch is compiled unchanged against the stub headers in this
+// directory. Simulated time advances only through the stubbed calls. CPU
+// work (analogRead, publish, UART) is stretched by interrupts and
+// higher-priority tasks that preempt it. Waits (delay, network) are not.
+// The hardware timer and one FreeRTOS task run on ucontext coroutines,
+// which is enough to model the sampler preempting loop() on its core.
+//
+// Mains current is a 50 Hz sine with a 15% third harmonic and ADC noise on
+// both ACS712 pins. Relay commands arrive at random times and are handed to
+// the sketch's callback the next time it calls client.loop(). A JSON
+// summary goes to stdout.
+#include <ucontext.h>
+#include <algorithm>
+#include <random>
+#include <vector>
+#include "Arduino.h"
+#include "EEPROM.h"
+#include "PubSubClient.h"
+#include "WiFi.h"
+
+void setup();
+void loop();
+
+// Costs in microseconds
+static const uint64_t ANALOG_READ_US = 10;
+static const uint64_t ISR_US = 2;
+static const uint64_t SWITCH_US = 3;
+static const uint64_t CLIENT_LOOP_US = 15;
+static const uint64_t PUBLISH_US = 300;
+static const uint64_t CONNECT_US = 30000;
+static const uint64_t LOOP_OVERHEAD_US = 2;
+static const uint64_t UART_CHAR_US = 87;   // 10 bits at 115200 baud
+static const uint64_t UART_FIFO = 128;
+
+static const double MAINS_HZ = 50.02;      // Slightly off nominal, like the grid
+static const double SENSITIVITY = 0.185;   // V/A
+static const double SENSOR_OFFSET = 1.65;
+static const double EPOCH = 1760000000.0;
+
+HardwareSerial Serial;
+WiFiClass WiFi;
+EEPROMClass EEPROM;
+
+static uint64_t simNow = 0;
+static uint64_t uartIdleAt = 0;
+static std::mt19937_64 rng(1);
+static std::normal_distribution<double> adcNoise(0.0, 2.0);  // ADC counts
+
+// ================= CONFIG =================
+struct Config {
+  double seconds = 60;
+  double l1 = 2.5, l2 = 0.7;        // True RMS Amps
+  double commandMs = 700;           // Mean spacing of relay commands
+  double outageStart = -1, outageSeconds = 0;
+  bool verbose = false;
+};
+static Config config;
+static uint64_t measureStart = 0;
+
+static bool brokerUp(uint64_t t) {
+  if (config.outageStart < 0) return true;
+  double s = (double)(t - measureStart) / 1e6;
+  return s < config.outageStart || s >= config.outageStart + config.outageSeconds;
+}
+
+// ================= SCHEDULER =================
+struct SimTimer {
+  uint64_t period = 0;
+  uint64_t next = 0;
+  void (*isr)() = nullptr;
+};
+
+struct SimTask {
+  ucontext_t context;
+  TaskFunction_t fn;
+  void* arg;
+  uint32_t notified = 0;
+  bool waiting = false;
+  std::vector<char> stack;
+};
+
+static SimTimer* timer = nullptr;
+static SimTask* task = nullptr;
+static ucontext_t mainContext;
+static bool inTask = false;
+static uint64_t sampleReads = 0;
+
+static void runTask() {
+  simNow += SWITCH_US;
+  inTask = true;
+  swapcontext(&mainContext, &task->context);
+  inTask = false;
+  simNow += SWITCH_US;
+}
+
+static void fireTick() {
+  timer->next += timer->period;
+  simNow += ISR_US;
+  timer->isr();
+  if (!inTask && task && task->waiting && task->notified) runTask();
+}
+
+// Let `us` of simulated time pass on the current context. Busy work is
+// pushed back by whatever preempts it; a wait simply ends at its deadline.
+static void advance(uint64_t us, bool busy) {
+  uint64_t target = simNow + us;
+  while (timer && timer->isr && timer->next <= target) {
+    simNow = std::max(simNow, timer->next);
+    uint64_t before = simNow;
+    fireTick();
+    if (busy) target += simNow - before;
+  }
+  simNow = std::max(simNow, target);
+}
+
+static void taskEntry() {
+  task->fn(task->arg);
+}
+
+BaseType_t xTaskCreatePinnedToCore(TaskFunction_t fn, const char* name, uint32_t stack, void* arg,
+                                   UBaseType_t priority, TaskHandle_t* handle, BaseType_t core) {
+  task = new SimTask();
+  task->fn = fn;
+  task->arg = arg;
+  task->stack.resize(256 * 1024);
+  getcontext(&task->context);
+  task->context.uc_stack.ss_sp = task->stack.data();
+  task->context.uc_stack.ss_size = task->stack.size();
+  task->context.uc_link = &mainContext;
+  makecontext(&task->context, taskEntry, 0);
+  if (handle) *handle = task;
+  runTask();  // Higher priority than loop(): runs until it first blocks
+  return pdTRUE;
+}
+
+uint32_t ulTaskNotifyTake(BaseType_t clear, TickType_t wait) {
+  while (task->notified == 0) {
+    task->waiting = true;
+    swapcontext(&task->context, &mainContext);
+    task->waiting = false;
+  }
+  uint32_t value = task->notified;
+  task->notified = clear ? 0 : value - 1;
+  return value;
+}
+
+void vTaskNotifyGiveFromISR(TaskHandle_t handle, BaseType_t* woken) {
+  handle->notified++;
+  if (woken) *woken = pdTRUE;
+}
+
+hw_timer_t* timerBegin(uint32_t frequency) {
+  timer = new SimTimer();
+  return timer;
+}
+
+void timerAttachInterrupt(hw_timer_t* t, void (*isr)()) {
+  t->isr = isr;
+}
+
+void timerAlarm(hw_timer_t* t, uint64_t ticks, bool autoreload, uint64_t count) {
+  t->period = ticks;  // 1 MHz timer: ticks are microseconds
+  t->next = simNow + ticks;
+}
+
+// ================= ARDUINO =================
+static double trueCurrent(int pin, uint64_t t) {
+  double rms = pin == 34 ? config.l1 : pin == 35 ? config.l2 : 0.0;
+  double a1 = rms * sqrt(2.0) / sqrt(1.0 + 0.15 * 0.15);
+  double phase = 2.0 * M_PI * MAINS_HZ * (double)t / 1e6;
+  return a1 * sin(phase) + 0.15 * a1 * sin(3.0 * phase + 0.4);
+}
+
+int analogRead(int pin) {
+  double volts = SENSOR_OFFSET + trueCurrent(pin, simNow) * SENSITIVITY;
+  double counts = volts / 3.3 * 4095.0 + adcNoise(rng);
+  sampleReads++;
+  advance(ANALOG_READ_US, true);
+  return (int)std::min(4095.0, std::max(0.0, round(counts)));
+}
+
+void pinMode(int pin, int mode) {}
+void digitalWrite(int pin, int value) {}
+int digitalRead(int pin) { return LOW; }
+unsigned long millis() { return (unsigned long)(simNow / 1000); }
+unsigned long micros() { return (unsigned long)simNow; }
+void delay(unsigned long ms) { advance((uint64_t)ms * 1000, false); }
+void delayMicroseconds(unsigned int us) { advance(us, false); }
+
+bool getLocalTime(struct tm* info, uint32_t ms) {
+  time_t now = (time_t)(EPOCH + simNow / 1e6);
+  localtime_r(&now, info);
+  return true;
+}
+
+void configTime(long gmtOffset, int dstOffset, const char* server) {}
+
+// The UART blocks once its FIFO and TX buffer are full
+static void uartWrite(const char* text) {
+  size_t length = strlen(text);
+  uint64_t capacity = (UART_FIFO + Serial.txBuffer) * UART_CHAR_US;
+  uartIdleAt = std::max(uartIdleAt, simNow) + length * UART_CHAR_US;
+  uint64_t queued = uartIdleAt - simNow;
+  if (queued > capacity) advance(queued - capacity, false);
+  if (Serial.echo) fputs(text, stderr);
+}
+
+void HardwareSerial::write(const char* format, ...) {
+  char text[512];
+  va_list args;
+  va_start(args, format);
+  vsnprintf(text, sizeof(text), format, args);
+  va_end(args);
+  uartWrite(text);
+}
+
+void HardwareSerial::printf(const char* format, ...) {
+  char text[512];
+  va_list args;
+  va_start(args, format);
+  vsnprintf(text, sizeof(text), format, args);
+  va_end(args);
+  uartWrite(text);
+}
+
+// ================= BROKER =================
+struct Command {
+  uint64_t time;
+  const char* topic;
+  const char* payload;
+  bool delivered = false;
+};
+
+struct Frame {
+  uint64_t time;
+  float current1, current2;
+  double energy1;
+};
+
+static std::vector<Command> commands;
+static std::vector<double> latencies;
+static std::vector<Frame> frames;
+static size_t nextCommand = 0;
+static int commandsLost = 0;
+static uint64_t sessionStart = 0;
+static int publishRejected = 0;
+static int catchupFrames = 0, catchupRecords = 0;
+static int highResFrames = 0;
+
+bool PubSubClient::connect(const char* id) {
+  if (!brokerUp(simNow)) {
+    advance((uint64_t)socketTimeout * 1000000, false);
+    return false;
+  }
+  advance(CONNECT_US, false);
+  session = true;
+  sessionStart = simNow;
+  return true;
+}
+
+bool PubSubClient::connected() {
+  if (!brokerUp(simNow)) session = false;
+  return session;
+}
+
+bool PubSubClient::publish(const char* topic, const uint8_t* payload, unsigned int length) {
+  if (!connected()) return false;
+  if (5 + 2 + strlen(topic) + length > bufferSize) {
+    publishRejected++;
+    return false;
+  }
+  advance(PUBLISH_US, true);
+  if (strcmp(topic, "home/light/energy") == 0) {
+    std::string text((const char*)payload, length);
+    Frame frame = {simNow, 0, 0, 0};
+    const char* l2 = strstr(text.c_str(), "\"L2\"");
+    sscanf(text.c_str(), "{\"L1\":{\"current\":%f,\"power\":%*f,\"energy\":%lf", &frame.current1, &frame.energy1);
+    if (l2) sscanf(l2, "\"L2\":{\"current\":%f", &frame.current2);
+    frames.push_back(frame);
+  } else if (strcmp(topic, "home/light/energy_log") == 0) {
+    catchupFrames++;
+    catchupRecords += payload[3];
+  } else if (strcmp(topic, "home/light/energy_hr") == 0) {
+    highResFrames++;
+  }
+  return true;
+}
+
+bool PubSubClient::publish(const char* topic, const char* payload) {
+  return publish(topic, (const uint8_t*)payload, strlen(payload));
+}
+
+// Hands over at most one due command per call, like a real packet read
+bool PubSubClient::loop() {
+  if (!connected()) return false;
+  advance(CLIENT_LOOP_US, true);
+  while (nextCommand < commands.size() && commands[nextCommand].time <= simNow) {
+    Command& command = commands[nextCommand++];
+    if (command.time < sessionStart) {
+      commandsLost++;  // Sent while the device was offline (QoS 0, clean session)
+      continue;
+    }
+    latencies.push_back((double)(simNow - command.time) / 1000.0);
+    if (callback) {
+      std::vector<uint8_t> payload(command.payload, command.payload + strlen(command.payload));
+      std::vector<char> topic(command.topic, command.topic + strlen(command.topic) + 1);
+      callback(topic.data(), payload.data(), payload.size());
+    }
+    break;
+  }
+  return true;
+}
+
+// ================= DRIVER =================
+static double percentile(std::vector<double> values, double pct) {
+  if (values.empty()) return 0.0;
+  std::sort(values.begin(), values.end());
+  size_t index = std::min(values.size() - 1, (size_t)llround(pct / 100.0 * (values.size() - 1)));
+  return values[index];
+}
+
+static void scheduleCommands(uint64_t start, uint64_t end) {
+  static const char* topics[] = {"home/light/light_2", "home/light/light_3", "home/light/light_4"};
+  std::uniform_real_distribution<double> spacing(0.5, 1.5);
+  uint64_t t = start;
+  for (int i = 0;; i++) {
+    t += (uint64_t)(spacing(rng) * config.commandMs * 1000.0);
+    if (t >= end) break;
+    commands.push_back({t, topics[i % 3], (i / 3) % 2 ? "OFF" : "ON"});
+  }
+}
+
+static void parseArgs(int argc, char** argv) {
+  for (int i = 1; i < argc; i++) {
+    std::string arg = argv[i];
+    const char* value = i + 1 < argc ? argv[i + 1] : "0";
+    if (arg == "--seconds") config.seconds = atof(value), i++;
+    else if (arg == "--l1") config.l1 = atof(value), i++;
+    else if (arg == "--l2") config.l2 = atof(value), i++;
+    else if (arg == "--command-ms") config.commandMs = atof(value), i++;
+    else if (arg == "--outage") sscanf(value, "%lf:%lf", &config.outageStart, &config.outageSeconds), i++;
+    else if (arg == "--seed") rng.seed(strtoull(value, nullptr, 10)), i++;
+    else if (arg == "--verbose") config.verbose = true;
+  }
+}
+
+int main(int argc, char** argv) {
+  parseArgs(argc, argv);
+  Serial.echo = config.verbose;
+  float offset = SENSOR_OFFSET;
+  EEPROM.put(0, offset);  // OFFSET1_ADDR / OFFSET2_ADDR as saved by calibrateOffsets()
+  EEPROM.put(8, offset);
+
+  setup();
+  measureStart = simNow;
+  uint64_t end = measureStart + (uint64_t)(config.seconds * 1e6);
+  scheduleCommands(measureStart, end);
+  uint64_t readsAtStart = sampleReads;
+  while (simNow < end) {
+    loop();
+    advance(LOOP_OVERHEAD_US, true);
+  }
+
+  // RMS error of every live frame after the first (which may span setup)
+  double error1 = 0, error2 = 0;
+  int measured = 0;
+  for (size_t i = 1; i < frames.size(); i++) {
+    error1 += fabs(frames[i].current1 - config.l1) / config.l1;
+    error2 += fabs(frames[i].current2 - config.l2) / config.l2;
+    measured++;
+  }
+  // Energy the device counted between the first and last live frame
+  double energyError = 0;
+  if (frames.size() > 1) {
+    double span = (double)(frames.back().time - frames.front().time) / 3.6e9;  // hours
+    double expected = 230.0 * config.l1 * span / 1000.0;
+    energyError = (frames.back().energy1 - frames.front().energy1 - expected) / expected;
+  }
+
+  printf("{\"seconds\": %.1f, \"commands\": %zu, \"commands_lost\": %d, \"commands_pending\": %zu, "
+         "\"latency_ms\": {\"p50\": %.3f, \"p90\": %.3f, \"p99\": %.3f, \"max\": %.3f}, "
+         "\"frames\": %zu, \"publish_rejected\": %d, "
+         "\"rms_error_pct\": {\"L1\": %.3f, \"L2\": %.3f}, \"energy_error_pct\": %.3f, "
+         "\"adc_reads_per_second\": %.0f, \"catchup_frames\": %d, \"catchup_records\": %d, "
+         "\"highres_frames\": %d}\n",
+         config.seconds, latencies.size(), commandsLost, commands.size() - nextCommand,
+         percentile(latencies, 50), percentile(latencies, 90), percentile(latencies, 99),
+         percentile(latencies, 100), frames.size(), publishRejected,
+         measured ? 100.0 * error1 / measured : 0.0, measured ? 100.0 * error2 / measured : 0.0,
+         100.0 * energyError, (double)(sampleReads - readsAtStart) / config.seconds,
+         catchupFrames, catchupRecords, highResFrames);
+  return 0;
+}
@@ -0,0 +1,87 @@
+"""Simulated ESP32 nodes that publish the firmware's exact energy frame"""
+import itertools
+import math
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+ENERGY_TOPIC = "home/light/energy"
+VOLTAGE_MAINS = 230.0
+
+
+def energy_frame(current1, energy1, current2, energy2,
+                 motion_enabled=True, motion_active=False, timer_disabled=(0, 0, 0, 0)):
+    """Same snprintf() layout as the energy publish in ESP32_Smart_Home_FINAL.ino"""
+    return (
+        '{"L1":{"current":%.3f,"power":%.1f,"energy":%.6f},'
+        '"L2":{"current":%.3f,"power":%.1f,"energy":%.6f},'
+        '"motionEnabled":%d,"motionActive":%d,"timerDisabled":[%d,%d,%d,%d]}'
+        % (current1, VOLTAGE_MAINS * current1, energy1,
+           current2, VOLTAGE_MAINS * current2, energy2,
+           1 if motion_enabled else 0, 1 if motion_active else 0, *timer_disabled)
+    ).encode()
+
+
+class SimulatedESP32:
+    """Publishes energy frames at a fixed rate from its own MQTT connection
+
+    The L1 energy field carries a run-wide sequence number (seq * 1e-6 kWh,
+    exact at %.6f) so the receiver can match frames to their send time.
+    """
+    def __init__(self, node_id, host, port, rate_hz, sequence, sent_times,
+                 topic=ENERGY_TOPIC):
+        self.node_id = node_id
+        self.rate_hz = rate_hz
+        self.sequence = sequence        # Shared itertools.count()
+        self.sent_times = sent_times    # seq -> time.perf_counter() at publish
+        self.topic = topic
+        self.published = 0
+        self.running = False
+        self.client = mqtt.Client(client_id=f"sim-esp32-{node_id}")
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+        self.thread = None
+
+    def start(self, duration):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(duration,), daemon=True)
+        self.thread.start()
+
+    def join(self):
+        if self.thread:
+            self.thread.join()
+
+    def stop(self):
+        self.running = False
+        self.join()
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def run(self, duration):
+        interval = 1.0 / self.rate_hz
+        start = time.perf_counter()
+        deadline = start
+        energy2 = 0.0
+        while self.running and deadline - start < duration:
+            seq = next(self.sequence)
+            phase = seq / 50.0
+            current1 = 0.5 + 0.3 * math.sin(phase + self.node_id)
+            current2 = 0.2 + 0.1 * math.cos(phase)
+            energy2 += VOLTAGE_MAINS * current2 / 3600000.0
+            payload = energy_frame(current1, seq * 1e-6, current2, energy2)
+            self.sent_times[seq] = time.perf_counter()
+            self.client.publish(self.topic, payload)
+            self.published += 1
+
+            deadline += interval
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def start_nodes(count, host, port, rate_hz, duration, sent_times):
+    sequence = itertools.count(1)
+    nodes = [SimulatedESP32(i, host, port, rate_hz, sequence, sent_times) for i in range(count)]
+    for node in nodes:
+        node.start(duration)
+    return nodes
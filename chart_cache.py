@@ -0,0 +1,53 @@
+import collections
+from metrics import metrics
+
+CHART_CACHE_BYTES = 24 * 1024 * 1024  # About 25 full-size graph pixmaps on the 7" panel
+
+
+class ChartCache:
+    """LRU cache of rendered chart pixmaps with a memory cap
+
+    Keys describe everything the image depends on (range, series, theme,
+    size and a digest of the plotted data), so entries never need explicit
+    invalidation: changed data simply stops matching and ages out.
+    """
+    def __init__(self, max_bytes=CHART_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()  # key -> QPixmap, oldest first
+        self.size = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        pixmap = self.entries.get(key)
+        if pixmap is None:
+            metrics.chart_cache_misses.inc()
+            return None
+        self.entries.move_to_end(key)
+        metrics.chart_cache_hits.inc()
+        return pixmap
+
+    def put(self, key, pixmap):
+        cost = pixmap_bytes(pixmap)
+        if cost > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= pixmap_bytes(old)
+        self.entries[key] = pixmap
+        self.size += cost
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= pixmap_bytes(evicted)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+def pixmap_bytes(pixmap):
+    return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
@@ -0,0 +1,274 @@
+import json
+import re
+import struct
+import time
+import numpy as np
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# Binary high-resolution frame published by the ESP32 on ENERGY_HR_TOPIC.
+# Must match HrFrameHeader / HrReading in ESP32_Smart_Home_FINAL.ino.
+HR_MAGIC = b"EH"
+HR_VERSION = 1
+HR_HEADER = struct.Struct("<2sBBHHI")  # magic, version, count, seq, interval_ms, t0
+HR_READING_DTYPE = np.dtype([("rms1", "<u2"), ("peak1", "<u2"),
+                             ("rms2", "<u2"), ("peak2", "<u2")])
+
+# Binary catch-up frame replaying the ESP32's offline buffer on
+# ENERGY_LOG_TOPIC. Must match BufFrameHeader / BufRecord in the sketch.
+BUF_MAGIC = b"EB"
+BUF_VERSION = 1
+BUF_HEADER = struct.Struct("<2sBBHHI")  # magic, version, count, seq, interval_s, dropped
+BUF_RECORD_DTYPE = np.dtype([("time", "<u4"), ("rms1", "<u2"), ("rms2", "<u2"),
+                             ("energy1", "<u4"), ("energy2", "<u4")])
+BUF_ENERGY_SCALE = 1e-5  # kWh per counter unit
+MAINS_VOLTAGE = 230.0    # Firmware's voltage_mains, for power of replayed records
+
+HISTORY_SECONDS = 3600  # High-res readings kept in RAM
+
+
+# Exact layout of the firmware's snprintf() energy frame. Matching it with
+# one precompiled pattern avoids building the nested dicts json.loads makes.
+NUMBER = rb"(-?\d+(?:\.\d+)?)"
+ENERGY_FRAME = re.compile(
+    rb'\{"L1":\{"current":' + NUMBER + rb',"power":' + NUMBER + rb',"energy":' + NUMBER + rb'\},'
+    rb'"L2":\{"current":' + NUMBER + rb',"power":' + NUMBER + rb',"energy":' + NUMBER + rb'\},'
+    rb'"motionEnabled":([01]),"motionActive":([01]),"timerDisabled":\[([01]),([01]),([01]),([01])\]\}'
+)
+CIRCUIT_FIELDS = ("current", "power", "energy")
+
+
+class FrameError(ValueError):
+    """Raised for a malformed energy frame"""
+
+
+class EnergySample:
+    """One decoded 1 Hz energy frame from the ESP32"""
+    __slots__ = ("time", "l1_current", "l1_power", "l1_energy",
+                 "l2_current", "l2_power", "l2_energy",
+                 "motion_enabled", "motion_active", "timer_disabled")
+
+    def __init__(self, time, l1_current, l1_power, l1_energy,
+                 l2_current, l2_power, l2_energy,
+                 motion_enabled=False, motion_active=False, timer_disabled=0):
+        self.time = time
+        self.l1_current = l1_current
+        self.l1_power = l1_power
+        self.l1_energy = l1_energy      # Device-side cumulative kWh
+        self.l2_current = l2_current
+        self.l2_power = l2_power
+        self.l2_energy = l2_energy
+        self.motion_enabled = motion_enabled
+        self.motion_active = motion_active
+        self.timer_disabled = timer_disabled  # Bit i set = Light i+1 overridden
+
+    @property
+    def total_current(self):
+        return self.l1_current + self.l2_current
+
+
+class EnergyDecoder:
+    """Decodes ESP32 energy payloads and counts failures
+
+    The firmware's fixed frame layout is matched with a precompiled pattern;
+    anything else falls back to orjson/json plus a schema check.
+    """
+    def __init__(self):
+        self.decoded = 0
+        self.fast_path = 0
+        self.errors = 0
+        self.last_error = None
+
+    def decode(self, payload, received=None):
+        received = received if received is not None else time.time()
+        try:
+            sample = self.decode_fast(payload, received)
+            if sample is None:
+                sample = self.decode_json(payload, received)
+            else:
+                self.fast_path += 1
+        except FrameError as e:
+            self.errors += 1
+            self.last_error = str(e)
+            raise
+        self.decoded += 1
+        return sample
+
+    def decode_batch(self, payload, received=None):
+        """Decode a binary high-res frame, counting failures the same way"""
+        try:
+            frame = decode_batch_frame(payload, received)
+        except FrameError as e:
+            self.errors += 1
+            self.last_error = str(e)
+            raise
+        self.decoded += 1
+        return frame
+
+    def decode_catchup(self, payload):
+        """Decode a binary catch-up frame, counting failures the same way"""
+        try:
+            frame = decode_catchup_frame(payload)
+        except FrameError as e:
+            self.errors += 1
+            self.last_error = str(e)
+            raise
+        self.decoded += 1
+        return frame
+
+    def decode_fast(self, payload, received):
+        match = ENERGY_FRAME.fullmatch(payload)
+        if match is None:
+            return None
+        (c1, p1, e1, c2, p2, e2, enabled, active,
+         t1, t2, t3, t4) = match.groups()
+        return EnergySample(received, float(c1), float(p1), float(e1),
+                            float(c2), float(p2), float(e2),
+                            enabled == b"1", active == b"1",
+                            (t1 == b"1") | (t2 == b"1") << 1 | (t3 == b"1") << 2 | (t4 == b"1") << 3)
+
+    def decode_json(self, payload, received):
+        try:
+            data = json_loads(payload)
+        except ValueError as e:
+            raise FrameError(f"invalid JSON: {e}")
+        if not isinstance(data, dict):
+            raise FrameError("energy frame is not an object")
+
+        values = []
+        for circuit in ("L1", "L2"):
+            fields = data.get(circuit)
+            if not isinstance(fields, dict):
+                raise FrameError(f"missing {circuit}")
+            for name in CIRCUIT_FIELDS:
+                value = fields.get(name, 0.0)
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    raise FrameError(f"{circuit}.{name} is not a number")
+                values.append(float(value))
+
+        timer_disabled = 0
+        flags = data.get("timerDisabled", ())
+        if isinstance(flags, list):
+            for i, flag in enumerate(flags[:4]):
+                if flag:
+                    timer_disabled |= 1 << i
+        return EnergySample(received, *values,
+                            bool(data.get("motionEnabled", 0)),
+                            bool(data.get("motionActive", 0)),
+                            timer_disabled)
+
+
+class BatchFrame:
+    """One decoded batch of high-resolution readings (currents in Amps)"""
+    def __init__(self, seq, interval_ms, t0, readings, received):
+        self.seq = seq
+        self.interval_ms = interval_ms
+        self.t0 = t0                # ESP32 millis() of the first reading
+        self.received = received    # Pi wall-clock time the frame arrived
+        self.rms1 = readings["rms1"] / 1000.0
+        self.peak1 = readings["peak1"] / 1000.0
+        self.rms2 = readings["rms2"] / 1000.0
+        self.peak2 = readings["peak2"] / 1000.0
+
+    def __len__(self):
+        return len(self.rms1)
+
+    def timestamps(self):
+        """Wall-clock time of each reading, anchored on the arrival time"""
+        count = len(self)
+        offsets = np.arange(count - 1, -1, -1) * (self.interval_ms / 1000.0)
+        return self.received - offsets
+
+
+def decode_batch_frame(payload, received=None):
+    """Decode a packed high-res frame without going through JSON"""
+    if len(payload) < HR_HEADER.size:
+        raise FrameError(f"frame too short ({len(payload)} bytes)")
+    magic, version, count, seq, interval_ms, t0 = HR_HEADER.unpack_from(payload)
+    if magic != HR_MAGIC or version != HR_VERSION:
+        raise FrameError(f"unknown frame {magic!r} v{version}")
+    expected = HR_HEADER.size + count * HR_READING_DTYPE.itemsize
+    if len(payload) != expected:
+        raise FrameError(f"frame length {len(payload)} != {expected}")
+    readings = np.frombuffer(payload, dtype=HR_READING_DTYPE, count=count, offset=HR_HEADER.size)
+    return BatchFrame(seq, interval_ms, t0, readings,
+                      received if received is not None else time.time())
+
+
+class CatchupFrame:
+    """One decoded batch of the ESP32's offline buffer"""
+    def __init__(self, seq, interval_s, dropped, records):
+        self.seq = seq
+        self.interval_s = interval_s
+        self.dropped = dropped      # Records the device overwrote since boot
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def samples(self):
+        """EnergySamples stamped with device time, oldest first; records
+        taken before the device clock was set are skipped"""
+        samples = []
+        for record in self.records[self.records["time"] > 0]:
+            l1 = record["rms1"] / 1000.0
+            l2 = record["rms2"] / 1000.0
+            samples.append(EnergySample(float(record["time"]), l1, l1 * MAINS_VOLTAGE,
+                                        record["energy1"] * BUF_ENERGY_SCALE,
+                                        l2, l2 * MAINS_VOLTAGE,
+                                        record["energy2"] * BUF_ENERGY_SCALE))
+        return samples
+
+
+def decode_catchup_frame(payload):
+    if len(payload) < BUF_HEADER.size:
+        raise FrameError(f"frame too short ({len(payload)} bytes)")
+    magic, version, count, seq, interval_s, dropped = BUF_HEADER.unpack_from(payload)
+    if magic != BUF_MAGIC or version != BUF_VERSION:
+        raise FrameError(f"unknown frame {magic!r} v{version}")
+    expected = BUF_HEADER.size + count * BUF_RECORD_DTYPE.itemsize
+    if len(payload) != expected:
+        raise FrameError(f"frame length {len(payload)} != {expected}")
+    records = np.frombuffer(payload, dtype=BUF_RECORD_DTYPE, count=count, offset=BUF_HEADER.size)
+    return CatchupFrame(seq, interval_s, dropped, records)
+
+
+class HighResHistory:
+    """Fixed-size ring of high-resolution readings for fault detection"""
+    COLUMNS = ("time", "rms1", "peak1", "rms2", "peak2")
+
+    def __init__(self, seconds=HISTORY_SECONDS, rate_hz=10):
+        self.capacity = seconds * rate_hz
+        self.data = np.zeros((len(self.COLUMNS), self.capacity))
+        self.size = 0
+        self.head = 0           # Next write position
+        self.last_seq = None
+        self.lost_frames = 0
+
+    def append_frame(self, frame):
+        """Copy a decoded batch into the ring and track lost frames"""
+        if self.last_seq is not None:
+            gap = (frame.seq - self.last_seq - 1) & 0xFFFF
+            if gap < 0x8000:
+                self.lost_frames += gap
+        self.last_seq = frame.seq
+
+        count = len(frame)
+        if count == 0:
+            return
+        rows = (frame.timestamps(), frame.rms1, frame.peak1, frame.rms2, frame.peak2)
+        index = (self.head + np.arange(count)) % self.capacity
+        for column, values in enumerate(rows):
+            self.data[column, index] = values
+        self.head = (self.head + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+
+    def latest(self, count=None):
+        """Most recent readings, oldest first, as a dict of arrays"""
+        count = self.size if count is None else min(count, self.size)
+        index = (self.head - count + np.arange(count)) % self.capacity
+        return {name: self.data[column, index] for column, name in enumerate(self.COLUMNS)}
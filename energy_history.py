@@ -0,0 +1,242 @@
+import bisect
+import datetime
+import os
+import threading
+from array import array
+import numpy as np
+from settings_store import atomic_write
+
+LOG_FILE = "energy_log.txt"
+# First line of a log holding kWh per day. Logs without it come from
+# before the rollover engine and hold the last current reading (Amps).
+LOG_HEADER = "# energy_log v2: kWh per day"
+LEGACY_PREFIX = "#amps "  # Amps lines are kept in the log, but never read as kWh
+
+# How a logged day's totals were obtained; non-measured days carry a
+# "gap:<name>" token at the end of their log line
+DAY_MISSING = -1      # No entry at all (window() only)
+DAY_MEASURED = 0
+DAY_BACKFILLED = 1    # Frames were missing; spread from the device's counters
+DAY_PARTIAL = 2       # Energy was lost (counter restart or no catch-up): a lower bound
+DAY_FLAG_NAMES = {DAY_BACKFILLED: "backfilled", DAY_PARTIAL: "partial"}
+
+
+class ApplianceReading:
+    """Live current split across the appliance groups (Amps)"""
+    __slots__ = ("light", "fan", "plug")
+
+    def __init__(self, light=0.0, fan=0.0, plug=0.0):
+        self.light = light
+        self.fan = fan
+        self.plug = plug
+
+    @property
+    def total(self):
+        return self.light + self.fan + self.plug
+
+    @classmethod
+    def from_sample(cls, sample):
+        # L1 (sensor1) → Powers Lights + Plugs, L2 (sensor2) → Powers Fans
+        return cls(sample.l1_current * 0.6,  # 60% of L1 is lights
+                   sample.l2_current,
+                   sample.l1_current * 0.4)  # 40% of L1 is plugs
+
+
+def parse_line(line):
+    """(date, ApplianceReading, DAY_* flag) of one log line, or None if malformed"""
+    try:
+        parts = line.split()
+        date = datetime.date.fromisoformat(parts[0])
+        light = float(parts[1].split(":")[1])
+        fan = float(parts[2].split(":")[1])
+        plug = float(parts[3].split(":")[1])
+    except (ValueError, IndexError):
+        return None
+    flag = DAY_MEASURED
+    for name in (p[4:] for p in parts[4:] if p.startswith("gap:")):
+        flag = next((f for f, n in DAY_FLAG_NAMES.items() if n == name), DAY_PARTIAL)
+    return date, ApplianceReading(light, fan, plug), flag
+
+
+class EnergyHistory:
+    """Per-day readings stored column-wise in typed arrays
+
+    Days are kept sorted by date ordinal, so months of history are a few
+    flat arrays of machine doubles instead of per-day lists and tuples.
+    Windows are sliced out of a date-indexed (3, span) NumPy copy built on
+    first use; a day inside its span is patched in place, one outside
+    rebuilds it. The query server reads windows from its own thread, so
+    the columns and the dense copy only change under `lock`.
+    """
+    def __init__(self):
+        self.days = array("q")   # date.toordinal(), sorted
+        self.light = array("d")
+        self.fan = array("d")
+        self.plug = array("d")
+        self.flags = array("b")  # DAY_MEASURED / DAY_BACKFILLED / DAY_PARTIAL
+        self.dense = None        # (data, flags, first ordinal) for window_matrix()
+        self.lock = threading.Lock()
+        self.legacy = []         # Amps lines of a pre-v2 log, without LEGACY_PREFIX
+
+    def __len__(self):
+        return len(self.days)
+
+    def columns(self):
+        return self.light, self.fan, self.plug
+
+    def copy(self):
+        """Independent snapshot, e.g. for saving from another thread"""
+        other = EnergyHistory()
+        other.days = array("q", self.days)
+        other.light, other.fan, other.plug = (array("d", c) for c in self.columns())
+        other.flags = array("b", self.flags)
+        other.legacy = list(self.legacy)
+        return other
+
+    def index(self, date):
+        """Position of a day in the columns, or None"""
+        ordinal = date.toordinal()
+        index = bisect.bisect_left(self.days, ordinal)
+        if index < len(self.days) and self.days[index] == ordinal:
+            return index
+        return None
+
+    def set_day(self, date, reading, flag=DAY_MEASURED):
+        """Insert or replace the values for one day"""
+        ordinal = date.toordinal()
+        index = bisect.bisect_left(self.days, ordinal)
+        values = (reading.light, reading.fan, reading.plug)
+        with self.lock:
+            if index < len(self.days) and self.days[index] == ordinal:
+                for column, value in zip(self.columns(), values):
+                    column[index] = value
+                self.flags[index] = flag
+            else:
+                self.days.insert(index, ordinal)
+                for column, value in zip(self.columns(), values):
+                    column.insert(index, value)
+                self.flags.insert(index, flag)
+            if self.dense is not None:
+                data, flags, first = self.dense
+                if 0 <= ordinal - first < data.shape[1]:
+                    data[:, ordinal - first] = values
+                    flags[ordinal - first] = flag
+                else:
+                    self.dense = None  # Outside the span it was built for
+
+    def add_to_day(self, date, reading, flag):
+        """Add late energy (e.g. backfilled after a gap) to a day's totals"""
+        current = self.get(date) or ApplianceReading()
+        self.set_day(date, ApplianceReading(current.light + reading.light, current.fan + reading.fan,
+                                            current.plug + reading.plug), flag)
+
+    def get(self, date):
+        """Values for one day as an ApplianceReading, or None"""
+        index = self.index(date)
+        if index is None:
+            return None
+        return ApplianceReading(self.light[index], self.fan[index], self.plug[index])
+
+    def flag(self, date):
+        index = self.index(date)
+        return DAY_MISSING if index is None else self.flags[index]
+
+    def latest(self):
+        """Most recent day's values as an ApplianceReading, or None"""
+        if not self.days:
+            return None
+        return ApplianceReading(self.light[-1], self.fan[-1], self.plug[-1])
+
+    def window_matrix(self, days, today=None, missing=0.0):
+        """((3, days) light/fan/plug, (days,) DAY_* flags) for the last `days`
+        days ending today; `missing` (e.g. NaN) and DAY_MISSING where a day
+        has no entry"""
+        end = (today or datetime.date.today()).toordinal()
+        start = end - days + 1
+        data = np.full((3, days), np.nan)
+        flags = np.full(days, DAY_MISSING, dtype=np.int8)
+        with self.lock:
+            if self.days:
+                if self.dense is None:
+                    self.dense = self.build_dense()
+                dense, dense_flags, first = self.dense
+                lo = max(start, first)
+                hi = min(end + 1, first + dense.shape[1])
+                if hi > lo:
+                    data[:, lo - start:hi - start] = dense[:, lo - first:hi - first]
+                    flags[lo - start:hi - start] = dense_flags[lo - first:hi - first]
+        if not np.isnan(missing):
+            data[:, flags == DAY_MISSING] = missing
+        return data, flags
+
+    def build_dense(self):
+        """(3, span) values and (span,) flags indexed by ordinal - first day"""
+        # np.array copies, so no buffer export pins the arrays' size
+        ordinals = np.array(self.days, dtype=np.int64)
+        first = int(ordinals[0])
+        positions = ordinals - first
+        span = int(positions[-1]) + 1
+        data = np.full((3, span), np.nan)
+        data[:, positions] = np.array(self.columns(), dtype=np.float64)
+        flags = np.full(span, DAY_MISSING, dtype=np.int8)
+        flags[positions] = np.array(self.flags, dtype=np.int8)
+        return data, flags, first
+
+    def window(self, days, today=None, missing=0.0):
+        """(light, fan, plug) arrays of window_matrix()"""
+        data, _ = self.window_matrix(days, today, missing)
+        return data[0], data[1], data[2]
+
+    def window_flags(self, days, today=None):
+        """DAY_* flag per day of window(), DAY_MISSING where there is no entry"""
+        return self.window_matrix(days, today)[1]
+
+    def load(self, log_file=LOG_FILE):
+        """Parse the text log into the columns
+
+        A log without LOG_HEADER holds Amps readings: its lines go to
+        `legacy` and come back out of save() tagged, so they are kept but
+        never plotted or priced as kWh.
+        """
+        if not os.path.exists(log_file):
+            return
+        with open(log_file, "r") as f:
+            lines = f.read().splitlines()
+        kwh = bool(lines) and lines[0].strip() == LOG_HEADER
+        for line in lines:
+            if line.startswith(LEGACY_PREFIX):
+                self.legacy.append(line[len(LEGACY_PREFIX):])
+                continue
+            if not line.strip() or "light:" not in line or line.startswith("#"):
+                continue
+            if not kwh:
+                self.legacy.append(line)
+                continue
+            values = parse_line(line)
+            if values is not None:
+                self.set_day(*values)
+
+    def legacy_reading(self):
+        """Last current reading (Amps) of a pre-v2 log, or None"""
+        for line in reversed(self.legacy):
+            values = parse_line(line)
+            if values is not None:
+                return values[1]
+        return None
+
+    def format_line(self, index):
+        date = datetime.date.fromordinal(self.days[index]).strftime("%Y-%m-%d")
+        light, fan, plug = self.light[index], self.fan[index], self.plug[index]
+        gap = f" gap:{DAY_FLAG_NAMES[self.flags[index]]}" if self.flags[index] in DAY_FLAG_NAMES else ""
+        return f"{date} light:{light:.6f} fan:{fan:.6f} plug:{plug:.6f} total:{light + fan + plug:.6f}{gap}\n"
+
+    def save(self, log_file=LOG_FILE):
+        """Write every day back to the text log
+
+        The log is replaced atomically: a panel killed mid-write leaves the
+        previous log, never a truncated one that load() would misread.
+        """
+        lines = [LOG_HEADER + "\n"]
+        lines += (self.format_line(i) for i in range(len(self.days)))
+        lines += (f"{LEGACY_PREFIX}{line}\n" for line in self.legacy)
+        atomic_write(log_file, "".join(lines).encode())
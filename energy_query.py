@@ -0,0 +1,297 @@
+"""Range queries over the panel's energy data, from Python or local HTTP
+
+Each resolution is answered from the structure that already holds it, so
+a query only touches the slots in its range:
+
+    second  RingSeries of 1 s slots (the last day, since the panel started)
+    minute  RingSeries of 1 min slots (the last 30 days, since the panel started)
+    hour    TariffEngine's 15-minute bins (the open and previous billing period)
+    day     EnergyHistory (everything in energy_log.txt)
+
+    GET /query?start=2026-10-01&end=2026-10-19&resolution=day&series=light,fan&agg=p95
+"""
+import datetime
+import json
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from tariff import BINS_PER_DAY
+from logs import get_logger
+
+QUERY_HOST = os.environ.get("QUERY_HOST", "127.0.0.1")
+QUERY_PORT = int(os.environ.get("QUERY_PORT", "9109"))
+SECOND_HISTORY = 86400      # 1 s slots kept (one day)
+MINUTE_HISTORY = 30 * 1440  # 1 min slots kept (30 days)
+MAX_SLOTS = 100000          # Per query, so one request can't allocate without bound
+MAX_TIMESTAMP = 253402300799.0  # 9999-12-31T23:59:59Z
+
+RESOLUTIONS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+# Rows of (light, fan, plug) each series sums; L1 feeds lights + plugs, L2 the fans
+SERIES = {
+    "light": (0,), "fan": (1,), "plug": (2,),
+    "L1": (0, 2), "L2": (1,),
+    "total": (0, 1, 2),
+}
+UNITS = ("kwh", "w")
+
+log = get_logger("query")
+
+
+class QueryError(ValueError):
+    """Raised for a query that can't be answered (bad range, name, aggregate)"""
+
+
+def to_timestamp(value, zone=None):
+    """Epoch seconds from a number, date, datetime or ISO string (naive = local)"""
+    original = value
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            try:
+                value = datetime.datetime.fromisoformat(value)
+            except ValueError:
+                raise QueryError(f"bad time {value!r}") from None
+    if isinstance(value, (int, float)):
+        timestamp = float(value)
+    else:
+        if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+            value = datetime.datetime.combine(value, datetime.time())
+        try:
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=zone) if zone is not None else value.astimezone()
+            timestamp = value.timestamp()
+        except (OverflowError, OSError, ValueError):
+            raise QueryError(f"time out of range {original!r}") from None
+    if not 0.0 <= timestamp <= MAX_TIMESTAMP:  # Also false for NaN
+        raise QueryError(f"time out of range {original!r}")
+    return timestamp
+
+
+def aggregate(values, name):
+    """sum / mean / max / min / pNN of one series, ignoring empty slots"""
+    present = values[~np.isnan(values)]
+    if not len(present):
+        return None
+    if name == "sum":
+        return float(present.sum())
+    if name == "mean":
+        return float(present.mean())
+    if name == "max":
+        return float(present.max())
+    if name == "min":
+        return float(present.min())
+    if name.startswith("p"):
+        try:
+            pct = float(name[1:])
+        except ValueError:
+            pct = -1.0
+        if 0.0 <= pct <= 100.0:
+            return float(np.percentile(present, pct))
+    raise QueryError(f"unknown aggregate {name!r}")
+
+
+class RingSeries:
+    """(light, fan, plug) kWh in fixed epoch-aligned slots, newest `capacity` kept
+
+    Slot n covers [n * step, (n + 1) * step). NaN means no data (before the
+    first interval or older than the ring); slots skipped over are zero.
+    """
+    def __init__(self, step, capacity):
+        self.step = step
+        self.capacity = capacity
+        self.values = np.full((3, capacity), np.nan)
+        self.newest = None  # Slot number of the latest interval
+
+    def add(self, start, end, reading):
+        """Spread energy used over [start, end) across the slots it covers"""
+        kwh = np.array([reading.light, reading.fan, reading.plug])
+        first = int(start // self.step)
+        if end > start:
+            last = max(first, int(math.ceil(end / self.step)) - 1)
+            edges = np.arange(first, last + 2) * float(self.step)
+            shares = (np.minimum(edges[1:], end) - np.maximum(edges[:-1], start)) / (end - start)
+        else:
+            last = first
+            shares = np.ones(1)
+        if self.newest is None:
+            self.newest = first - 1
+        self.advance(last)
+        slots = np.arange(first, last + 1)
+        keep = slots > self.newest - self.capacity  # Older slots have left the ring
+        self.values[:, slots[keep] % self.capacity] += kwh[:, None] * shares[keep]
+
+    def advance(self, slot):
+        """Make `slot` the newest, zeroing the slots in between"""
+        if slot <= self.newest:
+            return
+        if slot - self.newest >= self.capacity:
+            self.values[:] = 0.0
+        else:
+            self.values[:, np.arange(self.newest + 1, slot + 1) % self.capacity] = 0.0
+        self.newest = slot
+
+    def read(self, first, count):
+        """(3, count) kWh for slots first .. first + count - 1"""
+        result = np.full((3, count), np.nan)
+        if self.newest is None:
+            return result
+        slots = np.arange(first, first + count)
+        valid = (slots <= self.newest) & (slots > self.newest - self.capacity)
+        result[:, valid] = self.values[:, slots[valid] % self.capacity]
+        return result
+
+
+class EnergyQuery:
+    """Answers range queries from the in-memory indexes listed above
+
+    `history` and `bins` are the panel's own EnergyHistory and
+    TariffEngine.bins; the owner re-points them when it reloads. Feed every
+    rollover interval to `add()` for the second and minute rings.
+    """
+    def __init__(self, history=None, bins=None, zone=None):
+        self.history = history
+        self.bins = bins if bins is not None else {}
+        self.zone = zone
+        self.seconds = RingSeries(1, SECOND_HISTORY)
+        self.minutes = RingSeries(60, MINUTE_HISTORY)
+
+    def add(self, start, end, reading):
+        self.seconds.add(start, end, reading)
+        self.minutes.add(start, end, reading)
+
+    def local(self, timestamp):
+        return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).astimezone(self.zone)
+
+    def wall_clock(self, start, step, count):
+        """Local "YYYY-MM-DDTHH:MM:SS" labels for count slots of step seconds"""
+        offset = self.local(start).utcoffset()
+        if offset != self.local(start + (count - 1) * step).utcoffset():
+            # Crosses a DST change: label slot by slot
+            return [self.local(start + i * step).replace(tzinfo=None).isoformat(timespec="seconds")
+                    for i in range(count)]
+        seconds = np.arange(count, dtype=np.int64) * step + int(start + offset.total_seconds())
+        return np.datetime_as_string(seconds.astype("datetime64[s]")).tolist()
+
+    def query(self, start, end, resolution="hour", series=("total",), agg=None, unit="kwh"):
+        """Slot values (or one aggregate) per series over [start, end)
+
+        Returns {"resolution", "unit", "times", "series": {name: [..] or value}};
+        empty slots are None.
+        """
+        start, end = to_timestamp(start, self.zone), to_timestamp(end, self.zone)
+        if end <= start:
+            raise QueryError("end must be after start")
+        if resolution not in RESOLUTIONS:
+            raise QueryError(f"unknown resolution {resolution!r}")
+        if unit not in UNITS:
+            raise QueryError(f"unknown unit {unit!r}")
+        unknown = [name for name in series if name not in SERIES]
+        if unknown:
+            raise QueryError(f"unknown series {', '.join(unknown)}")
+        if (end - start) / RESOLUTIONS[resolution] > MAX_SLOTS:
+            raise QueryError(f"at most {MAX_SLOTS} {resolution} slots per query; narrow the range")
+
+        times, kwh = getattr(self, "read_" + resolution)(start, end, labels=not agg)
+        if unit == "w":
+            kwh = kwh * (3.6e6 / RESOLUTIONS[resolution])
+        result = {"resolution": resolution, "unit": unit, "series": {}}
+        for name in series:
+            values = kwh[list(SERIES[name])].sum(axis=0)  # NaN stays NaN
+            if agg:
+                result["series"][name] = aggregate(values, agg)
+            else:
+                result["series"][name] = np.where(np.isnan(values), None, values).tolist()
+        if agg:
+            result["agg"] = agg
+            result["count"] = int((~np.isnan(kwh[0])).sum())
+        else:
+            result["times"] = times
+        return result
+
+    def read_ring(self, ring, start, end, labels):
+        first = int(start // ring.step)
+        count = int(math.ceil(end / ring.step)) - first
+        if count > ring.capacity + 1:  # +1: an unaligned range touches a partial slot at each end
+            raise QueryError(f"at most {ring.capacity} slots of {ring.step} s are kept; narrow the range")
+        times = None
+        if labels:
+            times = self.wall_clock(first * ring.step, ring.step, count)
+        return times, ring.read(first, count)
+
+    def read_second(self, start, end, labels=True):
+        return self.read_ring(self.seconds, start, end, labels)
+
+    def read_minute(self, start, end, labels=True):
+        return self.read_ring(self.minutes, start, end, labels)
+
+    def read_hour(self, start, end, labels=True):
+        first, last = self.local(start), self.local(end - 1e-6)
+        bins = dict(self.bins)  # Atomic copy; the GUI thread may add a day meanwhile
+        days = (last.date() - first.date()).days + 1
+        kwh = np.full((3, days, 24), np.nan)
+        for i in range(days):
+            values = bins.get(first.date() + datetime.timedelta(days=i))
+            if values is not None:
+                kwh[:, i] = values.reshape(3, 24, BINS_PER_DAY // 24).sum(axis=2)
+        lo = first.hour
+        hi = (days - 1) * 24 + last.hour + 1
+        times = None
+        if labels:
+            times = [datetime.datetime.combine(first.date() + datetime.timedelta(days=h // 24),
+                                               datetime.time(h % 24)).isoformat(timespec="seconds")
+                     for h in range(lo, hi)]
+        return times, kwh.reshape(3, days * 24)[:, lo:hi]
+
+    def read_day(self, start, end, labels=True):
+        first, last = self.local(start).date(), self.local(end - 1e-6).date()
+        days = (last - first).days + 1
+        if self.history is None:
+            kwh = np.full((3, days), np.nan)
+        else:
+            kwh = self.history.window_matrix(days, today=last, missing=np.nan)[0]
+        times = [(first + datetime.timedelta(days=i)).isoformat() for i in range(days)] if labels else None
+        return times, kwh
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """GET /query?start=..&end=..[&resolution=hour][&series=a,b][&agg=sum|mean|max|min|pNN][&unit=kwh|w]"""
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/query":
+            self.send_error(404)
+            return
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if "start" not in params or "end" not in params:
+                raise QueryError("start and end are required")
+            result = self.server.engine.query(
+                params["start"], params["end"], params.get("resolution", "hour"),
+                params.get("series", "total").split(","), params.get("agg"), params.get("unit", "kwh"))
+            status, body = 200, result
+        except QueryError as e:
+            status, body = 400, {"error": str(e)}
+        except Exception as e:
+            log.exception("Query %s failed", self.path)
+            status, body = 500, {"error": str(e)}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_query_server(engine, host=QUERY_HOST, port=QUERY_PORT):
+    """Serve /query from a daemon thread"""
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.engine = engine
+    threading.Thread(target=server.serve_forever, name="query-http", daemon=True).start()
+    return server
@@ -0,0 +1,351 @@
+"""Fleet collector: per-home, per-circuit energy rollups for many houses
+
+Subscribes to every home's energy topic (`<home>/home/light/energy`) and
+hands the raw frames to worker processes, sharded by home id. Each worker
+decodes its frames and keeps its homes' aggregates for the current day in
+numpy columns. Every `interval` seconds each worker writes its columns as
+one .npy table, which `load_day()` / `rollup()` read back. A restarted
+collector picks the day up from the newest tables, even with a different
+number of workers:
+
+    python fleet.py --workers 4 --interval 60
+"""
+import argparse
+import glob
+import io
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import zlib
+import numpy as np
+import paho.mqtt.client as mqtt
+from energy_frames import EnergyDecoder, FrameError
+from rollover import DayClock, GAP_SECONDS
+from settings_store import atomic_write
+from logs import get_logger, setup_logging
+
+BROKER = os.environ.get("MQTT_BROKER", "broker.hivemq.com")
+PORT = int(os.environ.get("MQTT_PORT", "1883"))
+FLEET_TOPIC = os.environ.get("FLEET_TOPIC", "+/home/light/energy")  # First level is the home id
+FLEET_WORKERS = int(os.environ.get("FLEET_WORKERS", "0")) or os.cpu_count() or 1
+SNAPSHOT_DIR = os.environ.get("FLEET_SNAPSHOT_DIR", "fleet_snapshots")
+SNAPSHOT_INTERVAL = 60  # Seconds between columnar snapshots
+BATCH_SIZE = 256        # Frames per queue put; pickling one list beats one put per frame
+BATCH_SECONDS = 0.05    # Longest a frame waits in a partial batch
+QUEUE_BATCHES = 64      # Batches queued per shard before the MQTT thread blocks
+INITIAL_ROWS = 64
+
+# One column per aggregate; counters are the device's last cumulative kWh
+FIELDS = (
+    ("frames", "<i8"), ("errors", "<i8"), ("gaps", "<i8"), ("resets", "<i8"),
+    ("last_seen", "<f8"),
+    ("l1_kwh", "<f8"), ("l2_kwh", "<f8"),
+    ("l1_power_sum", "<f8"), ("l2_power_sum", "<f8"),
+    ("l1_peak_w", "<f8"), ("l2_peak_w", "<f8"),
+    ("l1_counter", "<f8"), ("l2_counter", "<f8"),
+)
+DAY_FIELDS = ("frames", "errors", "gaps", "resets", "l1_kwh", "l2_kwh",
+              "l1_power_sum", "l2_power_sum", "l1_peak_w", "l2_peak_w")
+SNAPSHOT_DTYPE = np.dtype([("home", "U64")] + list(FIELDS))
+
+log = get_logger("fleet")
+
+
+def shard_of(home, shards):
+    """Stable across processes and runs, unlike hash()"""
+    return zlib.crc32(home.encode()) % shards
+
+
+def shard_path(directory, day, shard, shards):
+    return os.path.join(directory, f"{day}-shard{shard:03d}-of{shards:03d}.npy")
+
+
+def day_files(day, directory=SNAPSHOT_DIR):
+    """Tables of the newest shard layout written for a day ("YYYY-MM-DD")
+
+    A collector restarted with another worker count leaves the old
+    layout's files behind; reading both would count their homes twice.
+    """
+    layouts = {}
+    for path in glob.glob(os.path.join(directory, f"{day}-shard*-of*.npy")):
+        try:
+            shards = int(path[:-len(".npy")].rsplit("-of", 1)[1])
+        except ValueError:
+            continue
+        layouts.setdefault(shards, []).append(path)
+    if not layouts:
+        return []
+    newest = max(layouts, key=lambda shards: max(os.path.getmtime(p) for p in layouts[shards]))
+    return sorted(layouts[newest])
+
+
+class ShardStore:
+    """Aggregates for one shard's homes, one numpy column per field
+
+    Energy comes from deltas of the device counters, like RolloverEngine:
+    a counter that went backwards means the ESP32 rebooted. Deltas
+    telescope, so a gap is backfilled by the first frame after it (and
+    counted in `gaps`). At the day boundary the finished day is saved and
+    the day columns start again; the counters carry over.
+    """
+    def __init__(self, clock=None):
+        self.clock = clock or DayClock()
+        self.decoder = EnergyDecoder()
+        self.rows = {}  # home -> row
+        self.homes = []
+        self.columns = {name: np.zeros(INITIAL_ROWS, dtype) for name, dtype in FIELDS}
+        self.day = None
+        self.day_end = 0.0
+        self.on_day_closed = None  # Callback(store) before the day columns reset
+
+    def __len__(self):
+        return len(self.homes)
+
+    def row(self, home):
+        row = self.rows.get(home)
+        if row is None:
+            row = self.rows[home] = len(self.homes)
+            self.homes.append(home)
+            if row == len(self.columns["frames"]):
+                for name, column in self.columns.items():
+                    self.columns[name] = np.concatenate((column, np.zeros_like(column)))
+            for name in ("last_seen", "l1_counter", "l2_counter"):
+                self.columns[name][row] = np.nan
+        return row
+
+    def add(self, home, received, payload):
+        if received >= self.day_end:
+            self.roll(received)
+        c = self.columns
+        row = self.row(home)
+        try:
+            sample = self.decoder.decode(payload, received)
+        except FrameError:
+            c["errors"][row] += 1
+            return
+        last_seen = c["last_seen"][row]
+        if received < last_seen:
+            return  # Older than a frame already counted: its counters would read as a reboot
+        if received - last_seen > GAP_SECONDS:
+            c["gaps"][row] += 1
+        c["last_seen"][row] = received
+        c["frames"][row] += 1
+        for circuit, power, counter in (("l1", sample.l1_power, sample.l1_energy),
+                                        ("l2", sample.l2_power, sample.l2_energy)):
+            last = c[circuit + "_counter"][row]
+            if counter >= last:
+                c[circuit + "_kwh"][row] += counter - last
+            elif counter < last:
+                c[circuit + "_kwh"][row] += counter  # Rebooted: counting from zero again
+                c["resets"][row] += 1
+            # NaN (first frame of a home) compares False both ways: nothing to add yet
+            c[circuit + "_counter"][row] = counter
+            c[circuit + "_power_sum"][row] += power
+            if power > c[circuit + "_peak_w"][row]:
+                c[circuit + "_peak_w"][row] = power
+
+    def roll(self, received):
+        """Close the day a frame at `received` is past, if one is open"""
+        if self.day is not None and self.homes:
+            if self.on_day_closed:
+                self.on_day_closed(self)
+            for name in DAY_FIELDS:
+                self.columns[name][:] = 0
+        self.day = self.clock.day_of(received)
+        self.day_end = self.clock.day_end(self.day)
+
+    def restore(self, table, day):
+        """Continue `day` from saved rows (a table of this shard's homes)"""
+        self.day = day
+        self.day_end = self.clock.day_end(day)
+        for record in table:
+            row = self.row(str(record["home"]))
+            for name, _ in FIELDS:
+                self.columns[name][row] = record[name]
+
+    def table(self):
+        """Structured-array copy of the live rows"""
+        count = len(self.homes)
+        table = np.empty(count, SNAPSHOT_DTYPE)
+        table["home"] = self.homes
+        for name, column in self.columns.items():
+            table[name] = column[:count]
+        return table
+
+    def save(self, directory, shard, shards):
+        if self.day is None:
+            return None
+        buffer = io.BytesIO()
+        np.save(buffer, self.table(), allow_pickle=False)
+        path = shard_path(directory, self.day.isoformat(), shard, shards)
+        atomic_write(path, buffer.getvalue())
+        return path
+
+
+SNAPSHOT = "snapshot"
+
+
+def run_shard(shard, jobs, directory, shards, day=None, sources=()):
+    """Worker process: apply batches, save on SNAPSHOT, save and exit on None
+
+    `sources` are the day's tables from before a restart; this shard's
+    homes are taken over from them and saved in the new layout at once.
+    """
+    # Ctrl-C reaches the whole process group; the collector drains and stops us
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    store = ShardStore()
+    store.on_day_closed = lambda s: s.save(directory, shard, shards)
+    if sources:
+        for path in sources:
+            table = np.load(path)
+            mine = np.array([shard_of(str(home), shards) == shard for home in table["home"]], dtype=bool)
+            store.restore(table[mine], day)
+        store.save(directory, shard, shards)
+    while True:
+        job = jobs.get()
+        if job is None or job == SNAPSHOT:
+            store.save(directory, shard, shards)
+            if job is None:
+                return
+            continue
+        for home, received, payload in job:
+            store.add(home, received, payload)
+
+
+class FleetCollector:
+    """Fans frames from the MQTT thread out to one worker process per shard"""
+    def __init__(self, workers=FLEET_WORKERS, directory=SNAPSHOT_DIR, interval=SNAPSHOT_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        # Chosen once here: the workers' first saves make a newer layout
+        day = DayClock().day_of(time.time())
+        sources = day_files(day.isoformat(), directory)
+        self.queues = [multiprocessing.Queue(QUEUE_BATCHES) for _ in range(workers)]
+        self.processes = [multiprocessing.Process(target=run_shard,
+                                                  args=(i, q, directory, workers, day, sources),
+                                                  name=f"fleet-shard-{i}", daemon=True)
+                          for i, q in enumerate(self.queues)]
+        self.batches = [[] for _ in range(workers)]
+        # Per shard: a batch is detached and queued under one hold, so the
+        # MQTT and flusher threads can't reorder a home's frames
+        self.locks = [threading.Lock() for _ in range(workers)]
+        self.running = False
+        self.received = [0] * workers  # Frames per shard
+        self.client = None
+        self.thread = threading.Thread(target=self.run, name="fleet-flusher", daemon=True)
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        self.running = True
+        self.thread.start()
+
+    def connect(self, broker=BROKER, port=PORT, topic=FLEET_TOPIC):
+        self.client = mqtt.Client()
+        self.client.on_connect = lambda client, userdata, flags, rc: client.subscribe(topic)
+        self.client.on_message = self.on_message
+        self.client.connect(broker, port, 60)
+        self.client.loop_start()
+
+    def on_message(self, client, userdata, msg):
+        self.dispatch(msg.topic.split("/", 1)[0], msg.payload)
+
+    def dispatch(self, home, payload, received=None):
+        received = received if received is not None else time.time()
+        shard = shard_of(home, len(self.queues))
+        with self.locks[shard]:
+            self.received[shard] += 1
+            batch = self.batches[shard]
+            batch.append((home, received, payload))
+            if len(batch) >= BATCH_SIZE:
+                self.batches[shard] = []
+                self.queues[shard].put(batch)  # Blocks while the shard is QUEUE_BATCHES behind
+
+    def flush(self):
+        for shard, lock in enumerate(self.locks):
+            with lock:
+                batch = self.batches[shard]
+                if batch:
+                    self.batches[shard] = []
+                    self.queues[shard].put(batch)
+
+    def snapshot(self):
+        """Ask every worker to save its columns; they write in parallel"""
+        self.flush()
+        for jobs in self.queues:
+            jobs.put(SNAPSHOT)
+
+    def run(self):
+        due = time.monotonic() + self.interval
+        while self.running:
+            time.sleep(BATCH_SECONDS)
+            self.flush()
+            if time.monotonic() >= due:
+                due += self.interval
+                self.snapshot()
+
+    def stop(self):
+        """Drain every queued frame, write final snapshots and stop the workers"""
+        if self.client:
+            self.client.loop_stop()
+            self.client.disconnect()
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join()
+        self.flush()
+        for jobs in self.queues:
+            jobs.put(None)
+        for process in self.processes:
+            process.join()
+
+
+def load_day(day, directory=SNAPSHOT_DIR):
+    """Every shard's latest snapshot for a day ("YYYY-MM-DD") as one table"""
+    parts = [np.load(path) for path in day_files(day, directory)]
+    return np.concatenate(parts) if parts else np.empty(0, SNAPSHOT_DTYPE)
+
+
+def rollup(table):
+    """Fleet-wide totals of a snapshot table"""
+    frames = table["frames"]
+    return {
+        "homes": len(table),
+        "frames": int(frames.sum()),
+        "errors": int(table["errors"].sum()),
+        "gaps": int(table["gaps"].sum()),
+        "l1_kwh": float(table["l1_kwh"].sum()),
+        "l2_kwh": float(table["l2_kwh"].sum()),
+        "mean_power_w": float(((table["l1_power_sum"] + table["l2_power_sum"])
+                               / np.maximum(frames, 1)).sum()),
+        "top_home": str(table["home"][np.argmax(table["l1_kwh"] + table["l2_kwh"])]) if len(table) else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=FLEET_WORKERS, help="shard processes")
+    parser.add_argument("--topic", default=FLEET_TOPIC)
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+    parser.add_argument("--interval", type=float, default=SNAPSHOT_INTERVAL, help="seconds between snapshots")
+    args = parser.parse_args()
+
+    setup_logging()
+    collector = FleetCollector(args.workers, args.snapshot_dir, args.interval)
+    collector.start()
+    collector.connect(topic=args.topic)
+    log.info("Collecting %s with %d shard(s)", args.topic, args.workers)
+    clock = DayClock()
+    try:
+        while True:
+            time.sleep(args.interval)
+            log.info("Fleet rollup: %s", rollup(load_day(clock.day_of(time.time()).isoformat(),
+                                                         args.snapshot_dir)))
+    except KeyboardInterrupt:
+        collector.stop()
+
+
+if __name__ == "__main__":
+    main()
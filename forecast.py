@@ -0,0 +1,156 @@
+import datetime
+import numpy as np
+
+HOURS = 24
+PROFILE_ALPHA = 0.2      # Weight of each new week in a (weekday, hour) slot once warmed up
+WARMUP_WEEKS = 5         # Plain running mean until a slot has this many samples
+GAP_SECONDS = 300        # An interval longer than this (downtime) leaves its hour incomplete
+
+
+class Projection:
+    __slots__ = ("today_kwh", "today_cost", "period_kwh", "period_cost")
+
+    def __init__(self, today_kwh, today_cost, period_kwh, period_cost):
+        self.today_kwh = today_kwh      # (3,) light/fan/plug by the end of today
+        self.today_cost = today_cost
+        self.period_kwh = period_kwh    # Whole billing period
+        self.period_cost = period_cost
+
+
+class ConsumptionForecast:
+    """End-of-day and end-of-period kWh from seasonal weekday × hour averages
+
+    Each complete hour updates one slot of a (circuit, weekday, hour) kWh
+    profile, then the per-weekday suffix sums are rebuilt (a fixed 3×7×24
+    pass, once an hour). A sample only adds to the open hour and a
+    projection reads a few of those sums, so both are constant time.
+    """
+    def __init__(self, zone=None):
+        self.zone = zone
+        self.profile = np.zeros((3, 7, HOURS))
+        self.counts = np.zeros((7, HOURS), dtype=int)
+        # Profile with slots not learned yet set to the mean of the learned ones
+        self.filled = np.zeros((3, 7, HOURS))
+        self.suffix = np.zeros((3, 7, HOURS + 1))  # kWh from hour h to the end of weekday w
+        self.hour_key = None            # (date, hour) of the open hour
+        self.hour_kwh = np.zeros(3)
+        self.hour_complete = False      # Open hour seen from its start
+        self.today = None
+        self.today_kwh = np.zeros(3)
+
+    def local(self, timestamp):
+        return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).astimezone(self.zone)
+
+    @property
+    def learned(self):
+        return bool(self.counts.any())
+
+    def learn(self, weekday, hour, kwh):
+        """Fold one complete hour into the profile"""
+        count = self.counts[weekday, hour]
+        weight = 1.0 / (count + 1) if count < WARMUP_WEEKS else PROFILE_ALPHA
+        self.profile[:, weekday, hour] += weight * (kwh - self.profile[:, weekday, hour])
+        self.counts[weekday, hour] = count + 1
+
+    def rebuild(self):
+        known = self.counts > 0
+        self.filled = self.profile.copy()
+        if known.any():
+            self.filled[:, ~known] = self.profile[:, known].mean(axis=1)[:, None]
+        self.suffix[:, :, :HOURS] = np.cumsum(self.filled[:, :, ::-1], axis=2)[:, :, ::-1]
+
+    def add(self, start, end, reading):
+        """Energy for [start, end) from the rollover engine, booked at `end`"""
+        local = self.local(end)
+        key = (local.date(), local.hour)
+        if key != self.hour_key:
+            if self.hour_key is not None and self.hour_complete:
+                day, hour = self.hour_key
+                self.learn(day.weekday(), hour, self.hour_kwh)
+                self.rebuild()
+            self.hour_complete = self.hour_key is not None
+            self.hour_key = key
+            self.hour_kwh = np.zeros(3)
+        if end - start > GAP_SECONDS:
+            self.hour_complete = False
+        if local.date() != self.today:
+            self.today = local.date()
+            self.today_kwh = np.zeros(3)
+        kwh = np.array([reading.light, reading.fan, reading.plug])
+        self.hour_kwh += kwh
+        self.today_kwh += kwh
+
+    def seed(self, bins, bins_per_hour, now):
+        """Learn the complete days of {date: (3, bins) kWh} (the tariff bins)
+        and take today's energy so far from them"""
+        local = self.local(now)
+        for day in sorted(d for d in bins if d < local.date()):
+            hourly = bins[day].reshape(3, HOURS, bins_per_hour).sum(axis=2)
+            for hour in range(HOURS):
+                self.learn(day.weekday(), hour, hourly[:, hour])
+        self.rebuild()
+        today = bins.get(local.date())
+        if today is not None and self.today is None:
+            self.today = local.date()
+            self.today_kwh = today.sum(axis=1)
+            self.hour_key = (local.date(), local.hour)
+            self.hour_kwh = today[:, local.hour * bins_per_hour:(local.hour + 1) * bins_per_hour].sum(axis=1)
+            self.hour_complete = False
+
+    def remaining_today(self, local):
+        """Expected kWh per circuit per remaining hour of today, (3, hours)"""
+        weekday, hour = local.weekday(), local.hour
+        if not self.learned:
+            # Nothing learned yet: carry on at today's average rate
+            elapsed = max(hour + local.minute / 60.0, 1.0)
+            rest = np.repeat((self.today_kwh / elapsed)[:, None], HOURS - hour, axis=1)
+        else:
+            rest = self.filled[:, weekday, hour:].copy()
+        rest[:, 0] = np.maximum(rest[:, 0] - self.hour_kwh, 0.0)
+        return rest
+
+    def project(self, now, engine):
+        """Projection for today and the billing period, priced by a TariffEngine"""
+        local = self.local(now)
+        if self.today != local.date():
+            return None
+        tariff = engine.tariff
+        multipliers = tariff.hour_multipliers
+        rest = self.remaining_today(local)
+        today_extra = rest.sum()
+        today_weighted = rest.sum(axis=0) @ multipliers[local.hour:]
+
+        # Whole days left in the period, counted per weekday
+        end = period_end(tariff, local.date())
+        days = (end - local.date()).days - 1
+        first = (local.weekday() + 1) % 7
+        counts = np.full(7, days // 7)
+        counts[(first + np.arange(days % 7)) % 7] += 1
+        if self.learned:
+            daily = self.suffix[:, :, 0].sum(axis=0)                 # kWh per weekday
+            weighted = self.filled.sum(axis=0) @ multipliers         # Same, time-of-use weighted
+        else:
+            daily = np.full(7, self.today_kwh.sum() + today_extra)   # Like today
+            weighted = daily * multipliers.mean()
+        later_extra = counts @ daily
+        later_weighted = counts @ weighted
+
+        def price(used, extra, weighted_kwh):
+            if extra <= 0:
+                return 0.0
+            slab = float(tariff.slab_cost(used + extra) - tariff.slab_cost(used))
+            return slab * weighted_kwh / extra
+
+        used = engine.period_kwh
+        today_cost = engine.day_cost.get(local.date(), 0.0) + price(used, today_extra, today_weighted)
+        period_extra = today_extra + later_extra
+        period_cost = engine.period_cost.sum() + price(used, period_extra, today_weighted + later_weighted)
+        return Projection(self.today_kwh + rest.sum(axis=1), today_cost, used + period_extra, period_cost)
+
+
+def period_end(tariff, day):
+    """First day of the billing period after the one containing `day`"""
+    start = tariff.period_start(day)
+    month = start.month % 12 + 1
+    year = start.year + (start.month == 12)
+    return start.replace(year=year, month=month)
@@ -0,0 +1,149 @@
+"""Shared appliance state for every panel in the house
+
+One process runs the `HomeState` service: a panel started with
+HOME_STATE_SERVICE=1, or `python home_state.py` as a small daemon. It
+watches the relay command topics, so taps on any panel, motion lights and
+timers are all seen in the order the ESP32 receives them. Each change goes
+out as a small delta, and the full snapshot is kept as a retained message.
+
+Every panel keeps a `StateReplica`. On connect it subscribes to the
+snapshot topic and the broker hands it the retained snapshot (one bulk
+sync, no event replay). After that it drops the subscription and follows
+the deltas. A gap in revisions, or a restarted service (new epoch), sends
+it back to the snapshot.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from metrics import metrics
+from logs import get_logger
+
+STATE_DELTA_TOPIC = "home/state/delta"
+STATE_SNAPSHOT_TOPIC = "home/state/snapshot"
+STATE_SERVICE = os.environ.get("HOME_STATE_SERVICE", "0") == "1"  # Host the service in this panel
+MAX_PENDING_DELTAS = 64  # Deltas held while a snapshot is on its way
+
+log = get_logger("state")
+
+
+def decode(payload):
+    """Parse a delta or snapshot; None if malformed"""
+    try:
+        document = json.loads(payload)
+        return document if isinstance(document["epoch"], str) and isinstance(document["rev"], int) else None
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class HomeState:
+    """The authoritative copy: appliance_id -> "ON"/"OFF" plus a revision
+
+    `epoch` is new on every start, so replicas can tell a restarted service
+    (revisions begin again) from a gap.
+    """
+    def __init__(self, publish):
+        self.publish = publish  # publish(topic, payload, retain=...)
+        self.epoch = uuid.uuid4().hex[:8]
+        self.rev = 0
+        self.states = {}
+        self.lock = threading.Lock()
+
+    def handle_command(self, appliance_id, state):
+        """A relay command was seen on the broker"""
+        self.update({appliance_id: state})
+
+    def adopt(self, states):
+        """Take over the states of a previous service's retained snapshot"""
+        with self.lock:
+            if self.rev:
+                return  # Already serving our own changes
+        self.update(states)
+
+    def update(self, states):
+        # Published under the lock so deltas leave in revision order
+        with self.lock:
+            changes = {k: v for k, v in states.items() if self.states.get(k) != v}
+            if not changes:
+                return
+            self.states.update(changes)
+            self.rev += 1
+            delta = {"epoch": self.epoch, "rev": self.rev, "changes": changes}
+            snapshot = {"epoch": self.epoch, "rev": self.rev, "states": self.states}
+            self.publish(STATE_DELTA_TOPIC, json.dumps(delta))
+            self.publish(STATE_SNAPSHOT_TOPIC, json.dumps(snapshot), retain=True)
+
+
+class StateReplica:
+    """A panel's read-only copy of the shared state
+
+    `handle_snapshot` / `handle_delta` return the {appliance_id: state}
+    changes they applied, empty when nothing visible changed.
+    """
+    def __init__(self, resync):
+        self.resync = resync  # Re-subscribes to STATE_SNAPSHOT_TOPIC
+        self.epoch = None
+        self.rev = 0
+        self.states = {}
+        self.synced = False
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.states)
+
+    def reset(self):
+        """Forget sync progress, e.g. after a reconnect; states are kept for display"""
+        with self.lock:
+            self.synced = False
+            self.pending = []
+
+    def handle_snapshot(self, document):
+        with self.lock:
+            if self.synced and document["epoch"] == self.epoch and document["rev"] <= self.rev:
+                return {}
+            states = document.get("states", {})
+            changes = {k: v for k, v in states.items() if self.states.get(k) != v}
+            self.states = dict(states)
+            self.epoch = document["epoch"]
+            self.rev = document["rev"]
+            self.synced = True
+            pending, self.pending = self.pending, []
+        for delta in sorted(pending, key=lambda d: d["rev"]):
+            if delta["epoch"] == self.epoch:
+                changes.update(self.handle_delta(delta))
+        return changes
+
+    def handle_delta(self, document):
+        with self.lock:
+            if not self.synced:
+                if len(self.pending) < MAX_PENDING_DELTAS:
+                    self.pending.append(document)
+                return {}
+            if document["epoch"] == self.epoch and document["rev"] <= self.rev:
+                return {}  # Already in the snapshot
+            if document["epoch"] != self.epoch or document["rev"] != self.rev + 1:
+                log.info("State %s:%d after %s:%d, resyncing", document["epoch"], document["rev"],
+                         self.epoch, self.rev)
+                self.synced = False
+                self.pending = [document]
+            else:
+                changes = document.get("changes", {})
+                self.states.update(changes)
+                self.rev = document["rev"]
+                return dict(changes)
+        metrics.state_resyncs.inc()
+        self.resync()
+        return {}
+
+
+if __name__ == "__main__":
+    from logs import setup_logging
+    setup_logging()
+    from mqtt_client import mqtt_client
+    mqtt_client.serve_state()
+    log.info("Serving shared home state")
+    while True:
+        time.sleep(3600)  # paho's network thread does the work
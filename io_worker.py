@@ -0,0 +1,95 @@
+import collections
+import itertools
+import threading
+import time
+from PySide6.QtCore import QObject, Signal
+from metrics import metrics
+from logs import get_logger, rate_limited
+
+IO_QUEUE_SIZE = 32       # Pending jobs before new ones are dropped
+SLOW_IO_SECONDS = 0.1    # Jobs slower than this are reported (SD-card stalls)
+
+log = get_logger("io")
+slow_log = rate_limited("io.slow")
+
+
+class IOWorker(QObject):
+    """Single background thread that owns the panel's file I/O
+
+    Jobs are plain callables queued under a key. With `coalesce=True` a job
+    replaces any not-yet-started job of the same key (latest state wins), so
+    a slow disk turns a burst of saves into one write instead of a backlog.
+    Other jobs are rejected once IO_QUEUE_SIZE are pending. Results come
+    back on the GUI thread through the `done` / `failed` signals.
+    """
+    done = Signal(str, object)   # key, return value
+    failed = Signal(str, str)    # key, error message
+
+    def __init__(self, maxsize=IO_QUEUE_SIZE, name="io-worker", slow_seconds=SLOW_IO_SECONDS):
+        super().__init__()
+        self.maxsize = maxsize
+        self.slow_seconds = slow_seconds  # None: don't report slow jobs
+        self.jobs = collections.OrderedDict()  # slot -> (key, fn, args)
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, key, fn, *args, coalesce=False):
+        """Queue fn(*args); returns False if the job was dropped"""
+        with self.condition:
+            if coalesce and key in self.jobs:
+                self.jobs[key] = (key, fn, args)  # Keeps its place in line
+                metrics.io_jobs_coalesced.inc(key=key)
+                return True
+            if len(self.jobs) >= self.maxsize or not self.running:
+                metrics.io_jobs_dropped.inc(key=key)
+                slow_log.warning("I/O queue full, dropped %s", key)
+                return False
+            slot = key if coalesce else (key, next(self.sequence))
+            self.jobs[slot] = (key, fn, args)
+            metrics.io_queue_depth.set(len(self.jobs))
+            self.condition.notify()
+        return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.jobs:
+                    self.condition.wait()
+                if not self.jobs:
+                    return
+                _, (key, fn, args) = self.jobs.popitem(last=False)
+                metrics.io_queue_depth.set(len(self.jobs))
+            start = time.perf_counter()
+            try:
+                result = fn(*args)
+            except Exception as e:
+                log.error("I/O job %s failed: %s", key, e)
+                self.notify(self.failed, key, str(e))
+                continue
+            elapsed = time.perf_counter() - start
+            if self.slow_seconds is not None and elapsed > self.slow_seconds:
+                slow_log.warning("Slow storage: %s took %.0f ms", key, elapsed * 1000)
+            self.notify(self.done, key, result)
+
+    def notify(self, signal, key, value):
+        try:
+            signal.emit(key, value)
+        except RuntimeError:
+            pass  # Interpreter shutdown deleted the QObject; the job itself ran
+
+    def stop(self):
+        """Finish the queued jobs, then stop the thread"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+
+
+# Global I/O worker instance
+io_worker = IOWorker()
+# Speculative chart renders get their own thread and queue, so file writes
+# never wait behind them or lose queue slots to them
+render_worker = IOWorker(maxsize=2, name="render-worker", slow_seconds=None)
@@ -0,0 +1,118 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")  # "text" or "json" (one object per line)
+
+ROOT_LOGGER = "panel"
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def get_logger(name):
+    """Logger under the panel hierarchy, e.g. get_logger("mqtt") -> panel.mqtt"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def record_fields(record):
+    return {k: v for k, v in vars(record).items() if k not in RECORD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Pass at most one record per call site every `interval` seconds
+
+    The next record that gets through carries `suppressed=<n>` so dropped
+    lines are still accounted for.
+    """
+    def __init__(self, interval=60.0):
+        super().__init__()
+        self.interval = interval
+        self.sites = {}  # (pathname, lineno) -> [last_emit, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            site = self.sites.get(key)
+            if site is None:
+                self.sites[key] = [now, 0]
+                return True
+            if now - site[0] < self.interval:
+                site[1] += 1
+                return False
+            if site[1]:
+                record.suppressed = site[1]
+            site[0] = now
+            site[1] = 0
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue the record untouched; message formatting happens on the listener thread"""
+    def prepare(self, record):
+        return record
+
+
+def rate_limited(name, interval=60.0):
+    """Logger for a hot path that emits at most once per call site per interval"""
+    logger = get_logger(name)
+    if not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(RateLimitFilter(interval))
+    return logger
+
+
+_listener = None
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Route the panel loggers through a queue to a background writer thread"""
+    global _listener
+    if _listener is not None:
+        return _listener
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+    root.propagate = False
+    root.addHandler(DeferredQueueHandler(queue.SimpleQueue()))
+    _listener = logging.handlers.QueueListener(root.handlers[0].queue, handler,
+                                               respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
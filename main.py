@@ -1,10 +1,21 @@
 import sys
 from PySide6.QtWidgets import QApplication, QMainWindow, QStackedWidget
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QTimer
 from Screen1 import Screen1
 from Screen2 import Screen2
 from Screen3 import Screen3
 from themes import theme_manager, THEMES
+from mqtt_client import mqtt_client
+from home_state import STATE_SERVICE
+from motion import MotionPipeline
+from metrics import metrics, start_metrics_server
+from energy_query import start_query_server
+from logs import get_logger, setup_logging
+from io_worker import io_worker
+from energy_history import ApplianceReading
+from supervisor import Heartbeat, SNAPSHOT_ENV, SNAPSHOT_INTERVAL, load_snapshot, save_snapshot
+import os
+import time
 
 
 class MainWindow(QMainWindow):
@@ -27,6 +38,88 @@ class MainWindow(QMainWindow):
         self.stack.addWidget(self.screen2)
         self.stack.addWidget(self.screen3)
 
+        if STATE_SERVICE:
+            mqtt_client.serve_state()  # This panel keeps the house's shared state
+
+        # Motion events drive lights directly from the MQTT thread
+        self.motion_pipeline = MotionPipeline(mqtt_client.send_appliance, self.screen3.schedule_for)
+        mqtt_client.motion_callback = self.motion_pipeline.handle_event
+        mqtt_client.send_motion_timeout(self.motion_pipeline.timeout)
+        self.motion_pipeline.on_change = self.screen3.occupancy_changed.emit
+        self.screen3.motion_callback = self.set_motion_appliances
+        # Only the Pi side here: the ESP32's own PIR fallback keeps its
+        # setting until a checkbox is actually changed
+        self.motion_pipeline.set_appliances(self.screen3.motion_appliances)
+
+        # Event-loop lag probe: how late a periodic GUI-thread timer fires
+        self.lag_interval = 0.25
+        self.lag_expected = time.monotonic() + self.lag_interval
+        self.lag_timer = QTimer(self)
+        self.lag_timer.setTimerType(Qt.PreciseTimer)
+        self.lag_timer.timeout.connect(self.measure_event_loop_lag)
+        self.lag_timer.start(int(self.lag_interval * 1000))
+
+        # Under supervisor.py: the lag timer doubles as the heartbeat, and the
+        # live state is snapshotted so a restarted panel picks up where this left off
+        self.heartbeat = Heartbeat.from_env()
+        if self.heartbeat:
+            self.snapshot_path = os.environ[SNAPSHOT_ENV]
+            self.restore_live_state(load_snapshot(self.snapshot_path))
+            self.snapshot_timer = QTimer(self)
+            self.snapshot_timer.timeout.connect(self.save_live_state)
+            self.snapshot_timer.start(int(SNAPSHOT_INTERVAL * 1000))
+
+    def set_motion_appliances(self, appliance_ids):
+        """A motion checkbox changed: drive both the Pi's pipeline and the ESP32's fallback"""
+        self.motion_pipeline.set_appliances(appliance_ids)
+        mqtt_client.send_motion_enable("ON" if appliance_ids else "OFF")
+
+    def measure_event_loop_lag(self):
+        now = time.monotonic()
+        metrics.event_loop_lag.observe(max(0.0, now - self.lag_expected))
+        self.lag_expected = now + self.lag_interval
+        if self.heartbeat:
+            self.heartbeat.beat()
+
+    def live_state(self):
+        screen2 = self.screen2
+        reading = screen2.reading
+        return {
+            "screen": self.stack.currentIndex(),
+            "view_mode": screen2.view_mode,
+            "graph_range": screen2.time_combo.currentText(),
+            "graph_series": screen2.data_combo.currentText(),
+            "relay_states": dict(mqtt_client.relay_states),
+            "reading": [reading.light, reading.fan, reading.plug],
+        }
+
+    def save_live_state(self):
+        io_worker.submit("panel.snapshot", save_snapshot, self.snapshot_path, self.live_state(), coalesce=True)
+
+    def restore_live_state(self, state):
+        """Show what the previous panel showed; live data replaces it as it arrives"""
+        if not state:
+            return
+        try:
+            # Anything the shared state has already delivered is newer
+            synced = mqtt_client.replica.snapshot()
+            relay_states = {k: v for k, v in state.get("relay_states", {}).items() if k not in synced}
+            for appliance_id, relay_state in relay_states.items():
+                mqtt_client.relay_states.setdefault(appliance_id, relay_state)
+            self.screen1.apply_states(relay_states)
+            screen2 = self.screen2
+            screen2.reading = ApplianceReading(*state.get("reading", ()))
+            screen2.reading_fresh = True
+            screen2.load_initial_data()
+            screen2.time_combo.setCurrentText(state.get("graph_range", screen2.time_combo.currentText()))
+            screen2.data_combo.setCurrentText(state.get("graph_series", screen2.data_combo.currentText()))
+            if state.get("view_mode") == "graph":
+                screen2.graph_btn.setChecked(True)
+                screen2.switch_view("graph")
+            self.stack.setCurrentIndex(state.get("screen", 0))
+        except (TypeError, ValueError) as e:
+            get_logger("main").warning("Ignoring live-state snapshot: %s", e)
+
     def keyPressEvent(self, event):
         """Handle keyboard navigation between screens"""
         index = self.stack.currentIndex()
@@ -145,7 +238,19 @@ class MainWindow(QMainWindow):
 
 
 if __name__ == "__main__":
+    setup_logging()
     app = QApplication(sys.argv)
+    try:
+        metrics_server = start_metrics_server()
+    except OSError as e:
+        get_logger("main").warning("Metrics endpoint unavailable: %s", e)
     window = MainWindow()
+    try:
+        query_server = start_query_server(window.screen2.energy_query)
+    except OSError as e:
+        get_logger("main").warning("Query endpoint unavailable: %s", e)
+    app.aboutToQuit.connect(window.screen3.settings_store.close)  # Write pending settings
+    app.aboutToQuit.connect(io_worker.stop)  # Finish queued log writes
+    app.aboutToQuit.connect(window.motion_pipeline.stop)  # Cancel pending vacancy timers
     window.show()
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,302 @@
+import bisect
+import collections
+import math
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9108"))
+
+# Seconds; suits both sub-millisecond callbacks and slow SD-card writes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = collections.defaultdict(float)
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            items = list(self.values.items()) or [((), 0.0)]
+        lines += [f"{self.name}{format_labels(k)} {v}" for k, v in items]
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text, function=None):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0.0
+        self.function = function  # Evaluated at scrape time when given
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1.0):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self.lock:
+            self.value -= amount
+
+    def render(self):
+        value = self.function() if self.function else self.value
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge",
+                f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager observing the elapsed wall time"""
+        return HistogramTimer(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class HistogramTimer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+def process_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms for the running panel"""
+    def __init__(self):
+        self.mqtt_messages_in = Counter("panel_mqtt_messages_in_total", "MQTT messages received")
+        self.mqtt_messages_out = Counter("panel_mqtt_messages_out_total", "MQTT messages published")
+        self.decode_errors = Counter("panel_decode_errors_total", "Malformed frames dropped")
+        self.qt_pending_updates = Gauge("panel_qt_pending_updates",
+                                        "Energy samples queued for the GUI thread")
+        self.event_loop_lag = Histogram("panel_qt_event_loop_lag_seconds",
+                                        "Lateness of a periodic GUI-thread timer")
+        self.log_write_seconds = Histogram("panel_log_write_seconds", "Energy log write duration")
+        self.graph_plot_seconds = Histogram("panel_graph_plot_seconds", "GraphWidget.plot duration")
+        self.scheduler_drift_seconds = Histogram("panel_scheduler_drift_seconds",
+                                                 "Absolute schedule fire time error")
+        self.process_rss = Gauge("panel_process_rss_bytes", "Resident set size", process_rss_bytes)
+        self.io_queue_depth = Gauge("panel_io_queue_depth", "Jobs waiting for the I/O worker")
+        self.io_jobs_dropped = Counter("panel_io_jobs_dropped_total", "I/O jobs rejected by a full queue")
+        self.io_jobs_coalesced = Counter("panel_io_jobs_coalesced_total",
+                                         "I/O jobs superseded by a newer one before running")
+        self.chart_cache_hits = Counter("panel_chart_cache_hits_total", "Graph views served from the pixmap cache")
+        self.chart_cache_misses = Counter("panel_chart_cache_misses_total", "Graph views that had to be rendered")
+        self.alerts = Counter("panel_alerts_total", "Anomaly alerts raised")
+        self.catchup_records = Counter("panel_catchup_records_total",
+                                       "Offline-buffer records replayed by the ESP32")
+        self.state_resyncs = Counter("panel_state_resyncs_total",
+                                     "Shared-state snapshots re-fetched after a gap or service restart")
+        self.metrics = [self.mqtt_messages_in, self.mqtt_messages_out, self.decode_errors,
+                        self.qt_pending_updates, self.event_loop_lag, self.log_write_seconds,
+                        self.graph_plot_seconds, self.scheduler_drift_seconds, self.process_rss,
+                        self.io_queue_depth, self.io_jobs_dropped, self.io_jobs_coalesced,
+                        self.chart_cache_hits, self.chart_cache_misses, self.alerts,
+                        self.catchup_records, self.state_resyncs]
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Low-overhead stack sampler across all threads (py-spy style)
+
+    Every `interval` seconds the current frame of each thread is walked and
+    the collapsed stack counted, so the GUI and paho threads are both seen
+    without installing a tracing hook on them.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.lock = threading.Lock()  # Guards stacks/samples between the sampler and readers
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        # Checked and set under the lock: concurrent /profile/start requests start one sampler
+        with self.lock:
+            if self.running:
+                return
+            self.stacks.clear()
+            self.samples = 0
+            self.running = True
+            self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            thread, self.thread = self.thread, None
+        if thread:
+            thread.join()  # Outside the lock: the sampler takes it to merge its last pass
+
+    def run(self):
+        own = threading.get_ident()
+        me = threading.current_thread()
+        names = {}
+        while self.thread is me:  # A stop() followed by a quick start() still ends this one
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                sampled.append(";".join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def snapshot(self):
+        """(samples, copy of the stack counts), safe while sampling runs"""
+        with self.lock:
+            return self.samples, collections.Counter(self.stacks)
+
+    def collapsed(self):
+        """Flamegraph-compatible collapsed stacks"""
+        _, stacks = self.snapshot()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def report(self, limit=30):
+        """Functions ranked by how often they were on top of a stack"""
+        samples, stacks = self.snapshot()
+        top = collections.Counter()
+        for stack, count in stacks.items():
+            top[stack.rsplit(";", 1)[-1]] += count
+        total = sum(top.values()) or 1
+        lines = [f"{samples} samples every {self.interval * 1000:.1f} ms"]
+        for function, count in top.most_common(limit):
+            lines.append(f"{count / total * 100:6.2f}%  {count:6d}  {function}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics, /profile/start[?interval=ms], /profile/stop, /profile/collapsed"""
+    def do_GET(self):
+        url = urlparse(self.path)
+        profiler = self.server.profiler
+        if url.path == "/metrics":
+            body = self.server.registry.render()
+            content_type = "text/plain; version=0.0.4"
+        elif url.path == "/profile/start":
+            try:
+                interval = float(parse_qs(url.query).get("interval", ["5"])[0])
+            except ValueError:
+                interval = math.nan
+            if not math.isfinite(interval):
+                self.send_error(400, "interval must be a number of milliseconds")
+                return
+            profiler.interval = max(interval, 1.0) / 1000.0
+            profiler.start()
+            body = "profiling started\n"
+            content_type = "text/plain"
+        elif url.path == "/profile/stop":
+            profiler.stop()
+            body = profiler.report()
+            content_type = "text/plain"
+        elif url.path == "/profile/collapsed":
+            body = profiler.collapsed()
+            content_type = "text/plain"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of stdout
+
+
+def start_metrics_server(registry=None, host=METRICS_HOST, port=METRICS_PORT):
+    """Serve /metrics and the profiler toggle from a daemon thread"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry or metrics
+    server.profiler = SamplingProfiler()
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+# Global metrics registry
+metrics = MetricsRegistry()
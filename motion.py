@@ -0,0 +1,131 @@
+import threading
+import time
+
+# Default occupancy settings (seconds)
+MOTION_TIMEOUT = 300        # Vacancy timeout after the last motion event
+MOTION_MAX_TIMEOUT = 1800   # Upper bound for the occupancy-based timeout
+MOTION_DEBOUNCE = 0.5       # Repeated events inside this window are dropped
+
+# Lights each room's PIR sensor drives
+ROOM_LIGHTS = {
+    "Living Room": ["living_light_1"],
+}
+
+
+class RoomOccupancy:
+    """Occupancy state for a single room"""
+    def __init__(self, room):
+        self.room = room
+        self.occupied = False
+        self.occupied_since = 0.0
+        self.last_motion = 0.0
+        self.events = 0
+        self.vacancy_timer = None
+
+
+class MotionPipeline:
+    """Turns ESP32 motion events into per-room occupancy and light commands
+
+    Events arrive on the paho network thread and are handled there directly,
+    so a light is switched within the same callback that received the event.
+    The vacancy timeout grows with how long the room has been continuously
+    occupied: half the occupied time, bounded by [timeout, max_timeout].
+    """
+
+    def __init__(self, switch, schedule_lookup=None, timeout=MOTION_TIMEOUT,
+                 max_timeout=MOTION_MAX_TIMEOUT, debounce=MOTION_DEBOUNCE):
+        self.switch = switch                    # switch(appliance_id, "ON"/"OFF")
+        self.schedule_lookup = schedule_lookup  # appliance_id -> ScheduleRule or None
+        self.timeout = timeout
+        self.max_timeout = max_timeout
+        self.debounce = debounce
+        self.enabled = True
+        self.appliances = None    # Lights motion may switch; None means all of ROOM_LIGHTS
+        self.rooms = {room: RoomOccupancy(room) for room in ROOM_LIGHTS}
+        self.last_latency = 0.0   # Seconds from event arrival to light command
+        self.on_change = None     # Optional callback(room, occupied)
+        self.lock = threading.Lock()
+
+    def set_appliances(self, appliance_ids):
+        """Only switch these lights; with none left, ignore motion altogether"""
+        self.appliances = frozenset(appliance_ids)
+        self.enabled = bool(self.appliances)
+
+    def lights(self, room):
+        return [a for a in ROOM_LIGHTS[room] if self.appliances is None or a in self.appliances]
+
+    def handle_event(self, room, data, received=None):
+        """Handle one decoded motion payload, e.g. {"motion":1,"active":1}"""
+        received = received if received is not None else time.monotonic()
+        if not self.enabled or room not in self.rooms or not data.get("motion"):
+            # Falling edges are ignored: vacancy is decided by our own timeout
+            return
+
+        state = self.rooms[room]
+        with self.lock:
+            if received - state.last_motion < self.debounce:
+                return
+            state.last_motion = received
+            state.events += 1
+            became_occupied = not state.occupied
+            if became_occupied:
+                state.occupied = True
+                state.occupied_since = received
+            self.restart_vacancy_timer(state, received)
+
+        if became_occupied:
+            for appliance_id in self.lights(room):
+                self.switch(appliance_id, "ON")
+            self.last_latency = time.monotonic() - received
+            if self.on_change:
+                self.on_change(room, True)
+
+    def vacancy_timeout(self, state, now):
+        occupied_for = now - state.occupied_since
+        return min(self.max_timeout, max(self.timeout, occupied_for / 2))
+
+    def restart_vacancy_timer(self, state, now):
+        if state.vacancy_timer:
+            state.vacancy_timer.cancel()
+        timer = threading.Timer(self.vacancy_timeout(state, now), self.room_vacated)
+        # cancel() can't stop a callback that already started, so it checks
+        # that its timer is still the room's current one
+        timer.args = (state, timer)
+        timer.daemon = True
+        state.vacancy_timer = timer
+        timer.start()
+
+    def room_vacated(self, state, timer=None):
+        with self.lock:
+            if not state.occupied or (timer is not None and state.vacancy_timer is not timer):
+                return  # Motion restarted the timeout after this timer fired
+            state.occupied = False
+            state.vacancy_timer = None
+
+        for appliance_id in self.lights(state.room):
+            if self.scheduled_state(appliance_id) != "ON":
+                self.switch(appliance_id, "OFF")
+        if self.on_change:
+            self.on_change(state.room, False)
+
+    def scheduled_state(self, appliance_id):
+        """State the appliance's schedule expects right now, if it has one"""
+        if not self.schedule_lookup:
+            return None
+        rule = self.schedule_lookup(appliance_id)
+        if rule is None:
+            return None
+        now = time.localtime()
+        return rule.state_at(now.tm_hour * 60 + now.tm_min)
+
+    def is_occupied(self, room):
+        state = self.rooms.get(room)
+        return bool(state and state.occupied)
+
+    def stop(self):
+        """Cancel pending vacancy timers"""
+        with self.lock:
+            for state in self.rooms.values():
+                if state.vacancy_timer:
+                    state.vacancy_timer.cancel()
+                    state.vacancy_timer = None
@@ -1,60 +1,218 @@
+import json
+import os
 import paho.mqtt.client as mqtt
+from energy_frames import EnergyDecoder, FrameError
+from home_state import (HomeState, StateReplica, decode as decode_state,
+                        STATE_DELTA_TOPIC, STATE_SNAPSHOT_TOPIC)
+from metrics import metrics
+from logs import get_logger, rate_limited
 
-BROKER = "broker.hivemq.com"
-PORT = 1883
+BROKER = os.environ.get("MQTT_BROKER", "broker.hivemq.com")
+PORT = int(os.environ.get("MQTT_PORT", "1883"))
 LIGHT1_TOPIC = "home/light/light_1"
 LIGHT2_TOPIC = "home/light/light_2"  
 LIGHT3_TOPIC = "home/light/light_3"  
 LIGHT4_TOPIC = "home/light/light_4"  
 ENERGY_TOPIC = "home/light/energy"  # New dual-sensor topic
+ENERGY_HR_TOPIC = "home/light/energy_hr"  # Binary 10 Hz batches (high-res mode)
+ENERGY_LOG_TOPIC = "home/light/energy_log"  # Binary replay of the ESP32's offline buffer
+HIGHRES_TOPIC = "home/light/highres"
+MOTION_ENABLE_TOPIC = "home/light/motion_enable"
+MOTION_TIMEOUT_TOPIC = "home/light/motion_timeout"
+
+# Relay command topics the shared-state service watches, mapped to appliance ids
+RELAY_TOPICS = {
+    LIGHT1_TOPIC: "living_light_1",
+    LIGHT2_TOPIC: "living_light_2",
+    LIGHT3_TOPIC: "living_plug_1",
+    LIGHT4_TOPIC: "living_plug_2",
+}
+
+# PIR event topics published by the ESP32, mapped to the room they cover
+MOTION_TOPICS = {
+    "home/light/motion": "Living Room",
+}
+
+log = get_logger("mqtt")
+callback_log = rate_limited("mqtt.callback")  # A bad stream logs once a minute per site
 
 class MQTTClient:
     def __init__(self):
         self.client = mqtt.Client()
+        self.decoder = EnergyDecoder()
+        self.motion_errors = 0  # Malformed motion payloads; the decoder counts energy frames
+        self.energy_callback = None  # Callback for Screen2
+        self.motion_callback = None  # Callback for motion events: (room, data)
+        self.batch_callback = None  # Callback for decoded high-res BatchFrames
+        self.catchup_callback = None  # Callback for decoded offline-buffer CatchupFrames
+        self.state_callback = None  # Callback for shared-state changes: {appliance_id: state}
+        self.relay_states = {}  # appliance_id -> last commanded "ON"/"OFF"
+        self.replica = StateReplica(lambda: self.client.subscribe(STATE_SNAPSHOT_TOPIC))
+        self.state_service = None  # HomeState when this process hosts it
+        self.retained = {}  # topic -> payload of retained publishes that failed, replayed on connect
+        self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
-        self.client.connect(BROKER, PORT, 60)
-        self.client.subscribe(ENERGY_TOPIC)  # Subscribe to new energy topic
+        # Connect from paho's network thread: a slow or unreachable broker
+        # must not hold up the import (and the window) behind DNS/TCP timeouts
+        self.client.connect_async(BROKER, PORT, 60)
         self.client.loop_start()
-        self.energy_callback = None  # Callback for Screen2
-        self.motion_callback = None  # Callback for motion status
 
-    def send_light1(self, state):
+    def on_connect(self, client, userdata, flags, rc):
+        # Subscriptions are redone on every (re)connect; a fresh one also
+        # brings the retained shared-state snapshot
+        self.client.subscribe(ENERGY_TOPIC)  # Subscribe to new energy topic
+        self.client.subscribe(ENERGY_HR_TOPIC)
+        self.client.subscribe(ENERGY_LOG_TOPIC)
+        for topic in MOTION_TOPICS:
+            self.client.subscribe(topic)
+        if self.state_service:
+            for topic in RELAY_TOPICS:
+                self.client.subscribe(topic)
+        self.client.subscribe(STATE_DELTA_TOPIC)
+        self.replica.reset()
+        self.client.subscribe(STATE_SNAPSHOT_TOPIC)
+        # Retained settings published while disconnected were dropped by paho
+        failed, self.retained = self.retained, {}
+        for topic, payload in failed.items():
+            self.publish(topic, payload, retain=True)
+
+    def serve_state(self):
+        """Host the house's shared-state service in this process (one per house)"""
+        self.state_service = HomeState(self.publish)
+        for topic in RELAY_TOPICS:
+            self.client.subscribe(topic)
+        # Pick up the retained snapshot a previous service left behind
+        self.client.subscribe(STATE_SNAPSHOT_TOPIC)
+
+    def publish(self, topic, payload, **kwargs):
+        metrics.mqtt_messages_out.inc(topic=topic)
+        info = self.client.publish(topic, payload, **kwargs)
+        if kwargs.get("retain"):
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)  # A newer value went out; don't replay the old one
+        return info
+
+    def switch_relay(self, topic, appliance_id, state):
         # Invert logic: UI "ON" → send "OFF", UI "OFF" → send "ON"
         inverted_state = "OFF" if state == "ON" else "ON"
-        self.client.publish(LIGHT1_TOPIC, inverted_state)
+        self.relay_states[appliance_id] = state
+        self.publish(topic, inverted_state)
+
+    def send_light1(self, state):
+        self.switch_relay(LIGHT1_TOPIC, "living_light_1", state)
 
     def send_light2(self, state):
-        inverted_state = "OFF" if state == "ON" else "ON"
-        self.client.publish(LIGHT2_TOPIC, inverted_state)
+        self.switch_relay(LIGHT2_TOPIC, "living_light_2", state)
 
     def send_light3(self, state):
-        inverted_state = "OFF" if state == "ON" else "ON"
-        self.client.publish(LIGHT3_TOPIC, inverted_state)
+        self.switch_relay(LIGHT3_TOPIC, "living_plug_1", state)
 
     def send_light4(self, state):
-        inverted_state = "OFF" if state == "ON" else "ON"
-        self.client.publish(LIGHT4_TOPIC, inverted_state)
+        self.switch_relay(LIGHT4_TOPIC, "living_plug_2", state)
+
+    def send_appliance(self, appliance_id, state):
+        """Switch an appliance by its Screen3 id"""
+        mqtt_mapping = {
+            "living_light_1": self.send_light1,
+            "living_light_2": self.send_light2,
+            "living_plug_1": self.send_light3,
+            "living_plug_2": self.send_light4,
+        }
+        if appliance_id in mqtt_mapping:
+            mqtt_mapping[appliance_id](state)
+            return True
+        return False
+
+    def send_highres(self, state):
+        """Switch the ESP32's 10 Hz binary batch mode ON or OFF"""
+        self.publish(HIGHRES_TOPIC, state, retain=True)
+
+    def send_motion_enable(self, state):
+        """Let the ESP32 act on its PIR sensor ("ON") or not ("OFF"); kept for its reconnects"""
+        self.publish(MOTION_ENABLE_TOPIC, state, retain=True)
+
+    def send_motion_timeout(self, seconds):
+        """Set the ESP32's fallback motion timeout (used while the Pi is away)"""
+        self.publish(MOTION_TIMEOUT_TOPIC, str(int(seconds)), retain=True)
 
     def on_message(self, client, userdata, msg):
+        metrics.mqtt_messages_in.inc(topic=msg.topic)
+        try:
+            self.dispatch(msg)
+        except Exception:
+            # paho re-raises callback errors, which would end its network thread
+            callback_log.exception("Error handling message on %s", msg.topic)
+
+    def dispatch(self, msg):
         if msg.topic == ENERGY_TOPIC and self.energy_callback:
-            import json
+            # ESP32 sends: {"L1":{...}, "L2":{...}, "motionActive":1, ...}
             try:
-                data = json.loads(msg.payload.decode())
-                # ESP32 sends: {"L1":{...}, "L2":{...}, "motionActive":1, ...}
-                self.energy_callback(data)
-                
-                # Also handle motion status if callback exists
-                if hasattr(self, 'motion_callback') and self.motion_callback:
-                    motion_data = {
-                        "motion_enabled": data.get("motionEnabled", 0),
-                        "motion_active": data.get("motionActive", 0)
-                    }
-                    self.motion_callback(motion_data)
-            except Exception:
-                # Silently ignore parse errors
-                pass
-            
+                sample = self.decoder.decode(msg.payload)
+            except FrameError as e:
+                self.report_decode_error(msg.topic, e)
+                return
+            self.energy_callback(sample)
+        elif msg.topic == ENERGY_HR_TOPIC and self.batch_callback:
+            try:
+                frame = self.decoder.decode_batch(msg.payload)
+            except FrameError as e:
+                self.report_decode_error(msg.topic, e)
+                return
+            self.batch_callback(frame)
+        elif msg.topic == ENERGY_LOG_TOPIC and self.catchup_callback:
+            try:
+                frame = self.decoder.decode_catchup(msg.payload)
+            except FrameError as e:
+                self.report_decode_error(msg.topic, e)
+                return
+            self.catchup_callback(frame)
+        elif msg.topic in RELAY_TOPICS and self.state_service:
+            if msg.payload in (b"ON", b"OFF"):
+                # Relay payloads are inverted, see switch_relay
+                self.state_service.handle_command(RELAY_TOPICS[msg.topic], "OFF" if msg.payload == b"ON" else "ON")
+        elif msg.topic in (STATE_DELTA_TOPIC, STATE_SNAPSHOT_TOPIC):
+            self.handle_state(msg)
+        elif msg.topic in MOTION_TOPICS and self.motion_callback:
+            try:
+                # ESP32 sends: {"motion":1,"active":1}
+                data = json.loads(msg.payload)
+                if not isinstance(data, dict):
+                    raise ValueError(f"expected an object, got {type(data).__name__}")
+            except ValueError as e:
+                self.motion_errors += 1
+                self.report_decode_error(msg.topic, e, self.motion_errors)
+                return
+            self.motion_callback(MOTION_TOPICS[msg.topic], data)
+
+    def handle_state(self, msg):
+        document = decode_state(msg.payload)
+        if document is None:
+            metrics.decode_errors.inc(topic=msg.topic)
+            return
+        if msg.topic == STATE_SNAPSHOT_TOPIC:
+            # One bulk sync is all a replica needs; deltas carry it from here
+            self.client.unsubscribe(STATE_SNAPSHOT_TOPIC)
+            if self.state_service and document["epoch"] != self.state_service.epoch:
+                self.state_service.adopt(document.get("states", {}))
+            changes = self.replica.handle_snapshot(document)
+        else:
+            changes = self.replica.handle_delta(document)
+        if changes:
+            self.relay_states.update(changes)
+            if self.state_callback:
+                self.state_callback(changes)
+
+    def report_decode_error(self, topic, error, count=None):
+        """Count and log a dropped payload; `count` is its stream's failures so far"""
+        metrics.decode_errors.inc(topic=topic)
+        count = self.decoder.errors if count is None else count
+        # First failure and then every 100th, so a bad stream can't flood the log
+        if count % 100 == 1:
+            log.warning("Dropped malformed frame on %s (%d so far): %s", topic, count, error)
+
     def send_override_light1(self):
-        self.client.publish("home/light/override_light1", "bypass")
+        self.publish("home/light/override_light1", "bypass")
 
 mqtt_client = MQTTClient()
\ No newline at end of file
@@ -0,0 +1,209 @@
+import datetime
+import json
+import os
+from energy_history import ApplianceReading, DAY_BACKFILLED, DAY_PARTIAL
+from scheduler import parse_hhmm
+
+# Local time at which one logged day ends and the next begins ("HH:MM")
+DAY_BOUNDARY = os.environ.get("DAY_BOUNDARY", "00:00")
+# IANA zone for the day boundary; empty means the system's local zone
+PANEL_TZ = os.environ.get("PANEL_TZ", "")
+STATE_FILE = "rollover_state.json"
+GAP_SECONDS = 120  # Frames are 1 Hz; a longer silence is a gap in the data
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def local_zone(name=PANEL_TZ):
+    if name:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(name)
+    return None  # datetime.astimezone() then uses the system zone
+
+
+def split_reading(l1_kwh, l2_kwh):
+    """Same L1/L2 → light/fan/plug split as ApplianceReading.from_sample"""
+    return ApplianceReading(l1_kwh * 0.6, l2_kwh, l1_kwh * 0.4)
+
+
+def scaled(reading, fraction):
+    return ApplianceReading(reading.light * fraction, reading.fan * fraction, reading.plug * fraction)
+
+
+class DayClock:
+    """Maps timestamps to logged days with a configurable, DST-aware boundary"""
+    def __init__(self, boundary=DAY_BOUNDARY, zone=None):
+        minutes = parse_hhmm(boundary)
+        self.boundary = datetime.time(minutes // 60, minutes % 60)
+        self.zone = zone if zone is not None else local_zone()
+
+    def local(self, timestamp):
+        return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).astimezone(self.zone)
+
+    def day_of(self, timestamp):
+        """Logged day a timestamp belongs to"""
+        local = self.local(timestamp)
+        day = local.date()
+        if local.time() < self.boundary:
+            day -= datetime.timedelta(days=1)
+        return day
+
+    def day_end(self, day):
+        """Epoch seconds at which `day` closes (wall-clock boundary on the next date)"""
+        end = datetime.datetime.combine(day + datetime.timedelta(days=1), self.boundary)
+        if self.zone is None:
+            return end.timestamp()  # Naive → system local time, gaps/folds resolved by mktime
+        return end.replace(tzinfo=self.zone).timestamp()
+
+
+class RolloverEngine:
+    """Turns the ESP32's cumulative kWh counters into closed per-day totals
+
+    Each frame's counter delta since the previous frame is added to the
+    open day; an interval that spans a boundary is split across the days in
+    proportion to time. A counter that went backwards means the ESP32
+    rebooted, so its new value is the energy since then. Deltas telescope,
+    so the %.6f rounding of the frames never accumulates.
+
+    The last counters are persisted with `state()`, so after the panel was
+    down the first frame reconciles the gap from the device's counters and
+    finalizes every day it missed. Days closed by `advance()` while no
+    frames arrive are flagged DAY_PARTIAL; when frames resume, their share
+    of the gap is queued in `late` for the caller to add to them.
+
+    Days touched by a gap are flagged in `flags` (DAY_BACKFILLED, or
+    DAY_PARTIAL if the device restarted its counters meanwhile) until the
+    caller records them and pops the flag.
+    """
+    def __init__(self, clock=None):
+        self.clock = clock or DayClock()
+        self.day = None          # Open day
+        self.day_end = 0.0       # Epoch seconds the open day closes at
+        self.totals = ApplianceReading()
+        self.last_time = None
+        self.last_l1 = None
+        self.last_l2 = None
+        self.flags = {}          # day -> DAY_* for days not recorded yet
+        self.late = []           # [(day, ApplianceReading)] energy for days already closed
+        self.energy_callback = None  # (start, end, ApplianceReading kWh) per interval
+
+    def resume(self, day, reading):
+        """Continue an open day whose partial totals were already logged"""
+        if self.day is None or day == self.day:
+            self.open_day(day)
+            self.totals = ApplianceReading(reading.light, reading.fan, reading.plug)
+
+    def open_day(self, day):
+        self.day = day
+        self.day_end = self.clock.day_end(day)
+        self.totals = ApplianceReading()
+
+    def current(self):
+        """(day, totals so far) of the open day, or None before the first frame"""
+        if self.day is None:
+            return None
+        return self.day, self.totals
+
+    def advance(self, timestamp):
+        """Close every day that ended by `timestamp`; returns [(day, reading)]"""
+        closed = []
+        if self.day is None:
+            self.open_day(self.clock.day_of(timestamp))
+            return closed
+        while timestamp >= self.day_end:
+            if self.last_time is None or self.last_time < self.day_end - GAP_SECONDS:
+                self.flags.setdefault(self.day, DAY_PARTIAL)  # Closed without its last frames
+            closed.append((self.day, self.totals))
+            self.open_day(self.day + datetime.timedelta(days=1))
+        return closed
+
+    def add(self, start, end, reading):
+        """Spread energy used over [start, end) across the days it covers"""
+        span = end - start
+        position = start
+        closed = self.advance(start)
+        # Days advance() closed while frames were missing get their share back
+        opened = self.clock.day_end(self.day - ONE_DAY)
+        while position < min(end, opened):
+            day = self.clock.day_of(position)
+            piece_end = min(end, opened, self.clock.day_end(day))
+            self.late.append((day, scaled(reading, (piece_end - position) / span)))
+            position = piece_end
+        while position < end:
+            piece_end = min(end, self.day_end)
+            self.accumulate(reading, (piece_end - position) / span)
+            position = piece_end
+            if position < end:
+                closed += self.advance(position)
+        closed += self.advance(end)
+        return closed
+
+    def accumulate(self, reading, fraction):
+        self.totals.light += reading.light * fraction
+        self.totals.fan += reading.fan * fraction
+        self.totals.plug += reading.plug * fraction
+
+    def counter_delta(self, last, value):
+        if last is None:
+            return 0.0
+        delta = value - last
+        if delta < 0:
+            return value  # ESP32 rebooted: counter restarted from 0
+        return delta
+
+    def feed(self, sample):
+        """Add one EnergySample; returns the days it closed as [(day, reading)]"""
+        now = sample.time
+        if self.last_time is None:
+            closed = self.advance(now)
+        elif now <= self.last_time:
+            # Not after the previous frame, e.g. a catch-up record stamped by
+            # the ESP32's clock after live frames stamped by ours: time can't
+            # split it, but the counters moved, so book it at the last time
+            reading = split_reading(self.counter_delta(self.last_l1, sample.l1_energy),
+                                    self.counter_delta(self.last_l2, sample.l2_energy))
+            closed = self.advance(self.last_time)
+            self.accumulate(reading, 1.0)
+            if self.energy_callback:
+                self.energy_callback(self.last_time, self.last_time, reading)
+        else:
+            l1 = self.counter_delta(self.last_l1, sample.l1_energy)
+            l2 = self.counter_delta(self.last_l2, sample.l2_energy)
+            reading = split_reading(l1, l2)
+            if now - self.last_time > GAP_SECONDS:
+                self.mark_gap(self.last_time, now, sample)
+            closed = self.add(self.last_time, now, reading)
+            if self.energy_callback:
+                self.energy_callback(self.last_time, now, reading)
+        self.last_time = max(now, self.last_time or now)
+        self.last_l1 = sample.l1_energy
+        self.last_l2 = sample.l2_energy
+        return closed
+
+    def mark_gap(self, start, end, sample):
+        """Flag the days a silence covered: counters bridge it unless they restarted"""
+        restarted = (self.last_l1 is not None and sample.l1_energy < self.last_l1) or \
+                    (self.last_l2 is not None and sample.l2_energy < self.last_l2)
+        flag = DAY_PARTIAL if restarted else DAY_BACKFILLED
+        day = self.clock.day_of(start)
+        while day <= self.clock.day_of(end):
+            self.flags[day] = max(self.flags.get(day, flag), flag)
+            day += ONE_DAY
+
+    def state(self):
+        return {"version": 1, "time": self.last_time, "l1_energy": self.last_l1, "l2_energy": self.last_l2}
+
+    def load_state(self, state):
+        """Restore counters saved by state(); anything malformed is ignored"""
+        if not isinstance(state, dict) or state.get("version") != 1:
+            return
+        if all(isinstance(state.get(k), (int, float)) for k in ("time", "l1_energy", "l2_energy")):
+            self.last_time = state["time"]
+            self.last_l1 = state["l1_energy"]
+            self.last_l2 = state["l2_energy"]
+
+
+def read_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
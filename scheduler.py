@@ -0,0 +1,136 @@
+import bisect
+
+MINUTES_PER_DAY = 1440
+MAX_DURATION = MINUTES_PER_DAY - 1  # A full day would end on the minute it starts: no transitions
+
+# Order in which simultaneous events are applied within the same minute
+EVENT_OFF = 0
+EVENT_SLEEP_END = 1
+EVENT_SLEEP_START = 2
+EVENT_ON = 3
+
+
+def parse_hhmm(value):
+    """Convert an "hh:mm" string to minutes since midnight"""
+    hours, minutes = value.split(":")
+    return (int(hours) * 60 + int(minutes)) % MINUTES_PER_DAY
+
+
+def format_hhmm(minute):
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+class ScheduleRule:
+    """Daily ON/OFF rule built from TimerWidget.get_settings()
+
+    Semantics of the persisted fields:
+      on_time / off_time   - base ON interval, may cross midnight
+      duration_minutes     - when > 0, turn OFF this many minutes after
+                             on_time instead of at off_time (at most
+                             MAX_DURATION)
+      sleep_enabled        - hold the appliance OFF inside the sleep window
+      sleep_start/end      - sleep window, may cross midnight (23:00-05:00)
+      sleep_duration       - window length in minutes (at most
+                             MAX_DURATION), used only when
+                             sleep_start == sleep_end
+      power_saving         - do not switch back ON when the sleep window
+                             ends; stay OFF until the next on_time
+
+    The rule repeats every day, so the transitions of one day are computed
+    once into a sorted table and looked up with bisect.
+    """
+
+    def __init__(self, settings):
+        self.on_minute = parse_hhmm(settings.get("on_time", "18:00"))
+        self.off_minute = parse_hhmm(settings.get("off_time", "22:00"))
+        self.duration_minutes = min(int(settings.get("duration_minutes", 0) or 0), MAX_DURATION)
+        self.power_saving = bool(settings.get("power_saving", False))
+        self.sleep_enabled = bool(settings.get("sleep_enabled", False))
+        self.sleep_start = parse_hhmm(settings.get("sleep_start", "23:00"))
+        self.sleep_end = parse_hhmm(settings.get("sleep_end", "05:00"))
+        self.sleep_duration = min(int(settings.get("sleep_duration", 0) or 0), MAX_DURATION)
+
+        if self.duration_minutes > 0:
+            self.off_minute = (self.on_minute + self.duration_minutes) % MINUTES_PER_DAY
+        if self.sleep_enabled and self.sleep_start == self.sleep_end and self.sleep_duration > 0:
+            self.sleep_end = (self.sleep_start + self.sleep_duration) % MINUTES_PER_DAY
+
+        self.minutes = []   # Sorted minutes of day where the state changes
+        self.states = []    # State ("ON"/"OFF") entered at each minute
+        self.initial_state = "OFF"  # State carried in from the previous day
+        self.build_table()
+
+    def events(self):
+        """Daily events as (minute, order) pairs"""
+        events = []
+        if self.on_minute != self.off_minute:
+            events.append((self.on_minute, EVENT_ON))
+            events.append((self.off_minute, EVENT_OFF))
+        if self.sleep_enabled and self.sleep_start != self.sleep_end:
+            events.append((self.sleep_start, EVENT_SLEEP_START))
+            events.append((self.sleep_end, EVENT_SLEEP_END))
+        events.sort()
+        return events
+
+    def build_table(self):
+        """Run the daily events twice: the first pass settles the state that
+        carries over midnight, the second records today's transitions"""
+        events = self.events()
+        base_on = False
+        sleeping = False
+        suppressed = False
+
+        for recording in (False, True):
+            if recording:
+                last_state = "ON" if base_on and not sleeping and not suppressed else "OFF"
+                self.initial_state = last_state
+            for i, (minute, kind) in enumerate(events):
+                if kind == EVENT_ON:
+                    base_on = True
+                    suppressed = False
+                elif kind == EVENT_OFF:
+                    base_on = False
+                elif kind == EVENT_SLEEP_START:
+                    sleeping = True
+                elif kind == EVENT_SLEEP_END:
+                    sleeping = False
+                    if self.power_saving and base_on:
+                        suppressed = True
+
+                # Several events in one minute collapse to the final state
+                if not recording or (i + 1 < len(events) and events[i + 1][0] == minute):
+                    continue
+                state = "ON" if base_on and not sleeping and not suppressed else "OFF"
+                if state != last_state:
+                    self.minutes.append(minute)
+                    self.states.append(state)
+                    last_state = state
+
+    def state_at(self, minute):
+        """Expected appliance state at a minute of the day"""
+        index = bisect.bisect_right(self.minutes, minute) - 1
+        if index < 0:
+            return self.initial_state
+        return self.states[index]
+
+    def next_transition(self, minute):
+        """Next transition strictly after a minute of the day
+
+        Returns (minute_of_day, state, minutes_until) or None when the rule
+        never changes state.
+        """
+        if not self.minutes:
+            return None
+        index = bisect.bisect_right(self.minutes, minute)
+        if index < len(self.minutes):
+            target = self.minutes[index]
+            return target, self.states[index], target - minute
+        target = self.minutes[0]
+        return target, self.states[0], target + MINUTES_PER_DAY - minute
+
+    def is_transition(self, minute):
+        """State entered at this exact minute, or None"""
+        index = bisect.bisect_left(self.minutes, minute)
+        if index < len(self.minutes) and self.minutes[index] == minute:
+            return self.states[index]
+        return None
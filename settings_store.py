@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+import time
+from logs import get_logger
+
+SETTINGS_FILE = "timer_settings.json"
+SCHEMA_VERSION = 1
+WRITE_DELAY = 0.5  # Seconds a burst of updates is coalesced for
+
+log = get_logger("settings")
+
+
+def atomic_write(path, data):
+    """Write bytes to path via fsync'd temp file + rename; readers never see a torn file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # Directory fsync isn't available everywhere (e.g. Windows)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def migrate(document):
+    """Bring a loaded document up to SCHEMA_VERSION"""
+    if "version" not in document:
+        # Version 0: a bare {appliance_id: settings} mapping
+        document = {"version": 1, "timers": document}
+    if document["version"] > SCHEMA_VERSION:
+        raise ValueError(f"settings schema {document['version']} is newer than {SCHEMA_VERSION}")
+    return document
+
+
+class SettingsStore:
+    """In-memory timer settings, persisted in the background
+
+    `load()` reads the file once; after that `get()` is served from memory
+    and `set()` only marks the store dirty. A writer thread waits until no
+    update has arrived for `delay` seconds, then writes one snapshot
+    atomically, so a burst of saves costs a single write.
+    """
+    def __init__(self, path=SETTINGS_FILE, delay=WRITE_DELAY):
+        self.path = path
+        self.delay = delay
+        self.timers = {}
+        self.dirty = False
+        self.due = 0.0
+        self.closed = False
+        self.writes = 0
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()  # Keeps snapshot order == write order
+        self.thread = threading.Thread(target=self.run, name="settings-writer", daemon=True)
+        self.thread.start()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self.timers
+        with open(self.path, "r") as f:
+            document = migrate(json.load(f))
+        with self.condition:
+            self.timers = document.get("timers", {})
+        return self.timers
+
+    def get(self, appliance_id):
+        with self.condition:
+            return self.timers.get(appliance_id)
+
+    def set(self, appliance_id, settings):
+        with self.condition:
+            self.timers[appliance_id] = dict(settings)
+            self.dirty = True
+            self.due = time.monotonic() + self.delay
+            self.condition.notify()
+
+    def snapshot(self):
+        """Serialized document; caller holds the condition"""
+        return json.dumps({"version": SCHEMA_VERSION, "timers": self.timers}, indent=2).encode()
+
+    def write_pending(self):
+        with self.write_lock:
+            with self.condition:
+                if not self.dirty:
+                    return
+                data = self.snapshot()
+                self.dirty = False
+            self.write(data)
+
+    def write(self, data):
+        try:
+            atomic_write(self.path, data)
+            self.writes += 1
+            log.debug("Timer settings saved")
+        except OSError as e:
+            log.error("Error saving timer settings: %s", e)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.closed and (not self.dirty or time.monotonic() < self.due):
+                    timeout = self.due - time.monotonic() if self.dirty else None
+                    self.condition.wait(timeout)
+                if not self.dirty:
+                    return
+            self.write_pending()
+
+    def flush(self):
+        """Write any pending changes now (blocking)"""
+        self.write_pending()
+
+    def close(self):
+        """Stop the writer after it has written anything pending"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
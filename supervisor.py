@@ -0,0 +1,251 @@
+"""Panel supervisor: restarts a frozen or crashed UI within about a second
+
+Run the panel through it instead of main.py (extra arguments go to the panel):
+
+    python supervisor.py
+
+The panel runs in a child process. Its GUI thread bumps a counter in a
+small memory-mapped heartbeat file from the event-loop lag timer. If the
+counter stops moving for STALL_SECONDS, because of blocking I/O, a long
+matplotlib draw or anything else that holds the event loop, the child is
+killed and a new one takes over. A child that never beats within
+STARTUP_SECONDS, or exits with an error, is replaced too.
+
+Most of a cold start is importing Qt, matplotlib and numpy, so a warm
+standby child sits with those imports done, waiting on its stdin. A
+restart only has to build the window. While healthy, the panel writes a
+small snapshot of its live state (screen, view, relay states, latest
+reading) next to the heartbeat, and a restarted panel shows it until
+fresh data arrives. Energy totals need no snapshot: the rollover state is
+on disk and the first frame reconciles the device counters.
+"""
+import json
+import mmap
+import os
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from settings_store import atomic_write
+from logs import get_logger, setup_logging
+
+RUNTIME_DIR = os.environ.get("PANEL_RUNTIME_DIR") or (
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())  # RAM-backed where possible
+STALL_SECONDS = float(os.environ.get("PANEL_STALL_SECONDS", "2.0"))  # Heartbeats are 0.25 s apart
+STARTUP_SECONDS = float(os.environ.get("PANEL_STARTUP_SECONDS", "30.0"))
+WARM_STANDBY = os.environ.get("PANEL_WARM_STANDBY", "1") == "1"
+SNAPSHOT_INTERVAL = 1.0  # Seconds between live-state snapshots
+SNAPSHOT_MAX_AGE = 300   # Older snapshots are ignored on start
+POLL_INTERVAL = 0.1
+BACKOFF_MAX = 30.0       # Longest wait before restarting a panel that keeps failing to start
+
+# Set by the supervisor for its child; unset when main.py runs on its own
+HEARTBEAT_ENV = "PANEL_HEARTBEAT"
+SNAPSHOT_ENV = "PANEL_SNAPSHOT"
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+BEAT = struct.Struct("<Q")
+
+log = get_logger("supervisor")
+
+
+def open_heartbeat(path):
+    with open(path, "a+b") as f:
+        if os.fstat(f.fileno()).st_size < BEAT.size:
+            f.truncate(BEAT.size)
+        return mmap.mmap(f.fileno(), BEAT.size)
+
+
+class Heartbeat:
+    """Child side: a beat counter in the supervisor's heartbeat file
+
+    The supervisor only watches for the counter changing, so the two
+    processes never compare clocks.
+    """
+    def __init__(self, path):
+        self.memory = open_heartbeat(path)
+        self.count = 0
+
+    @classmethod
+    def from_env(cls):
+        """Heartbeat for a supervised panel, else None"""
+        path = os.environ.get(HEARTBEAT_ENV)
+        return cls(path) if path else None
+
+    def beat(self):
+        self.count += 1
+        BEAT.pack_into(self.memory, 0, self.count)
+
+
+def save_snapshot(path, state):
+    atomic_write(path, json.dumps(dict(state, saved=time.time())).encode())
+
+
+def load_snapshot(path, max_age=SNAPSHOT_MAX_AGE):
+    """The live state a previous panel left, or None if missing or stale"""
+    try:
+        with open(path, "rb") as f:
+            state = json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or not time.time() - state.get("saved", 0) <= max_age:
+        return None
+    return state
+
+
+def standby(argv):
+    """Child side: import the heavy modules, then wait for the go line"""
+    # Only imported for the module cache; main.py's imports then find them loaded
+    import numpy
+    from PySide6 import QtCore, QtGui, QtWidgets
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import paho.mqtt.client
+    # One throwaway draw loads the font cache and Agg's text path up front
+    figure = Figure()
+    figure.add_subplot().bar([0], [1], label="x")
+    FigureCanvasAgg(figure).draw()
+    if sys.stdin.readline().strip() != "go":
+        return  # Supervisor went away
+    import runpy
+    sys.argv = [MAIN_SCRIPT] + argv
+    runpy.run_path(MAIN_SCRIPT, run_name="__main__")
+
+
+class Supervisor:
+    """Keeps one panel child running, restarting it on a stall or crash
+
+    A child that exits with status 0 (the panel was closed) ends the
+    supervisor too.
+    """
+    def __init__(self, args=(), stall=STALL_SECONDS, startup=STARTUP_SECONDS,
+                 directory=RUNTIME_DIR, warm=WARM_STANDBY):
+        self.args = list(args)
+        self.stall = stall
+        self.startup = startup
+        self.warm = warm
+        tag = f"panel-{os.getpid()}"
+        self.heartbeat_path = os.path.join(directory, f"{tag}.heartbeat")
+        self.snapshot_path = os.path.join(directory, f"{tag}.snapshot.json")
+        self.heartbeat = open_heartbeat(self.heartbeat_path)
+        self.child = None
+        self.standby = None
+        self.running = False
+        self.restarts = 0
+        self.failures = 0        # Consecutive children that never beat
+        self.launched = 0.0
+        self.last_count = 0
+        self.last_change = 0.0
+        self.restart_began = None
+        self.on_recovered = None  # Callback(seconds from stall/exit to the new panel's first beat)
+
+    def spawn(self):
+        env = dict(os.environ)
+        env[HEARTBEAT_ENV] = self.heartbeat_path
+        env[SNAPSHOT_ENV] = self.snapshot_path
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__), "--standby", *self.args],
+                                stdin=subprocess.PIPE, env=env)
+
+    def launch(self):
+        """Start a panel, from the warm standby when there is one"""
+        BEAT.pack_into(self.heartbeat, 0, 0)
+        self.last_count = 0
+        child = self.standby or self.spawn()
+        self.standby = None
+        try:
+            child.stdin.write(b"go\n")
+            child.stdin.flush()
+        except OSError:
+            child.kill()
+            child.wait()
+            child = self.spawn()  # The standby had died; start cold
+            child.stdin.write(b"go\n")
+            child.stdin.flush()
+        self.child = child
+        self.launched = self.last_change = time.monotonic()
+
+    def restart(self, reason):
+        self.restart_began = time.monotonic()
+        self.restarts += 1
+        if self.child.poll() is None:
+            self.child.kill()  # A stalled GUI thread can't handle SIGTERM
+            self.child.wait()
+        if self.last_count == 0:
+            self.failures += 1
+            delay = min(BACKOFF_MAX, 0.5 * 2 ** (self.failures - 1))
+            log.warning("Panel %s before its first heartbeat, retrying in %.1f s", reason, delay)
+            time.sleep(delay)
+        else:
+            log.warning("Panel %s, restarting", reason)
+        self.launch()
+
+    def check(self):
+        """One watchdog pass; returns False once the panel has quit normally"""
+        now = time.monotonic()
+        code = self.child.poll()
+        if code == 0:
+            log.info("Panel exited")
+            return False
+        if code is not None:
+            self.restart(f"exited with status {code}")
+            return True
+        count = BEAT.unpack_from(self.heartbeat)[0]
+        if count != self.last_count:
+            if self.last_count == 0:
+                self.failures = 0
+                if self.warm and self.standby is None:
+                    # Warm the next one only now, so it doesn't slow this start down
+                    self.standby = self.spawn()
+                if self.restart_began is not None:
+                    seconds = now - self.restart_began
+                    log.info("Panel back %.2f s after restart %d", seconds, self.restarts)
+                    if self.on_recovered:
+                        self.on_recovered(seconds)
+                    self.restart_began = None
+            self.last_count, self.last_change = count, now
+        elif self.last_count and now - self.last_change > self.stall:
+            self.restart(f"stalled for {now - self.last_change:.1f} s")
+        elif not self.last_count and now - self.launched > self.startup:
+            self.restart(f"not up after {self.startup:.0f} s")
+        return True
+
+    def run(self):
+        self.running = True
+        self.launch()
+        try:
+            while self.running and self.check():
+                time.sleep(POLL_INTERVAL)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        for process in (self.child, self.standby):
+            if process is not None and process.poll() is None:
+                process.kill()
+                process.wait()
+        for path in (self.heartbeat_path, self.snapshot_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def main():
+    if sys.argv[1:2] == ["--standby"]:
+        standby(sys.argv[2:])
+        return
+    setup_logging()
+    supervisor = Supervisor(sys.argv[1:])
+    signal.signal(signal.SIGTERM, lambda signum, frame: setattr(supervisor, "running", False))
+    log.info("Supervising the panel (stall after %.1f s)", supervisor.stall)
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
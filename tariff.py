@@ -0,0 +1,231 @@
+import datetime
+import json
+import os
+import numpy as np
+from scheduler import parse_hhmm, MINUTES_PER_DAY
+
+TARIFF_FILE = "tariff.json"
+BINS_FILE = "tariff_bins.npz"
+BIN_MINUTES = 15
+BINS_PER_DAY = MINUTES_PER_DAY // BIN_MINUTES
+CIRCUITS = ("light", "fan", "plug")
+
+# Used when tariff.json is absent: slab rates with a peak-hour surcharge
+DEFAULT_TARIFF = {
+    "currency": "₹",
+    "billing_day": 1,
+    # Slab rates by energy used so far in the billing period (kWh, per kWh)
+    "tiers": [
+        {"upto": 100, "rate": 4.5},
+        {"upto": 300, "rate": 6.0},
+        {"upto": None, "rate": 7.5},
+    ],
+    # Time-of-use multipliers on the slab rate; unlisted minutes are 1.0
+    "time_of_use": [
+        {"start": "18:00", "end": "22:00", "multiplier": 1.2},
+        {"start": "22:00", "end": "06:00", "multiplier": 0.9},
+    ],
+}
+
+
+class Tariff:
+    """Slab (tiered) rates combined with time-of-use multipliers"""
+    def __init__(self, config=None):
+        config = config or DEFAULT_TARIFF
+        self.currency = config.get("currency", "")
+        self.billing_day = int(config.get("billing_day", 1))
+        if not 1 <= self.billing_day <= 28:
+            raise ValueError(f"billing_day must be 1-28 (every month has it), not {self.billing_day}")
+
+        # Piecewise-linear cost of the first x kWh of a period: cost(x) =
+        # np.interp(x, limits, costs), extended past the last slab
+        limits, costs = [0.0], [0.0]
+        self.rates = []
+        for tier in config["tiers"]:
+            rate = float(tier["rate"])
+            self.rates.append(rate)
+            upto = tier.get("upto")
+            if upto is None:
+                break
+            costs.append(costs[-1] + (float(upto) - limits[-1]) * rate)
+            limits.append(float(upto))
+        if not self.rates:
+            raise ValueError("tariff has no tiers")
+        self.limits = np.array(limits)
+        self.costs = np.array(costs)
+
+        minutes = np.ones(MINUTES_PER_DAY)
+        for period in config.get("time_of_use", []):
+            start = parse_hhmm(period["start"])
+            end = parse_hhmm(period["end"])
+            if end > start:
+                minutes[start:end] = period["multiplier"]
+            else:  # Wraps midnight
+                minutes[start:] = period["multiplier"]
+                minutes[:end] = period["multiplier"]
+        self.minute_multipliers = minutes
+        # Bins straddling a period edge get the mean of their minutes
+        self.bin_multipliers = minutes.reshape(BINS_PER_DAY, BIN_MINUTES).mean(axis=1)
+        self.hour_multipliers = minutes.reshape(24, 60).mean(axis=1)
+
+    def slab_cost(self, kwh):
+        """Cost of the first `kwh` of a billing period before time-of-use (vectorized)"""
+        kwh = np.asarray(kwh, dtype=float)
+        cost = np.interp(kwh, self.limits, self.costs)
+        beyond = np.maximum(kwh - self.limits[-1], 0.0)
+        return cost + beyond * self.rates[-1]
+
+    def rate_at(self, period_kwh, minute):
+        """Marginal price per kWh after `period_kwh` at local minute-of-day"""
+        tier = min(np.searchsorted(self.limits, period_kwh, side="right") - 1, len(self.rates) - 1)
+        return self.rates[tier] * self.minute_multipliers[minute]
+
+    def period_start(self, day):
+        """First day of the billing period containing `day`"""
+        start = day.replace(day=self.billing_day)
+        if start > day:
+            month = start.month - 1 or 12
+            year = start.year - (start.month == 1)
+            start = start.replace(year=year, month=month)
+        return start
+
+
+def load_tariff(path=TARIFF_FILE):
+    if not os.path.exists(path):
+        return Tariff()
+    with open(path, "r") as f:
+        return Tariff(json.load(f))
+
+
+def tariff_mtime(path=TARIFF_FILE):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class TariffEngine:
+    """Running cost of the kWh stream per circuit, per day and per billing period
+
+    Energy is binned per local day into 15-minute bins for each circuit, so
+    a tariff change re-prices the whole period in one vectorized pass. In
+    between, each interval only updates the running totals.
+    """
+    def __init__(self, tariff=None, zone=None):
+        self.tariff = tariff or Tariff()
+        self.zone = zone
+        self.bins = {}                     # date -> (3, BINS_PER_DAY) kWh
+        self.period = None                 # First day of the open billing period
+        self.period_kwh = 0.0
+        self.period_cost = np.zeros(3)     # Per circuit
+        self.day_cost = {}                 # date -> cost
+        self.live_rate = 0.0               # Cost per hour at the latest power draw
+
+    def local(self, timestamp):
+        return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).astimezone(self.zone)
+
+    def day_bins(self, day):
+        if day not in self.bins:
+            self.bins[day] = np.zeros((3, BINS_PER_DAY))
+        return self.bins[day]
+
+    def add(self, start, end, reading):
+        """Price energy used over [start, end), split across 15-minute bins"""
+        kwh = np.array([reading.light, reading.fan, reading.plug])
+        total = kwh.sum()
+        span = end - start
+        position = start
+        while True:
+            local = self.local(position)
+            minute = local.hour * 60 + local.minute
+            slot = minute // BIN_MINUTES
+            bin_end = position + (BIN_MINUTES - minute % BIN_MINUTES) * 60 - local.second - local.microsecond / 1e6
+            piece_end = min(end, bin_end) if span > 0 else end
+            share = (piece_end - position) / span if span > 0 else 1.0
+            self.charge(local.date(), slot, minute, kwh * share)
+            position = piece_end
+            if position >= end:
+                break
+        if span > 0:
+            local = self.local(end)
+            rate = self.tariff.rate_at(self.period_kwh, local.hour * 60 + local.minute)
+            self.live_rate = total / span * 3600.0 * rate
+
+    def charge(self, day, slot, minute, kwh):
+        period = self.tariff.period_start(day)
+        if period != self.period:
+            if self.period is not None and period < self.period:
+                return  # Late energy for a closed period is not re-billed
+            self.period = period
+            self.period_kwh = 0.0
+            self.period_cost = np.zeros(3)
+        self.day_bins(day)[:, slot] += kwh
+        used = kwh.sum()
+        if used <= 0:
+            return
+        cost = float(self.tariff.slab_cost(self.period_kwh + used) - self.tariff.slab_cost(self.period_kwh))
+        cost *= self.tariff.minute_multipliers[minute]
+        self.period_kwh += used
+        self.period_cost += cost * kwh / used
+        self.day_cost[day] = self.day_cost.get(day, 0.0) + cost
+
+    def recompute(self, tariff=None):
+        """Re-price the open billing period from the bins (e.g. after a tariff change)"""
+        if tariff is not None:
+            self.tariff = tariff
+        if not self.bins:
+            return
+        self.period = self.tariff.period_start(max(self.bins))
+        days = sorted(d for d in self.bins if d >= self.period)
+        kwh = np.stack([self.bins[d] for d in days])            # (days, 3, bins)
+        per_bin = kwh.sum(axis=1).ravel()                        # Chronological
+        cumulative = np.cumsum(per_bin)
+        slab = np.diff(self.tariff.slab_cost(cumulative), prepend=0.0)
+        cost = (slab * np.tile(self.tariff.bin_multipliers, len(days))).reshape(len(days), BINS_PER_DAY)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shares = np.nan_to_num(kwh / kwh.sum(axis=1, keepdims=True))
+        self.period_kwh = float(cumulative[-1])
+        self.period_cost = (shares * cost[:, None, :]).sum(axis=(0, 2))
+        for i, day in enumerate(days):
+            self.day_cost[day] = float(cost[i].sum())
+
+    def seed_day(self, day, reading):
+        """Day known only as a total (e.g. from the log): spread evenly over its bins"""
+        if day in self.bins:
+            return
+        totals = np.array([reading.light, reading.fan, reading.plug])
+        self.bins[day] = np.repeat(totals[:, None] / BINS_PER_DAY, BINS_PER_DAY, axis=1)
+
+    def prune(self, keep_days=62):
+        """Drop bins older than the previous billing period"""
+        if self.period is None:
+            return
+        cutoff = self.period - datetime.timedelta(days=keep_days)
+        for day in [d for d in self.bins if d < cutoff]:
+            del self.bins[day]
+            self.day_cost.pop(day, None)
+
+    def snapshot(self):
+        """Arrays for save_bins(), safe to hand to another thread"""
+        days = sorted(self.bins)
+        return (np.array([d.toordinal() for d in days], dtype=np.int64),
+                np.stack([self.bins[d] for d in days]) if days else np.zeros((0, 3, BINS_PER_DAY)))
+
+    def load_bins(self, ordinals, kwh):
+        for ordinal, values in zip(ordinals, kwh):
+            self.bins[datetime.date.fromordinal(int(ordinal))] = np.array(values)
+
+
+def save_bins(snapshot, path=BINS_FILE):
+    from settings_store import atomic_write
+    import io
+    buffer = io.BytesIO()
+    np.savez(buffer, days=snapshot[0], kwh=snapshot[1])
+    atomic_write(path, buffer.getvalue())
+
+
+def read_bins(path=BINS_FILE):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return data["days"], data["kwh"]
@@ -0,0 +1,85 @@
+import numpy as np
+from anomaly import DROPOUT_SECONDS, OFF_DRAW_SECONDS, AnomalyDetector
+from energy_frames import EnergySample
+
+
+def sample(when, l1, l2=0.0, timer_disabled=0, motion_active=False):
+    return EnergySample(when, l1, 0.0, 0.0, l2, 0.0, 0.0, False, motion_active, timer_disabled)
+
+
+def detector(relays=None):
+    relays = relays if relays is not None else {}
+    alerts = []
+    found = AnomalyDetector(relays.get)
+    found.alert_callback = alerts.append
+    return found, alerts
+
+
+def kinds(alerts):
+    return [(a.kind, a.circuit) for a in alerts]
+
+
+def test_steady_noise_raises_nothing():
+    found, alerts = detector()
+    for i in range(300):
+        found.feed(sample(i, 1.0 + 0.02 * (i % 3), 0.5))
+    assert alerts == []
+
+
+def test_step_is_reported_once_after_confirmation():
+    found, alerts = detector()
+    for i in range(60):
+        found.feed(sample(i, 1.0))
+    for i in range(60, 120):
+        found.feed(sample(i, 3.0))
+    assert kinds(alerts) == [("step", "L1")]
+    assert "+2.00 A" in alerts[0].message
+
+
+def test_single_spike_is_filtered():
+    found, alerts = detector()
+    for i in range(60):
+        found.feed(sample(i, 9.0 if i == 30 else 1.0))
+    assert alerts == []
+
+
+def test_current_with_every_relay_off_is_a_stuck_load():
+    off = dict.fromkeys(["living_light_1", "living_light_2", "living_plug_1", "living_plug_2"], "OFF")
+    found, alerts = detector(off)
+    for i in range(int(OFF_DRAW_SECONDS) + 5):
+        found.feed(sample(i, 0.4))
+    assert kinds(alerts) == [("off_draw", "L1")]
+
+
+def test_manual_override_or_motion_is_not_a_stuck_load():
+    off = dict.fromkeys(["living_light_1", "living_light_2", "living_plug_1", "living_plug_2"], "OFF")
+    for flags in ({"timer_disabled": 0b0001}, {"motion_active": True}):
+        found, alerts = detector(off)
+        for i in range(int(OFF_DRAW_SECONDS) + 5):
+            found.feed(sample(i, 0.4, **flags))
+        assert alerts == []
+
+
+def test_dropout_and_recovery():
+    found, alerts = detector()
+    found.feed(sample(100, 1.0))
+    found.check(100 + DROPOUT_SECONDS - 1)
+    assert alerts == []
+    found.check(100 + DROPOUT_SECONDS)
+    found.check(100 + DROPOUT_SECONDS + 5)   # Raised once
+    found.feed(sample(130, 1.0))
+    assert kinds(alerts) == [("dropout", None), ("recovered", None)]
+
+
+def test_short_surge_in_high_res_readings():
+    found, alerts = detector()
+    for i in range(30):
+        found.feed(sample(i, 1.0, 0.5))
+    peaks = np.full(10, 1.4)
+    readings = {"time": np.arange(10) * 0.1 + 30, "peak1": peaks.copy(), "peak2": peaks.copy()}
+    found.feed_highres(readings)
+    assert alerts == []
+    readings["peak2"][4] = 9.0
+    found.feed_highres(readings)
+    assert kinds(alerts) == [("surge", "L2")]
+    assert alerts[0].time == 30.4
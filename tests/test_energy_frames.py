@@ -0,0 +1,79 @@
+import struct
+import numpy as np
+import pytest
+from energy_frames import (BUF_HEADER, BUF_RECORD_DTYPE, HR_HEADER, HR_READING_DTYPE,
+                           EnergyDecoder, FrameError, decode_catchup_frame)
+
+FIRMWARE_FRAME = (b'{"L1":{"current":1.250000,"power":287.500000,"energy":12.345678},'
+                  b'"L2":{"current":0.400000,"power":92.000000,"energy":3.000000},'
+                  b'"motionEnabled":1,"motionActive":0,"timerDisabled":[1,0,0,1]}')
+
+
+def test_firmware_frame_takes_the_fast_path():
+    decoder = EnergyDecoder()
+    sample = decoder.decode(FIRMWARE_FRAME, received=10.0)
+    assert (sample.time, sample.l1_current, sample.l1_energy, sample.l2_power) == (10.0, 1.25, 12.345678, 92.0)
+    assert sample.motion_enabled and not sample.motion_active
+    assert sample.timer_disabled == 0b1001
+    assert (decoder.decoded, decoder.fast_path, decoder.errors) == (1, 1, 0)
+
+
+def test_other_layouts_fall_back_to_json():
+    decoder = EnergyDecoder()
+    payload = b'{"L2": {"energy": 3, "current": 0.4}, "L1": {"current": 1.25, "power": 287.5, "energy": 12.5}}'
+    sample = decoder.decode(payload, received=10.0)
+    assert (sample.l1_current, sample.l1_energy, sample.l2_energy, sample.l2_power) == (1.25, 12.5, 3.0, 0.0)
+    assert not sample.motion_enabled and sample.timer_disabled == 0
+    assert (decoder.decoded, decoder.fast_path) == (1, 0)
+
+
+def test_fast_and_json_paths_agree():
+    fast = EnergyDecoder().decode(FIRMWARE_FRAME, received=1.0)
+    slow = EnergyDecoder().decode_json(FIRMWARE_FRAME, received=1.0)
+    for name in fast.__slots__:
+        assert getattr(fast, name) == getattr(slow, name)
+
+
+@pytest.mark.parametrize("payload", [
+    b"", b"not json", b"[1, 2]", b'{"L1": {"current": 1}}',
+    b'{"L1": {"current": "1"}, "L2": {}}', b'{"L1": {"current": true}, "L2": {}}',
+    b'{"L1": [], "L2": {}}',
+])
+def test_malformed_frames_are_counted(payload):
+    decoder = EnergyDecoder()
+    with pytest.raises(FrameError):
+        decoder.decode(payload)
+    assert (decoder.decoded, decoder.errors) == (0, 1)
+    assert decoder.last_error
+
+
+def test_batch_frame():
+    readings = np.zeros(10, HR_READING_DTYPE)
+    readings["rms1"] = np.arange(10) * 100
+    readings["peak2"] = 2500
+    payload = HR_HEADER.pack(b"EH", 1, 10, 7, 100, 0) + readings.tobytes()
+    decoder = EnergyDecoder()
+    frame = decoder.decode_batch(payload, received=100.0)
+    assert len(frame) == 10 and frame.seq == 7
+    assert frame.rms1[3] == pytest.approx(0.3)
+    assert frame.peak2[0] == pytest.approx(2.5)
+    assert frame.timestamps()[-1] == 100.0
+    assert frame.timestamps()[0] == pytest.approx(99.1)
+    with pytest.raises(FrameError):
+        decoder.decode_batch(payload[:-1])
+    with pytest.raises(FrameError):
+        decoder.decode_batch(b"XX" + payload[2:])
+    assert decoder.errors == 2
+
+
+def test_catchup_frame_skips_unset_clock():
+    records = np.zeros(2, BUF_RECORD_DTYPE)
+    records[1] = (1700000000, 1500, 200, 123456, 7890)
+    frame = decode_catchup_frame(BUF_HEADER.pack(b"EB", 1, 2, 3, 60, 5) + records.tobytes())
+    assert (frame.seq, frame.interval_s, frame.dropped) == (3, 60, 5)
+    [sample] = frame.samples()
+    assert sample.time == 1700000000
+    assert sample.l1_current == 1.5
+    assert sample.l1_energy == pytest.approx(1.23456)
+    with pytest.raises(FrameError):
+        decode_catchup_frame(struct.pack("<2s", b"EB"))
@@ -0,0 +1,137 @@
+import datetime
+import threading
+import numpy as np
+import pytest
+from energy_history import (ApplianceReading, DAY_MISSING, DAY_MEASURED, DAY_PARTIAL,
+                            EnergyHistory, LEGACY_PREFIX, LOG_HEADER)
+
+DAY = datetime.date(2024, 1, 10)
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def history(*offsets):
+    result = EnergyHistory()
+    for offset in offsets:
+        result.set_day(DAY + offset * ONE_DAY, ApplianceReading(offset, 1.0, 2.0))
+    return result
+
+
+def test_log_round_trip_keeps_flags(tmp_path):
+    path = tmp_path / "energy_log.txt"
+    days = history(-1, 0)
+    days.set_day(DAY, ApplianceReading(0.5, 0.25, 0.125), DAY_PARTIAL)
+    days.save(path)
+    loaded = EnergyHistory()
+    loaded.load(path)
+    assert loaded.get(DAY).fan == 0.25
+    assert loaded.flag(DAY) == DAY_PARTIAL
+    assert loaded.flag(DAY - ONE_DAY) == DAY_MEASURED
+
+
+def test_pre_kwh_log_is_kept_but_not_read_as_kwh(tmp_path):
+    path = tmp_path / "energy_log.txt"
+    path.write_text("2024-01-09 light:0.300000 fan:0.200000 plug:0.100000 total:0.600000\n"
+                    "not a reading\n"
+                    "2024-01-10 light:1.500000 fan:0.500000 plug:1.000000 total:3.000000\n")
+    days = EnergyHistory()
+    days.load(path)
+    assert len(days) == 0
+    assert days.legacy_reading().light == 1.5
+
+    days.set_day(DAY, ApplianceReading(0.01, 0.02, 0.03))
+    days.save(path)
+    lines = path.read_text().splitlines()
+    assert lines[0] == LOG_HEADER
+    assert sum(line.startswith(LEGACY_PREFIX) for line in lines) == 2
+
+    reloaded = EnergyHistory()
+    reloaded.load(path)
+    assert len(reloaded) == 1
+    assert reloaded.get(DAY).light == 0.01
+    assert reloaded.legacy_reading().light == 1.5
+
+
+def test_malformed_lines_are_skipped(tmp_path):
+    path = tmp_path / "energy_log.txt"
+    path.write_text(LOG_HEADER + "\n"
+                    "2024-01-10 light:oops fan:0.1 plug:0.1 total:0.3\n"
+                    "2024-13-40 light:0.1 fan:0.1 plug:0.1 total:0.3\n"
+                    "2024-01-11 light:0.1\n"
+                    "2024-01-12 light:0.100000 fan:0.200000 plug:0.300000 total:0.600000\n")
+    days = EnergyHistory()
+    days.load(path)
+    assert [d for d in range(10, 13) if days.get(datetime.date(2024, 1, d))] == [12]
+
+
+def test_window_marks_missing_days():
+    data, flags = history(-2, 0).window_matrix(3, today=DAY)
+    assert list(flags) == [DAY_MEASURED, DAY_MISSING, DAY_MEASURED]
+    assert list(data[0]) == [-2.0, 0.0, 0.0]
+    data, _ = history(-2, 0).window_matrix(3, today=DAY, missing=np.nan)
+    assert np.isnan(data[1, 1])
+
+
+def test_window_before_and_after_the_history():
+    data, flags = history(0).window_matrix(2, today=DAY + 5 * ONE_DAY)
+    assert list(flags) == [DAY_MISSING, DAY_MISSING]
+    data, flags = EnergyHistory().window_matrix(2, today=DAY)
+    assert list(flags) == [DAY_MISSING, DAY_MISSING]
+
+
+def test_day_inside_the_cached_span_is_patched():
+    days = history(-2, 0)
+    days.window_matrix(3, today=DAY)
+    days.set_day(DAY - ONE_DAY, ApplianceReading(7.0, 0.0, 0.0), DAY_PARTIAL)
+    data, flags = days.window_matrix(3, today=DAY)
+    assert data[0, 1] == 7.0
+    assert flags[1] == DAY_PARTIAL
+
+
+@pytest.mark.parametrize("offset", [1, -5])
+def test_day_outside_the_cached_span_is_not_lost(offset):
+    days = history(-2, 0)
+    days.window_matrix(3, today=DAY)
+    days.set_day(DAY + offset * ONE_DAY, ApplianceReading(9.0, 0.0, 0.0))
+    data, flags = days.window_matrix(10, today=DAY + ONE_DAY)
+    index = 9 + offset - 1
+    assert data[0, index] == 9.0
+    assert flags[index] == DAY_MEASURED
+
+
+def test_windows_read_while_days_are_added():
+    days = history(0)
+    errors = []
+
+    def writer():
+        for offset in range(1, 400):
+            days.set_day(DAY + offset * ONE_DAY, ApplianceReading(offset, 0.0, 0.0))
+
+    def reader():
+        try:
+            for _ in range(400):
+                data, flags = days.window_matrix(30, today=DAY + 400 * ONE_DAY)
+                assert data.shape == (3, 30) and flags.shape == (30,)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert days.window_matrix(1, today=DAY + 399 * ONE_DAY)[0][0, 0] == 399.0
+
+
+def test_interrupted_save_keeps_the_previous_log(tmp_path, monkeypatch):
+    path = tmp_path / "energy_log.txt"
+    history(0).save(path)
+    before = path.read_text()
+
+    def killed(*args):
+        raise OSError("killed mid-write")
+
+    monkeypatch.setattr("os.replace", killed)
+    with pytest.raises(OSError):
+        history(0, 1).save(path)
+    assert path.read_text() == before
@@ -0,0 +1,116 @@
+import datetime
+import json
+import math
+import urllib.error
+import urllib.request
+import numpy as np
+import pytest
+from energy_history import ApplianceReading, EnergyHistory
+from energy_query import EnergyQuery, QueryError, RingSeries, aggregate, start_query_server, to_timestamp
+from tariff import TariffEngine
+
+UTC = datetime.timezone.utc
+DAY = datetime.date(2024, 1, 10)
+MIDNIGHT = datetime.datetime(2024, 1, 10, tzinfo=UTC).timestamp()
+
+
+def test_ring_spreads_an_interval_across_slots():
+    ring = RingSeries(60, 10)
+    ring.add(30, 150, ApplianceReading(1.2, 0.0, 0.0))
+    assert ring.read(0, 4)[0] == pytest.approx([0.3, 0.6, 0.3, np.nan], nan_ok=True)
+
+
+def test_ring_forgets_slots_older_than_its_capacity():
+    ring = RingSeries(1, 5)
+    ring.add(0, 1, ApplianceReading(1.0, 0.0, 0.0))
+    ring.add(9, 10, ApplianceReading(2.0, 0.0, 0.0))
+    values = ring.read(0, 10)[0]
+    assert np.isnan(values[:5]).all()
+    assert list(values[5:]) == [0.0, 0.0, 0.0, 0.0, 2.0]   # Skipped slots are zero
+
+
+def test_ring_zero_length_interval_lands_in_one_slot():
+    ring = RingSeries(1, 5)
+    ring.add(3.5, 3.5, ApplianceReading(0.0, 0.5, 0.0))
+    assert ring.read(3, 1)[1, 0] == 0.5
+
+
+def test_aggregates_ignore_empty_slots():
+    values = np.array([1.0, np.nan, 3.0, 2.0])
+    assert aggregate(values, "sum") == 6.0
+    assert aggregate(values, "max") == 3.0
+    assert aggregate(values, "p50") == 2.0
+    assert aggregate(np.array([np.nan]), "mean") is None
+    for name in ("median", "p101", "pxx"):
+        with pytest.raises(QueryError):
+            aggregate(values, name)
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-1", "1e300", math.nan, "tomorrow",
+                                   datetime.datetime(1, 1, 1, tzinfo=UTC)])
+def test_bad_times_are_query_errors(value):
+    with pytest.raises(QueryError):
+        to_timestamp(value, UTC)
+
+
+def test_times_parse_in_the_query_zone():
+    assert to_timestamp("2024-01-10", UTC) == MIDNIGHT
+    assert to_timestamp(DAY, UTC) == MIDNIGHT
+    assert to_timestamp(str(MIDNIGHT)) == MIDNIGHT
+
+
+def engine():
+    history = EnergyHistory()
+    history.set_day(DAY - datetime.timedelta(days=2), ApplianceReading(1.0, 2.0, 3.0))
+    history.set_day(DAY, ApplianceReading(0.5, 0.5, 0.5))
+    tariff = TariffEngine(zone=UTC)
+    tariff.add(MIDNIGHT + 3600, MIDNIGHT + 7200, ApplianceReading(1.0, 0.0, 1.0))
+    query = EnergyQuery(history, tariff.bins, UTC)
+    query.add(MIDNIGHT, MIDNIGHT + 120, ApplianceReading(0.2, 0.0, 0.0))
+    return query
+
+
+def test_day_resolution_reads_the_history():
+    result = engine().query("2024-01-08", "2024-01-11", "day", ["total", "L1"])
+    assert result["times"] == ["2024-01-08", "2024-01-09", "2024-01-10"]
+    assert result["series"]["total"] == [6.0, None, 1.5]
+    assert result["series"]["L1"] == [4.0, None, 1.0]
+
+
+def test_hour_resolution_reads_the_tariff_bins():
+    result = engine().query(MIDNIGHT, MIDNIGHT + 3 * 3600, "hour", ["light"])
+    assert result["times"][1] == "2024-01-10T01:00:00"
+    assert result["series"]["light"] == pytest.approx([0.0, 1.0, 0.0])
+
+
+def test_minute_resolution_and_power_unit():
+    result = engine().query(MIDNIGHT, MIDNIGHT + 180, "minute", ["light"], unit="w")
+    assert result["series"]["light"][:2] == pytest.approx([6000.0, 6000.0])   # 0.1 kWh per minute
+    assert result["series"]["light"][2] is None
+    assert engine().query(MIDNIGHT, MIDNIGHT + 180, "minute", ["light"], agg="sum")["series"]["light"] == \
+        pytest.approx(0.2)
+
+
+@pytest.mark.parametrize("args", [
+    ("2024-01-10", "2024-01-09", "day"),
+    ("2024-01-10", "2024-01-11", "week"),
+    (MIDNIGHT, MIDNIGHT + 200000, "second"),   # More than MAX_SLOTS
+    ("1970-01-01", "9999-12-31", "hour"),
+])
+def test_bad_queries_are_rejected(args):
+    with pytest.raises(QueryError):
+        engine().query(*args)
+
+
+def test_http_status_codes():
+    server = start_query_server(engine(), port=0)
+    base = f"http://127.0.0.1:{server.server_address[1]}/query"
+    try:
+        with urllib.request.urlopen(base + "?start=2024-01-10&end=2024-01-11&resolution=day") as response:
+            assert json.load(response)["series"]["total"] == [1.5]
+        for query in ("?start=nan&end=1", "?start=2024-01-10", "?start=0&end=1e18&resolution=day"):
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(base + query)
+            assert error.value.code == 400
+    finally:
+        server.shutdown()
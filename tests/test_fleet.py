@@ -0,0 +1,123 @@
+import datetime
+import queue
+import threading
+import numpy as np
+import pytest
+import fleet
+from fleet import FleetCollector, ShardStore, day_files, load_day, rollup, shard_of
+from rollover import DayClock
+
+UTC = datetime.timezone.utc
+NOON = datetime.datetime(2024, 1, 1, 12, tzinfo=UTC).timestamp()
+
+
+def frame(l1_energy, l2_energy=0.0, power=100.0):
+    return (f'{{"L1":{{"current":0.5,"power":{power:.1f},"energy":{l1_energy:.6f}}},'
+            f'"L2":{{"current":0.1,"power":{power:.1f},"energy":{l2_energy:.6f}}},'
+            f'"motionEnabled":0,"motionActive":0,"timerDisabled":[0,0,0,0]}}').encode()
+
+
+def store():
+    return ShardStore(DayClock("00:00", UTC))
+
+
+def totals(shard):
+    return {row["home"]: row for row in shard.table()}
+
+
+def test_counter_deltas_and_reboots():
+    shard = store()
+    shard.add("a", NOON, frame(1.0))
+    shard.add("a", NOON + 1, frame(1.5))
+    shard.add("a", NOON + 2, frame(0.25))   # Rebooted
+    shard.add("a", NOON + 3, b"garbage")
+    row = totals(shard)["a"]
+    assert row["l1_kwh"] == pytest.approx(0.75)
+    assert row["resets"] == 1
+    assert row["frames"] == 3
+    assert row["errors"] == 1
+    assert row["l1_peak_w"] == 100.0
+
+
+def test_older_frame_is_not_a_reboot():
+    shard = store()
+    shard.add("a", NOON, frame(1.0))
+    shard.add("a", NOON + 2, frame(1.2))
+    shard.add("a", NOON + 1, frame(1.1))   # Arrived late
+    shard.add("a", NOON + 3, frame(1.3))
+    row = totals(shard)["a"]
+    assert row["l1_kwh"] == pytest.approx(0.3)
+    assert row["resets"] == 0
+
+
+def test_gap_is_backfilled_and_counted():
+    shard = store()
+    shard.add("a", NOON, frame(1.0))
+    shard.add("a", NOON + 600, frame(2.0))
+    row = totals(shard)["a"]
+    assert row["gaps"] == 1
+    assert row["l1_kwh"] == pytest.approx(1.0)
+
+
+def test_day_roll_saves_and_keeps_counters(tmp_path):
+    shard = store()
+    closed = []
+    shard.on_day_closed = lambda s: closed.append(totals(s)["a"]["l1_kwh"])
+    shard.add("a", NOON, frame(1.0))
+    shard.add("a", NOON + 3600, frame(2.0))
+    shard.add("a", NOON + 86400, frame(2.5))
+    assert closed == [pytest.approx(1.0)]
+    assert totals(shard)["a"]["l1_kwh"] == pytest.approx(0.5)
+
+
+def test_restart_with_another_worker_count(tmp_path):
+    homes = [f"home{i}" for i in range(20)]
+    old = [store() for _ in range(2)]
+    for home in homes:
+        shard = old[shard_of(home, 2)]
+        shard.add(home, NOON, frame(1.0))
+        shard.add(home, NOON + 1, frame(2.0))
+    day = old[0].day
+    for i, shard in enumerate(old):
+        shard.save(str(tmp_path), i, 2)
+    sources = day_files(day.isoformat(), str(tmp_path))
+    assert len(sources) == 2
+
+    for i in range(3):
+        shard = store()
+        for path in sources:
+            table = np.load(path)
+            mine = np.array([shard_of(str(h), 3) == i for h in table["home"]], dtype=bool)
+            shard.restore(table[mine], day)
+        shard.save(str(tmp_path), i, 3)
+    table = load_day(day.isoformat(), str(tmp_path))
+    assert rollup(table)["homes"] == 20
+    assert rollup(table)["l1_kwh"] == pytest.approx(20.0)
+
+
+def test_dispatch_keeps_each_homes_frames_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(fleet, "BATCH_SIZE", 3)
+    collector = FleetCollector(workers=1, directory=str(tmp_path))
+    collector.queues = [queue.Queue(1)]   # Backpressure on every put
+    received = []
+    done = threading.Event()
+
+    def consumer():
+        for batch in iter(collector.queues[0].get, None):
+            received.extend(t for _, t, _ in batch)
+
+    def flusher():
+        while not done.is_set():
+            collector.flush()
+
+    threads = [threading.Thread(target=consumer), threading.Thread(target=flusher)]
+    for thread in threads:
+        thread.start()
+    for i in range(3000):
+        collector.dispatch("a", b"", NOON + i)
+    done.set()
+    threads[1].join()
+    collector.flush()
+    collector.queues[0].put(None)
+    threads[0].join()
+    assert received == [NOON + i for i in range(3000)]
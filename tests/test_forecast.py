@@ -0,0 +1,65 @@
+import datetime
+import numpy as np
+import pytest
+from energy_history import ApplianceReading
+from forecast import ConsumptionForecast, period_end
+from tariff import BINS_PER_DAY, Tariff, TariffEngine
+
+UTC = datetime.timezone.utc
+FLAT = {"tiers": [{"rate": 2.0}]}
+
+
+def at(day, hour=0, minute=0):
+    return datetime.datetime.combine(day, datetime.time(hour, minute), UTC).timestamp()
+
+
+def test_projection_before_anything_is_learned_extrapolates_today():
+    forecast = ConsumptionForecast(UTC)
+    engine = TariffEngine(Tariff(FLAT), UTC)
+    day = datetime.date(2024, 1, 10)
+    for hour in range(6):   # 0.5 kWh of light per hour so far
+        forecast.add(at(day, hour), at(day, hour + 1), ApplianceReading(0.5, 0.0, 0.0))
+    projection = forecast.project(at(day, 6), engine)
+    # 0.5 kWh/h for 18 more hours, less the 0.5 already booked at 06:00
+    assert projection.today_kwh[0] == pytest.approx(3.0 + 8.5)
+    assert projection.today_cost == pytest.approx(8.5 * 2.0)
+
+
+def test_seeded_profile_predicts_the_rest_of_the_day():
+    forecast = ConsumptionForecast(UTC)
+    engine = TariffEngine(Tariff(FLAT), UTC)
+    today = datetime.date(2024, 1, 10)
+    bins = {}
+    for weeks in range(1, 4):   # Same weekday: 1 kWh of fan in each evening hour
+        day = today - datetime.timedelta(weeks=weeks)
+        bins[day] = np.zeros((3, BINS_PER_DAY))
+        bins[day][1, 18 * 4:22 * 4] = 0.25
+    forecast.seed(bins, BINS_PER_DAY // 24, at(today, 12))
+    forecast.add(at(today, 11, 59), at(today, 12), ApplianceReading(0.0, 0.0, 0.1))
+    projection = forecast.project(at(today, 12), engine)
+    assert projection.today_kwh == pytest.approx([0.0, 4.0, 0.1])
+
+
+def test_incomplete_hours_are_not_learned():
+    forecast = ConsumptionForecast(UTC)
+    day = datetime.date(2024, 1, 10)
+    forecast.add(at(day, 9, 30), at(day, 9, 31), ApplianceReading(1.0, 0.0, 0.0))   # Started mid-hour
+    forecast.add(at(day, 10), at(day, 10, 1), ApplianceReading(1.0, 0.0, 0.0))
+    assert not forecast.learned
+    forecast.add(at(day, 10, 30), at(day, 10, 31), ApplianceReading(1.0, 0.0, 0.0))
+    forecast.add(at(day, 11), at(day, 11, 1), ApplianceReading(1.0, 0.0, 0.0))
+    assert forecast.counts[day.weekday(), 10] == 1
+    assert forecast.profile[0, day.weekday(), 10] == pytest.approx(2.0)
+
+
+def test_no_projection_for_another_day():
+    forecast = ConsumptionForecast(UTC)
+    day = datetime.date(2024, 1, 10)
+    forecast.add(at(day, 9), at(day, 10), ApplianceReading(1.0, 0.0, 0.0))
+    assert forecast.project(at(day + datetime.timedelta(days=1), 1), TariffEngine(zone=UTC)) is None
+
+
+def test_period_end_wraps_the_year():
+    tariff = Tariff({"billing_day": 5, "tiers": [{"rate": 1}]})
+    assert period_end(tariff, datetime.date(2024, 12, 20)) == datetime.date(2025, 1, 5)
+    assert period_end(tariff, datetime.date(2024, 12, 2)) == datetime.date(2024, 12, 5)
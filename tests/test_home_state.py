@@ -0,0 +1,93 @@
+import json
+from home_state import (HomeState, StateReplica, decode,
+                        STATE_DELTA_TOPIC, STATE_SNAPSHOT_TOPIC)
+
+
+class Bus:
+    """HomeState's publish(), recording what went out"""
+    def __init__(self):
+        self.deltas = []
+        self.snapshot = None
+
+    def __call__(self, topic, payload, retain=False):
+        document = decode(payload)
+        if topic == STATE_DELTA_TOPIC:
+            self.deltas.append(document)
+        elif topic == STATE_SNAPSHOT_TOPIC:
+            assert retain
+            self.snapshot = document
+
+
+def replica():
+    resyncs = []
+    return StateReplica(lambda: resyncs.append(True)), resyncs
+
+
+def delta(epoch, rev, **changes):
+    return {"epoch": epoch, "rev": rev, "changes": changes}
+
+
+def test_replica_follows_the_service():
+    bus = Bus()
+    service = HomeState(bus)
+    service.update({"living_light_1": "ON"})
+    copy, resyncs = replica()
+    assert copy.handle_snapshot(bus.snapshot) == {"living_light_1": "ON"}
+    service.update({"living_plug_1": "ON"})
+    service.update({"living_plug_1": "ON"})   # No change, no delta
+    assert len(bus.deltas) == 2
+    assert copy.handle_delta(bus.deltas[0]) == {}   # Already in the snapshot
+    assert copy.handle_delta(bus.deltas[1]) == {"living_plug_1": "ON"}
+    assert copy.snapshot() == service.states
+    assert not resyncs
+
+
+def test_gap_in_revisions_resyncs():
+    copy, resyncs = replica()
+    copy.handle_snapshot({"epoch": "a", "rev": 1, "states": {"x": "OFF"}})
+    assert copy.handle_delta(delta("a", 3, x="ON")) == {}
+    assert resyncs == [True]
+    # The snapshot is older than the held delta, which then applies on top
+    assert copy.handle_snapshot({"epoch": "a", "rev": 2, "states": {"x": "OFF", "y": "ON"}}) == \
+        {"y": "ON", "x": "ON"}
+    assert copy.rev == 3
+
+
+def test_new_epoch_resyncs():
+    copy, resyncs = replica()
+    copy.handle_snapshot({"epoch": "a", "rev": 5, "states": {"x": "ON"}})
+    assert copy.handle_delta(delta("b", 1, x="OFF")) == {}
+    assert resyncs == [True]
+    assert copy.handle_snapshot({"epoch": "b", "rev": 1, "states": {"x": "OFF"}}) == {"x": "OFF"}
+    assert copy.epoch == "b"
+
+
+def test_deltas_before_the_first_snapshot_are_held_in_order():
+    copy, resyncs = replica()
+    assert copy.handle_delta(delta("a", 4, x="ON")) == {}
+    assert copy.handle_delta(delta("a", 3, x="OFF")) == {}
+    assert copy.handle_snapshot({"epoch": "a", "rev": 2, "states": {}}) == {"x": "ON"}
+    assert copy.rev == 4
+    assert not resyncs
+
+
+def test_stale_snapshot_is_ignored_once_synced():
+    copy, _ = replica()
+    copy.handle_snapshot({"epoch": "a", "rev": 3, "states": {"x": "ON"}})
+    assert copy.handle_snapshot({"epoch": "a", "rev": 2, "states": {"x": "OFF"}}) == {}
+    assert copy.snapshot() == {"x": "ON"}
+
+
+def test_reset_waits_for_a_new_snapshot():
+    copy, _ = replica()
+    copy.handle_snapshot({"epoch": "a", "rev": 1, "states": {"x": "ON"}})
+    copy.reset()
+    assert copy.handle_delta(delta("a", 2, x="OFF")) == {}
+    assert copy.snapshot() == {"x": "ON"}   # Kept for display meanwhile
+    assert copy.handle_snapshot({"epoch": "a", "rev": 1, "states": {"x": "ON"}}) == {"x": "OFF"}
+
+
+def test_malformed_documents_decode_to_none():
+    for payload in (b"", b"[]", b"{}", json.dumps({"epoch": 1, "rev": 1}),
+                    json.dumps({"epoch": "a", "rev": "1"}), b"\xff"):
+        assert decode(payload) is None
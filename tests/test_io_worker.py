@@ -0,0 +1,79 @@
+import threading
+import time
+import pytest
+from PySide6.QtCore import QCoreApplication
+from io_worker import IOWorker
+
+
+@pytest.fixture
+def worker():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    worker = IOWorker(maxsize=4)
+    results = []
+    worker.done.connect(lambda key, value: results.append((key, value)))
+    worker.failed.connect(lambda key, error: results.append((key, "failed: " + error)))
+    worker.results = results
+
+    def deliver(count):
+        """Run the event loop until `count` results arrived"""
+        deadline = time.monotonic() + 5
+        while len(results) < count and time.monotonic() < deadline:
+            app.processEvents()
+            time.sleep(0.001)
+        return results
+
+    worker.deliver = deliver
+    yield worker
+    worker.stop()
+
+
+def blocked(worker):
+    """Park the worker thread in a job until the returned event is set"""
+    started, release = threading.Event(), threading.Event()
+    worker.submit("gate", lambda: (started.set(), release.wait()) and None)
+    started.wait(5)
+    return release
+
+
+def test_results_come_back_in_order(worker):
+    for i in range(3):
+        worker.submit("job", lambda i=i: i * 10)
+    assert worker.deliver(3) == [("job", 0), ("job", 10), ("job", 20)]
+
+
+def test_coalesced_job_keeps_its_place_and_runs_the_latest(worker):
+    release = blocked(worker)
+    worker.submit("save", lambda: "first", coalesce=True)
+    worker.submit("other", lambda: "other")
+    worker.submit("save", lambda: "latest", coalesce=True)
+    release.set()
+    assert worker.deliver(3) == [("gate", None), ("save", "latest"), ("other", "other")]
+
+
+def test_full_queue_drops_new_jobs(worker):
+    release = blocked(worker)
+    try:
+        accepted = [worker.submit("job", lambda i=i: i) for i in range(6)]
+        assert accepted == [True] * 4 + [False] * 2
+        assert not worker.submit("save", lambda: None, coalesce=True)
+    finally:
+        release.set()
+    assert [value for _, value in worker.deliver(5)] == [None, 0, 1, 2, 3]
+
+
+def test_failures_are_reported_and_the_worker_keeps_going(worker):
+    worker.submit("bad", lambda: 1 / 0)
+    worker.submit("good", lambda: "ok")
+    results = worker.deliver(2)
+    assert results[0][0] == "bad" and results[0][1].startswith("failed:")
+    assert results[1] == ("good", "ok")
+
+
+def test_stop_runs_what_was_queued(worker):
+    release = blocked(worker)
+    ran = []
+    worker.submit("job", lambda: ran.append(1))
+    release.set()
+    worker.stop()
+    assert ran == [1]
+    assert not worker.submit("job", lambda: None)
@@ -0,0 +1,48 @@
+from motion import MotionPipeline
+
+
+def pipeline(**kwargs):
+    switched = []
+    motion = MotionPipeline(lambda appliance_id, state: switched.append((appliance_id, state)),
+                            timeout=60, max_timeout=600, **kwargs)
+    return motion, switched
+
+
+def test_motion_switches_on_and_vacancy_switches_off():
+    motion, switched = pipeline()
+    motion.handle_event("Living Room", {"motion": 1}, received=100.0)
+    state = motion.rooms["Living Room"]
+    motion.room_vacated(state, state.vacancy_timer)
+    motion.stop()
+    assert switched == [("living_light_1", "ON"), ("living_light_1", "OFF")]
+    assert not motion.is_occupied("Living Room")
+
+
+def test_stale_timer_does_not_vacate_after_new_motion():
+    motion, switched = pipeline()
+    motion.handle_event("Living Room", {"motion": 1}, received=100.0)
+    state = motion.rooms["Living Room"]
+    fired = state.vacancy_timer
+    motion.handle_event("Living Room", {"motion": 1}, received=160.0)   # Just as `fired` runs
+    motion.room_vacated(state, fired)
+    motion.stop()
+    assert switched == [("living_light_1", "ON")]
+    assert motion.is_occupied("Living Room")
+
+
+def test_debounce_and_timeout_growth():
+    motion, _ = pipeline(debounce=0.5)
+    motion.handle_event("Living Room", {"motion": 1}, received=100.0)
+    motion.handle_event("Living Room", {"motion": 1}, received=100.2)
+    state = motion.rooms["Living Room"]
+    assert state.events == 1
+    assert motion.vacancy_timeout(state, 100.0 + 400) == 200
+    assert motion.vacancy_timeout(state, 100.0 + 5000) == 600
+    motion.stop()
+
+
+def test_disabled_lights_are_left_alone():
+    motion, switched = pipeline()
+    motion.set_appliances(set())
+    motion.handle_event("Living Room", {"motion": 1}, received=100.0)
+    assert switched == [] and not motion.is_occupied("Living Room")
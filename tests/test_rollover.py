@@ -0,0 +1,98 @@
+import datetime
+from zoneinfo import ZoneInfo
+import pytest
+from energy_frames import EnergySample
+from energy_history import DAY_BACKFILLED, DAY_PARTIAL
+from rollover import DayClock, RolloverEngine
+
+UTC = datetime.timezone.utc
+
+
+def at(year, month, day, hour=0, minute=0, second=0):
+    return datetime.datetime(year, month, day, hour, minute, second, tzinfo=UTC).timestamp()
+
+
+def sample(when, l1_energy, l2_energy=0.0):
+    return EnergySample(when, 0.0, 0.0, l1_energy, 0.0, 0.0, l2_energy)
+
+
+def engine():
+    return RolloverEngine(DayClock("00:00", UTC))
+
+
+def test_interval_across_midnight_is_split_by_time():
+    rollover = engine()
+    rollover.feed(sample(at(2024, 1, 1, 23, 59), 0.0))
+    closed = rollover.feed(sample(at(2024, 1, 2, 0, 1), 1.0))
+    assert [day for day, _ in closed] == [datetime.date(2024, 1, 1)]
+    assert closed[0][1].light == pytest.approx(0.3)   # Half of L1, 60% lights
+    assert closed[0][1].plug == pytest.approx(0.2)
+    day, totals = rollover.current()
+    assert day == datetime.date(2024, 1, 2)
+    assert totals.light == pytest.approx(0.3)
+
+
+def test_counter_restart_counts_the_new_value():
+    rollover = engine()
+    rollover.feed(sample(at(2024, 1, 1, 12), 5.0, 2.0))
+    rollover.feed(sample(at(2024, 1, 1, 12, 0, 1), 0.5, 0.25))
+    _, totals = rollover.current()
+    assert totals.total == pytest.approx(0.75)
+
+
+def test_record_that_does_not_advance_time_is_still_booked():
+    rollover = engine()
+    booked = []
+    rollover.energy_callback = lambda start, end, reading: booked.append((start, end, reading.total))
+    start = at(2024, 1, 1, 12)
+    rollover.feed(sample(start, 1.0))
+    rollover.feed(sample(start + 10, 2.0))
+    rollover.feed(sample(start + 5, 2.011))   # Catch-up record stamped earlier
+    _, totals = rollover.current()
+    assert totals.total == pytest.approx(1.011)
+    assert booked[-1][:2] == (start + 10, start + 10)
+    assert booked[-1][2] == pytest.approx(0.011)
+    assert rollover.last_time == start + 10
+
+
+def test_gap_flags_days_backfilled_or_partial():
+    rollover = engine()
+    rollover.feed(sample(at(2024, 1, 1, 22), 1.0))
+    rollover.feed(sample(at(2024, 1, 2, 2), 3.0))
+    assert rollover.flags[datetime.date(2024, 1, 1)] == DAY_BACKFILLED
+    rollover.feed(sample(at(2024, 1, 2, 8), 0.5))   # Restarted during the silence
+    assert rollover.flags[datetime.date(2024, 1, 2)] == DAY_PARTIAL
+
+
+def test_day_boundary_follows_dst():
+    clock = DayClock("00:00", ZoneInfo("Europe/Berlin"))
+    spring = clock.day_end(datetime.date(2024, 3, 31)) - clock.day_end(datetime.date(2024, 3, 30))
+    autumn = clock.day_end(datetime.date(2024, 10, 27)) - clock.day_end(datetime.date(2024, 10, 26))
+    assert spring == 23 * 3600
+    assert autumn == 25 * 3600
+
+
+def test_late_boundary_keeps_early_hours_on_the_previous_day():
+    clock = DayClock("04:00", UTC)
+    assert clock.day_of(at(2024, 1, 2, 3, 59)) == datetime.date(2024, 1, 1)
+    assert clock.day_of(at(2024, 1, 2, 4)) == datetime.date(2024, 1, 2)
+
+
+@pytest.mark.parametrize("state", [
+    None, [], {"version": 2, "time": 1.0, "l1_energy": 1.0, "l2_energy": 1.0},
+    {"version": 1, "time": "soon", "l1_energy": 1.0, "l2_energy": 1.0},
+    {"version": 1, "time": 1.0, "l1_energy": None, "l2_energy": 1.0},
+])
+def test_malformed_state_is_ignored(state):
+    rollover = engine()
+    rollover.load_state(state)
+    assert rollover.state()["time"] is None
+
+
+def test_saved_state_reconciles_the_first_frame():
+    first = engine()
+    first.feed(sample(at(2024, 1, 1, 12), 1.0))
+    second = engine()
+    second.load_state(first.state())
+    second.feed(sample(at(2024, 1, 1, 12, 1), 1.5))
+    assert second.current()[1].total == pytest.approx(0.5)
@@ -0,0 +1,54 @@
+import pytest
+from scheduler import MAX_DURATION, ScheduleRule, format_hhmm, parse_hhmm
+
+
+def states(rule):
+    return list(zip(map(format_hhmm, rule.minutes), rule.states))
+
+
+def test_base_interval_across_midnight():
+    rule = ScheduleRule({"on_time": "22:00", "off_time": "06:00"})
+    assert states(rule) == [("06:00", "OFF"), ("22:00", "ON")]
+    assert rule.initial_state == "ON"
+    assert rule.state_at(parse_hhmm("03:00")) == "ON"
+    assert rule.state_at(parse_hhmm("12:00")) == "OFF"
+    assert rule.next_transition(parse_hhmm("23:00")) == (parse_hhmm("06:00"), "OFF", 420)
+
+
+def test_duration_replaces_off_time():
+    rule = ScheduleRule({"on_time": "18:00", "off_time": "22:00", "duration_minutes": 30})
+    assert states(rule) == [("18:00", "ON"), ("18:30", "OFF")]
+
+
+@pytest.mark.parametrize("duration", [1440, 2000])
+def test_day_long_duration_still_switches(duration):
+    rule = ScheduleRule({"on_time": "18:00", "duration_minutes": duration})
+    assert rule.duration_minutes == MAX_DURATION
+    assert states(rule) == [("17:59", "OFF"), ("18:00", "ON")]
+
+
+def test_sleep_window_holds_off_and_resumes():
+    rule = ScheduleRule({"on_time": "18:00", "off_time": "02:00",
+                         "sleep_enabled": True, "sleep_start": "23:00", "sleep_end": "01:00"})
+    assert states(rule) == [("01:00", "ON"), ("02:00", "OFF"), ("18:00", "ON"), ("23:00", "OFF")]
+
+
+def test_power_saving_stays_off_after_sleep():
+    rule = ScheduleRule({"on_time": "18:00", "off_time": "02:00", "power_saving": True,
+                         "sleep_enabled": True, "sleep_start": "23:00", "sleep_end": "01:00"})
+    assert states(rule) == [("18:00", "ON"), ("23:00", "OFF")]
+
+
+def test_sleep_length_when_start_equals_end():
+    rule = ScheduleRule({"on_time": "00:00", "off_time": "23:59", "sleep_enabled": True,
+                         "sleep_start": "12:00", "sleep_end": "12:00", "sleep_duration": 90})
+    assert states(rule) == [("00:00", "ON"), ("12:00", "OFF"), ("13:30", "ON"), ("23:59", "OFF")]
+    full = ScheduleRule({"on_time": "00:00", "off_time": "23:59", "sleep_enabled": True,
+                         "sleep_start": "12:00", "sleep_end": "12:00", "sleep_duration": 1440})
+    assert full.sleep_end == parse_hhmm("11:59")
+
+
+def test_equal_on_and_off_never_switches():
+    rule = ScheduleRule({"on_time": "08:00", "off_time": "08:00"})
+    assert rule.next_transition(0) is None
+    assert rule.state_at(600) == "OFF"
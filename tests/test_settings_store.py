@@ -0,0 +1,63 @@
+import json
+import os
+import pytest
+from settings_store import SCHEMA_VERSION, SettingsStore, atomic_write, migrate
+
+
+def test_atomic_write_replaces_the_file(tmp_path):
+    path = str(tmp_path / "settings.json")
+    atomic_write(path, b"one")
+    atomic_write(path, b"two")
+    assert open(path, "rb").read() == b"two"
+    assert os.listdir(tmp_path) == ["settings.json"]
+
+
+def test_failed_write_keeps_the_old_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "settings.json")
+    atomic_write(path, b"old")
+
+    def killed(*args):
+        raise OSError("killed before the rename")
+
+    monkeypatch.setattr(os, "replace", killed)
+    with pytest.raises(OSError):
+        atomic_write(path, b"new")
+    assert open(path, "rb").read() == b"old"
+
+
+def test_bare_mapping_is_migrated():
+    document = migrate({"living_light_1": {"enabled": True}})
+    assert document == {"version": 1, "timers": {"living_light_1": {"enabled": True}}}
+
+
+def test_newer_schema_is_refused():
+    with pytest.raises(ValueError):
+        migrate({"version": SCHEMA_VERSION + 1, "timers": {}})
+
+
+def test_burst_of_updates_is_one_write(tmp_path):
+    path = str(tmp_path / "settings.json")
+    store = SettingsStore(path, delay=0.2)
+    for minute in range(50):
+        store.set("living_light_1", {"on_minute": minute})
+    store.close()
+    assert store.writes == 1
+    with open(path) as f:
+        assert json.load(f) == {"version": SCHEMA_VERSION, "timers": {"living_light_1": {"on_minute": 49}}}
+
+
+def test_load_serves_from_memory_and_reads_version_zero(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text(json.dumps({"living_plug_1": {"enabled": False}}))
+    store = SettingsStore(str(path), delay=60)
+    assert store.load() == {"living_plug_1": {"enabled": False}}
+    settings = {"enabled": True}
+    store.set("living_plug_1", settings)
+    settings["enabled"] = False   # The store keeps its own copy
+    assert store.get("living_plug_1") == {"enabled": True}
+    assert store.writes == 0
+    store.flush()
+    assert store.writes == 1
+    store.close()
+    assert store.writes == 1   # Nothing left pending
+    assert json.loads(path.read_text())["version"] == SCHEMA_VERSION
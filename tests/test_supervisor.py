@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import pytest
+import supervisor
+from supervisor import Heartbeat, Supervisor, load_snapshot, save_snapshot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Stand-in panel: waits for "go", then beats `beats` times (forever if < 0) and sleeps
+CHILD = """
+import sys, time
+sys.path.insert(0, {root!r})
+from supervisor import Heartbeat
+if sys.stdin.readline().strip() != "go":
+    sys.exit(0)
+heartbeat = Heartbeat.from_env()
+beats = int(sys.argv[1])
+while beats:
+    heartbeat.beat()
+    beats -= 1
+    time.sleep(0.02)
+time.sleep(60)
+"""
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def panel(tmp_path, monkeypatch):
+    """Supervisor whose children run CHILD; set .beats per launch"""
+    sup = Supervisor(stall=0.3, startup=5, directory=str(tmp_path), warm=False)
+    sup.beats = [-1]
+
+    def spawn():
+        env = dict(os.environ, **{supervisor.HEARTBEAT_ENV: sup.heartbeat_path,
+                                  supervisor.SNAPSHOT_ENV: sup.snapshot_path})
+        beats = sup.beats.pop(0) if len(sup.beats) > 1 else sup.beats[0]
+        return subprocess.Popen([sys.executable, "-c", CHILD.format(root=ROOT), str(beats)],
+                                stdin=subprocess.PIPE, env=env)
+
+    monkeypatch.setattr(sup, "spawn", spawn)
+    yield sup
+    sup.stop()
+
+
+def run_until(sup, predicate, timeout=10):
+    sup.launch()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not predicate():
+        sup.check()
+        time.sleep(supervisor.POLL_INTERVAL / 4)
+    return predicate()
+
+
+def test_stalled_panel_is_replaced(panel):
+    panel.beats = [5, -1]   # The first panel stops beating after 5 beats
+    recovered = []
+    panel.on_recovered = recovered.append
+    assert run_until(panel, lambda: recovered)
+    assert panel.restarts == 1
+    assert recovered[0] < 5
+
+
+def test_crashed_panel_is_replaced(panel):
+    recovered = []
+    panel.on_recovered = recovered.append
+    assert run_until(panel, lambda: panel.last_count > 0)
+    first = panel.child
+    first.kill()
+    assert wait_for(lambda: (panel.check(), recovered)[1])
+    assert panel.child is not first and panel.restarts == 1
+
+
+def test_clean_exit_ends_supervision(panel):
+    assert run_until(panel, lambda: panel.last_count > 0)
+    panel.child.kill()
+    panel.child.wait()
+    panel.child = subprocess.Popen([sys.executable, "-c", "pass"])
+    panel.child.wait()
+    assert panel.check() is False
+
+
+def test_heartbeat_counts_in_the_shared_file(tmp_path):
+    path = str(tmp_path / "beat")
+    watcher = supervisor.open_heartbeat(path)
+    beat = Heartbeat(path)
+    for _ in range(3):
+        beat.beat()
+    assert supervisor.BEAT.unpack_from(watcher)[0] == 3
+
+
+def test_snapshot_round_trip_and_staleness(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    save_snapshot(path, {"screen": 2})
+    assert load_snapshot(path)["screen"] == 2
+    assert load_snapshot(path, max_age=-1) is None
+    with open(path, "w") as f:
+        json.dump([1, 2], f)
+    assert load_snapshot(path) is None
+    assert load_snapshot(str(tmp_path / "missing.json")) is None
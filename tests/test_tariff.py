@@ -0,0 +1,95 @@
+import datetime
+from zoneinfo import ZoneInfo
+import numpy as np
+import pytest
+from energy_history import ApplianceReading
+from tariff import BINS_PER_DAY, Tariff, TariffEngine
+
+UTC = datetime.timezone.utc
+
+
+def at(year, month, day, hour=0, minute=0):
+    return datetime.datetime(year, month, day, hour, minute, tzinfo=UTC).timestamp()
+
+
+def test_slab_cost_crosses_tiers():
+    tariff = Tariff()
+    assert tariff.slab_cost(150) == pytest.approx(100 * 4.5 + 50 * 6.0)
+    assert tariff.slab_cost(400) == pytest.approx(100 * 4.5 + 200 * 6.0 + 100 * 7.5)
+    assert tariff.rate_at(350, 12 * 60) == 7.5
+
+
+def test_time_of_use_wraps_midnight():
+    tariff = Tariff()
+    assert tariff.minute_multipliers[19 * 60] == 1.2
+    assert tariff.minute_multipliers[23 * 60] == 0.9
+    assert tariff.minute_multipliers[3 * 60] == 0.9
+    assert tariff.minute_multipliers[12 * 60] == 1.0
+
+
+@pytest.mark.parametrize("config", [
+    {"currency": "$"},
+    {"tiers": []},
+    {"tiers": [{"upto": 100}]},
+    {"tiers": [{"upto": 100, "rate": "cheap"}]},
+    {"billing_day": 31, "tiers": [{"rate": 5}]},
+    {"billing_day": 0, "tiers": [{"rate": 5}]},
+    {"tiers": [{"rate": 5}], "time_of_use": [{"start": "noon", "end": "06:00", "multiplier": 2}]},
+])
+def test_malformed_config_raises(config):
+    # Screen2 falls back to the default tariff when this raises
+    with pytest.raises((KeyError, TypeError, ValueError)):
+        Tariff(config)
+
+
+def test_interval_is_split_across_bins():
+    engine = TariffEngine(zone=UTC)
+    engine.add(at(2024, 1, 1, 12, 10), at(2024, 1, 1, 12, 20), ApplianceReading(1.0, 0.0, 0.0))
+    bins = engine.bins[datetime.date(2024, 1, 1)]
+    assert bins[0, 48] == pytest.approx(0.5)
+    assert bins[0, 49] == pytest.approx(0.5)
+    assert engine.period_cost[0] == pytest.approx(4.5)
+
+
+def test_zero_length_interval_is_charged():
+    engine = TariffEngine(zone=UTC)
+    when = at(2024, 1, 1, 12)
+    engine.add(when, when, ApplianceReading(0.0, 0.011, 0.0))
+    assert engine.bins[datetime.date(2024, 1, 1)][1, 48] == pytest.approx(0.011)
+    assert engine.period_kwh == pytest.approx(0.011)
+
+
+def test_bins_use_the_engine_zone():
+    engine = TariffEngine(zone=ZoneInfo("Asia/Kolkata"))
+    # 18:30 UTC is midnight in India
+    engine.add(at(2024, 1, 1, 18, 30), at(2024, 1, 1, 18, 40), ApplianceReading(1.0, 0.0, 0.0))
+    assert list(engine.bins) == [datetime.date(2024, 1, 2)]
+    assert engine.bins[datetime.date(2024, 1, 2)][0, 0] == pytest.approx(1.0)
+
+
+def test_recompute_matches_running_totals():
+    engine = TariffEngine(zone=UTC)
+    rng = np.random.default_rng(1)
+    when = at(2024, 1, 1)
+    for _ in range(400):   # Crosses the 100 and 300 kWh slabs and peak hours
+        step = 15 * 60 * int(rng.integers(1, 4))
+        engine.add(when, when + step, ApplianceReading(*rng.uniform(0, 0.5, 3)))
+        when += step
+    running = engine.period_cost.copy(), dict(engine.day_cost)
+    engine.recompute()
+    assert engine.period_cost == pytest.approx(running[0])
+    assert engine.day_cost == pytest.approx(running[1])
+
+
+def test_recompute_reprices_with_a_new_tariff():
+    engine = TariffEngine(zone=UTC)
+    engine.seed_day(datetime.date(2024, 1, 1), ApplianceReading(BINS_PER_DAY, 0.0, 0.0))
+    engine.recompute(Tariff({"tiers": [{"upto": None, "rate": 2.0}]}))
+    assert engine.period_cost[0] == pytest.approx(2.0 * BINS_PER_DAY)
+
+
+def test_billing_period_starts_on_the_billing_day():
+    tariff = Tariff({"billing_day": 15, "tiers": [{"rate": 5}]})
+    assert tariff.period_start(datetime.date(2024, 3, 20)) == datetime.date(2024, 3, 15)
+    assert tariff.period_start(datetime.date(2024, 3, 14)) == datetime.date(2024, 2, 15)
+    assert tariff.period_start(datetime.date(2024, 1, 2)) == datetime.date(2023, 12, 15)